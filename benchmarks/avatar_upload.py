@@ -0,0 +1,77 @@
+"""
+Measures the latency of GET /api/contacts/ while avatars are uploaded concurrently, to a local storage that
+takes TRANSFER seconds per upload like a network upload would.
+
+Run with: python -m benchmarks.avatar_upload
+"""
+import asyncio
+import io
+import tempfile
+import time
+from unittest.mock import patch
+
+from benchmarks.common import bench_user, create_client, report
+from src.services.avatars import AvatarService, LocalStorage
+
+DURATION = 5
+UPLOAD_CONCURRENCY = 4
+TRANSFER = 0.05
+AVATAR = b"\x89PNG\r\n\x1a\n" + b"\x00" * (1024 * 1024 - 8)
+
+
+class RemoteStorage(LocalStorage):
+
+    def save(self, key, file, content_type):
+        time.sleep(TRANSFER)
+        return super().save(key, file, content_type)
+
+
+async def blocking_upload(self: AvatarService, key: str, file) -> str:
+    # the former pipeline: the whole file in memory and the upload on the event loop
+    contents = await file.read()
+    return self.storage.save(key, io.BytesIO(contents), "image/png")
+
+
+async def run(name: str, service: AvatarService) -> None:
+    client, _, token = await create_client()
+    headers = {"Authorization": f"Bearer {token}"}
+    deadline = time.perf_counter() + DURATION
+    latencies = []
+    uploads = 0
+
+    async def upload():
+        nonlocal uploads
+        while time.perf_counter() < deadline:
+            response = await client.patch("/api/users/avatar", headers=headers,
+                                          files={"file": ("avatar.png", AVATAR, "image/png")})
+            assert response.status_code == 200, response.text
+            uploads += 1
+
+    async def read():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = await client.get("/api/contacts/", headers=headers)
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.text
+            await asyncio.sleep(0.01)
+
+    started = time.perf_counter()
+    with patch("src.routes.users.avatar_service", service):
+        await asyncio.gather(read(), *[upload() for _ in range(UPLOAD_CONCURRENCY)])
+    report(name, latencies, started)
+    print(f"{name}: {uploads / (time.perf_counter() - started):.1f} uploads/s")
+    await client.aclose()
+
+
+async def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        service = AvatarService(RemoteStorage(directory, "/static/avatars"), len(AVATAR), ("image/png",),
+                                max_workers=UPLOAD_CONCURRENCY)
+        with patch.object(AvatarService, "upload", blocking_upload):
+            await run("GET /api/contacts/ with uploads on the event loop", service)
+        await run("GET /api/contacts/ with uploads in the avatar threads", service)
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+
+from fastapi.routing import APIRoute
+from fastapi_limiter.depends import RateLimiter
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from main import app
+from src.database.db import EarlyReleaseSession, get_db, get_read_db
+from src.database.models import Base, User
+from src.services.auth import auth_service
+
+bench_user = {"username": "benchmark", "email": "benchmark@example.com", "password": "12345678"}
+
+
+def percentile(values: list, q: float) -> float:
+
+    """
+    The percentile function returns the q-th percentile of the values using the nearest-rank method.
+
+    :param values: list: The measured values
+    :param q: float: The percentile between 0 and 100
+    :return: The percentile value
+    :doc-author: Trelent
+    """
+
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def report(name: str, latencies: list, started: float) -> None:
+    elapsed = time.perf_counter() - started
+    print(f"{name}: {len(latencies)} requests, {len(latencies) / elapsed:.1f} req/s, "
+          f"p50={percentile(latencies, 50) * 1000:.1f}ms p99={percentile(latencies, 99) * 1000:.1f}ms")
+
+
+async def create_client(url: str = "sqlite+aiosqlite://") -> tuple[AsyncClient, async_sessionmaker, str]:
+
+    """
+    The create_client function builds an in-process client for the application backed by a scratch database.
+    Rate limiters are disabled, so the benchmarks do not need Redis.
+
+    :param url: str: The database url, an in-memory SQLite database by default
+    :return: The client, the session maker and an access token of the benchmark user
+    :doc-author: Trelent
+    """
+
+    engine = create_async_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    session_maker = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine,
+                                       class_=EarlyReleaseSession)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    async with session_maker() as session:
+        session.add(User(username=bench_user["username"], email=bench_user["email"], confirmed=True,
+                         password=auth_service.get_password_hash(bench_user["password"])))
+        await session.commit()
+
+    async def override_get_db():
+        async with session_maker() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    for route in app.routes:
+        if isinstance(route, APIRoute):
+            for dependency in route.dependencies:
+                if isinstance(dependency.dependency, RateLimiter):
+                    app.dependency_overrides[dependency.dependency] = lambda: None
+
+    token = await auth_service.create_access_token(data={"sub": bench_user["email"]})
+    client = AsyncClient(transport=ASGITransport(app=app), base_url="http://test")
+    return client, session_maker, token
@@ -0,0 +1,75 @@
+"""
+Measures how many emails per second the email service sends to a local aiosmtpd server:
+a FastMail per message as before, then the pooled mailer with concurrent sends and with send_many.
+
+Run with: python -m benchmarks.email_throughput
+"""
+import asyncio
+import time
+
+from aiosmtpd.controller import Controller
+from fastapi_mail import FastMail, MessageSchema, MessageType
+
+from src.services.email import Mailer
+from tests.conftest import Inbox, free_port, smtp_config
+
+COUNT = 500
+CONCURRENCY = 10
+
+
+def message(index: int) -> MessageSchema:
+    return MessageSchema(subject="Reset password", recipients=[f"user{index}@example.com"], subtype=MessageType.html,
+                         template_body={"host": "http://localhost:8000/", "username": f"user{index}"})
+
+
+async def sequentially(send) -> None:
+    for index in range(COUNT):
+        await send(message(index))
+
+
+async def concurrently(send) -> None:
+    indexes = iter(range(COUNT))
+
+    async def sender():
+        for index in indexes:
+            await send(message(index))
+
+    await asyncio.gather(*[sender() for _ in range(CONCURRENCY)])
+
+
+async def measure(name: str, inbox: Inbox, run) -> None:
+    inbox.messages.clear()
+    started = time.perf_counter()
+    await run()
+    elapsed = time.perf_counter() - started
+    assert len(inbox.messages) == COUNT, len(inbox.messages)
+    print(f"{name}: {COUNT} emails in {elapsed:.2f}s, {COUNT / elapsed:.1f} emails/s")
+
+
+async def main() -> None:
+    inbox = Inbox()
+    controller = Controller(inbox, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    config = smtp_config(controller.port)
+    try:
+        def fast_mail(item: MessageSchema):
+            return FastMail(config).send_message(item, template_name="reset_template.html")
+
+        await measure("FastMail per message, sequential", inbox, lambda: sequentially(fast_mail))
+        await measure(f"FastMail per message, {CONCURRENCY} concurrent", inbox, lambda: concurrently(fast_mail))
+
+        mailer = Mailer(config, pool_size=CONCURRENCY)
+        await measure("Mailer, sequential", inbox, lambda: sequentially(
+            lambda item: mailer.send(item, template_name="reset_template.html")))
+        await measure(f"Mailer, {CONCURRENCY} concurrent", inbox, lambda: concurrently(
+            lambda item: mailer.send(item, template_name="reset_template.html")))
+        await measure("Mailer.send_many", inbox, lambda: mailer.send_many(
+            [(message(index), "reset_template.html") for index in range(COUNT)]))
+        print(f"Mailer opened {mailer.connections_opened} connections")
+        await mailer.close()
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
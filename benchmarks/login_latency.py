@@ -0,0 +1,54 @@
+"""
+Measures the latency of GET /api/contacts/ while logins run concurrently.
+
+Run with: python -m benchmarks.login_latency
+"""
+import asyncio
+import time
+from unittest.mock import patch
+
+from benchmarks.common import bench_user, create_client, report
+from src.services.hashing import password_hasher, pwd_context
+
+DURATION = 5
+LOGIN_CONCURRENCY = 4
+
+
+async def blocking_verify(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+async def run(name: str) -> None:
+    client, _, token = await create_client()
+    headers = {"Authorization": f"Bearer {token}"}
+    deadline = time.perf_counter() + DURATION
+    latencies = []
+
+    async def login():
+        while time.perf_counter() < deadline:
+            await client.post("/api/auth/login",
+                              data={"username": bench_user["email"], "password": bench_user["password"]})
+
+    async def read():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = await client.get("/api/contacts/", headers=headers)
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.text
+            await asyncio.sleep(0.01)
+
+    started = time.perf_counter()
+    await asyncio.gather(read(), *[login() for _ in range(LOGIN_CONCURRENCY)])
+    report(name, latencies, started)
+    await client.aclose()
+
+
+async def main() -> None:
+    with patch.object(password_hasher, "verify", blocking_verify):
+        await run("GET /api/contacts/ with blocking bcrypt")
+    await run(f"GET /api/contacts/ with {password_hasher.executor_type} pool bcrypt")
+    password_hasher.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+"""
+Load test of the connection pool: runs concurrent sessions against PostgreSQL with growing pool sizes
+and reports queries per second, checkout wait times and overflow events from the pool metrics.
+The mixed traffic part runs requests that query once and then work without the database for a while,
+as password hashing, Redis and serialization do, with and without the early release of connections.
+Needs the database of DB_URL, the queries only sleep on the server and touch no tables.
+
+Run with: python -m benchmarks.pool_throughput
+"""
+import asyncio
+import time
+
+from sqlalchemy import func, select
+
+import benchmarks.common  # noqa: F401  puts the project root on sys.path
+from benchmarks.common import percentile
+from src.database.db import DatabaseSessionManager
+from config import settings
+
+CONCURRENCY = 50
+DURATION = 5
+POOL_SIZES = (5, 10, 20, 40)
+# a select, so the session knows the statement holds nothing and may release the connection after it
+QUERY = select(func.pg_sleep(0.005))
+# time a mixed traffic request spends after its query without needing the database
+APP_WORK = 0.02
+
+
+async def run(pool_size: int) -> None:
+    manager = DatabaseSessionManager(settings.DB_URL, pool_size=pool_size, max_overflow=0, pool_timeout=30)
+    deadline = time.perf_counter() + DURATION
+    latencies = []
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            async with manager.session() as session:
+                await session.execute(QUERY)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    elapsed = time.perf_counter() - started
+    status = manager.pool_status()
+    print(f"pool_size={pool_size}: {len(latencies) / elapsed:.1f} queries/s, "
+          f"p50={percentile(latencies, 50) * 1000:.1f}ms p99={percentile(latencies, 99) * 1000:.1f}ms, "
+          f"mean checkout wait={status['wait_ms_total'] / max(1, status['checkouts']):.2f}ms, "
+          f"overflow events={status['overflow_events']}")
+    await manager.close()
+
+
+async def run_mixed(early_release: bool, pool_size: int = 10) -> None:
+    manager = DatabaseSessionManager(settings.DB_URL, pool_size=pool_size, max_overflow=0, pool_timeout=30,
+                                     early_release=early_release)
+    deadline = time.perf_counter() + DURATION
+    latencies = []
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            async with manager.session() as session:
+                await session.execute(QUERY)
+                await asyncio.sleep(APP_WORK)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    elapsed = time.perf_counter() - started
+    print(f"mixed traffic, pool_size={pool_size}, early_release={early_release}: "
+          f"{len(latencies) / elapsed:.1f} requests/s, "
+          f"p50={percentile(latencies, 50) * 1000:.1f}ms p99={percentile(latencies, 99) * 1000:.1f}ms")
+    await manager.close()
+
+
+async def main() -> None:
+    for pool_size in POOL_SIZES:
+        await run(pool_size)
+    for early_release in (False, True):
+        await run_mixed(early_release)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,65 @@
+"""
+Compares rows per second serialized for a page of contacts by the response_model path of FastAPI,
+the precompiled TypeAdapter path and the trusted row path of src.services.serialization.
+
+Run with: python -m benchmarks.serialization
+"""
+import json
+import time
+from datetime import datetime
+from typing import List
+
+from pydantic import TypeAdapter
+
+import benchmarks.common  # noqa: F401  puts the project root on sys.path
+from src.database.models import Contact
+from src.schemas.schemas import ContactResponse
+from src.services.serialization import dump_contacts
+
+PAGE_SIZE = 100
+DURATION = 2
+
+
+def response_model_path(contacts: list) -> bytes:
+    # what FastAPI does for response_model=List[ContactResponse]: build an adapter, validate,
+    # serialize to python in json mode and encode with the stdlib json
+    adapter = TypeAdapter(List[ContactResponse])
+    content = adapter.dump_python(adapter.validate_python(contacts, from_attributes=True), mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+IMPLEMENTATIONS = {
+    "response_model": response_model_path,
+    "type_adapter": lambda contacts: dump_contacts(contacts, trusted=False),
+    "trusted": lambda contacts: dump_contacts(contacts, trusted=True),
+}
+
+
+def make_contacts() -> list:
+    return [Contact(id=i, first_name=f"First{i}", last_name=f"Last{i}", email=f"contact{i}@example.com",
+                    phone="380501234567", birthday=datetime(1990, i % 12 + 1, i % 28 + 1),
+                    other_information="Some notes about the contact", done=bool(i % 2),
+                    created_at=datetime(2024, 1, 1, 12, 0, 0), update_at=datetime(2024, 1, 2, 12, 0, 0), user_id=1)
+            for i in range(1, PAGE_SIZE + 1)]
+
+
+def run(name: str, contacts: list) -> None:
+    serialize = IMPLEMENTATIONS[name]
+    pages = 0
+    started = time.perf_counter()
+    deadline = started + DURATION
+    while time.perf_counter() < deadline:
+        serialize(contacts)
+        pages += 1
+    elapsed = time.perf_counter() - started
+    print(f"{name}: {pages * PAGE_SIZE / elapsed:,.0f} rows/s, {elapsed / pages * 1000:.3f} ms per {PAGE_SIZE}-row page")
+
+
+def main() -> None:
+    contacts = make_contacts()
+    for name in IMPLEMENTATIONS:
+        run(name, contacts)
+
+
+if __name__ == "__main__":
+    main()
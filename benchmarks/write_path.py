@@ -0,0 +1,129 @@
+"""
+Compares database round trips and latency of the contact write path before and after
+the switch to INSERT/UPDATE/DELETE ... RETURNING.
+
+Both implementations do the bookkeeping delta sync needs: every write bumps the contacts version
+of the owner first and deletes leave a tombstone. That version bump is a separate statement on the
+users table, so a RETURNING write takes two statements (three for a delete) against three and more
+for the legacy read-modify-write, which also needs its SELECT or refresh().
+
+Run with: python -m benchmarks.write_path
+"""
+import asyncio
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.future import select
+
+import benchmarks.common  # noqa: F401  puts the project root on sys.path
+from src.database.models import Base, Contact, User
+from src.repository import contacts as repository_contacts
+from src.repository.contacts import _add_tombstones, _next_version
+from src.schemas.schemas import ContactCreate, ContactStatusUpdate, ContactUpdate
+
+OPERATIONS = 500
+
+
+async def legacy_create_contact(body, user, db):
+    version = await _next_version(user, db)
+    contact = Contact(user_id=user.id, change_seq=version, **body.model_dump(exclude_unset=True))
+    db.add(contact)
+    await db.commit()
+    await db.refresh(contact)
+    return contact
+
+
+async def legacy_update_contact(contact_id, body, user, db):
+    version = await _next_version(user, db)
+    result = await db.execute(select(Contact).filter_by(id=contact_id, user_id=user.id))
+    contact = result.scalar_one_or_none()
+    if contact:
+        for key, value in body.model_dump().items():
+            setattr(contact, key, value)
+        contact.change_seq = version
+        await db.commit()
+    return contact
+
+
+async def legacy_update_status_contact(contact_id, body, user, db):
+    version = await _next_version(user, db)
+    result = await db.execute(select(Contact).filter_by(id=contact_id, user_id=user.id))
+    contact = result.scalar_one_or_none()
+    if contact:
+        contact.done = body.done
+        contact.change_seq = version
+        await db.commit()
+    return contact
+
+
+async def legacy_remove_contact(contact_id, user, db):
+    version = await _next_version(user, db)
+    result = await db.execute(select(Contact).filter_by(id=contact_id, user_id=user.id))
+    contact = result.scalar_one_or_none()
+    if contact:
+        await db.delete(contact)
+        await _add_tombstones([contact.id], version, user, db)
+        await db.commit()
+    return contact
+
+
+IMPLEMENTATIONS = {
+    "legacy": (legacy_create_contact, legacy_update_contact, legacy_update_status_contact, legacy_remove_contact),
+    "returning": (repository_contacts.create_contact, repository_contacts.update_contact,
+                  repository_contacts.update_status_contact, repository_contacts.remove_contact),
+}
+
+
+async def run(name: str) -> None:
+    path = f"./bench_{name}.db"
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    statements = 0
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def count(*args):
+        nonlocal statements
+        statements += 1
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_maker() as db:
+        user = User(username="benchmark", email="benchmark@example.com", password="x")
+        db.add(user)
+        await db.commit()
+
+    create, update, update_status, remove = IMPLEMENTATIONS[name]
+    print(f"{name}:")
+    ids = []
+    for label, operation in (
+            ("create", lambda i: create(ContactCreate(first_name="A", last_name="B", email=f"{i}@example.com",
+                                                      phone="1", birthday=datetime(2000, 1, 1)), user, db)),
+            ("update", lambda i: update(ids[i], ContactUpdate(first_name="C", last_name="D", email=f"{i}@example.org",
+                                                              phone="2", birthday=datetime(2001, 2, 2), done=True),
+                                        user, db)),
+            ("status", lambda i: update_status(ids[i], ContactStatusUpdate(done=False), user, db)),
+            ("delete", lambda i: remove(ids[i], user, db))):
+        statements = 0
+        started = time.perf_counter()
+        for i in range(OPERATIONS):
+            async with session_maker() as db:
+                contact = await operation(i)
+                if label == "create":
+                    ids.append(contact.id)
+        elapsed = time.perf_counter() - started
+        print(f"  {label}: {statements / OPERATIONS:.1f} statements/op, {elapsed / OPERATIONS * 1000:.2f} ms/op")
+    await engine.dispose()
+    os.remove(path)
+
+
+async def main() -> None:
+    for name in IMPLEMENTATIONS:
+        await run(name)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
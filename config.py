@@ -12,6 +12,26 @@ class Settings(BaseSettings):
     PG_PORT: str
     PG_DOMAIN: str
     DB_URL: str
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 10
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    DB_EARLY_RELEASE: bool = True
+    POOL_METRICS_ENDPOINT: bool = False
+    QUERY_SLOW_MS: float = 200
+    QUERY_REPEAT_THRESHOLD: int = 5
+    QUERY_DEBUG_HEADERS: bool = False
+    QUERY_METRICS_ENDPOINT: bool = False
+    DB_REPLICA_URLS: str = ''
+    DB_REPLICA_HEALTH_INTERVAL: float = 5
+    DB_REPLICA_HEALTH_TIMEOUT: float = 2
+    DB_READ_YOUR_WRITES_WINDOW: float = 5
+    DB_SHARD_URLS: str = ''
+    DB_SHARD_VNODES: int = 64
+    DB_RESHARD_BATCH_SIZE: int = 1000
+    DB_RESHARD_GRACE: float = 5
     SECRET_KEY_JWT: str
     ALGORITHM: str
     MAIL_USERNAME: str
@@ -19,12 +39,49 @@ class Settings(BaseSettings):
     MAIL_FROM: str
     MAIL_PORT: int
     MAIL_SERVER: str
+    EMAIL_OUTBOX_STREAM: str = 'email:outbox'
+    EMAIL_DEDUP_WINDOW: int = 60
+    EMAIL_WORKER_CONCURRENCY: int = 10
+    EMAIL_MAX_ATTEMPTS: int = 5
+    EMAIL_RETRY_BACKOFF: float = 2
+    SMTP_POOL_SIZE: int = 10
+    SMTP_KEEPALIVE: float = 60
+    BIRTHDAY_DIGEST_DAYS: int = 7
+    BIRTHDAY_DIGEST_HOUR: int = 8
+    BIRTHDAY_DIGEST_CHUNK_SIZE: int = 1000
     REDIS_DOMAIN: str = 'localhost'
     REDIS_PORT: int = 6379
     REDIS_PASSWORD: str = None
     CLOUDINARY_NAME: str
     CLOUDINARY_API_KEY: str
     CLOUDINARY_API_SECRET: str
+    AVATAR_STORAGE: str = 'cloudinary'
+    AVATAR_LOCAL_DIR: str = 'static/avatars'
+    AVATAR_LOCAL_URL: str = '/static/avatars'
+    AVATAR_MAX_SIZE: int = 2097152
+    AVATAR_CONTENT_TYPES: str = 'image/jpeg,image/png,image/gif,image/webp'
+    AVATAR_UPLOAD_WORKERS: int = 4
+    PRINCIPAL_CACHE_SIZE: int = 1024
+    PRINCIPAL_CACHE_LOCAL_TTL: int = 5
+    PRINCIPAL_CACHE_TTL: int = 300
+    PASSWORD_HASHER_EXECUTOR: str = 'thread'
+    PASSWORD_HASHER_WORKERS: int = 2
+    PASSWORD_HASHER_MAX_PENDING: int = 32
+    AUTH_CLAIMS_PRINCIPAL: bool = False
+    IMPORT_BATCH_SIZE: int = 1000
+    IMPORT_MAX_ERRORS: int = 1000
+    IMPORT_MAX_RECORD_SIZE: int = 1048576
+    RESPONSE_CACHE_TTL: int = 300
+    RESPONSE_CACHE_MAX_BYTES: int = 1048576
+    CONTACT_EVENTS_QUEUE_SIZE: int = 100
+    CONTACT_EVENTS_HEARTBEAT: int = 15
+    JSON_TRUSTED_ROWS: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    COMPRESSION_ZSTD_LEVEL: int = 3
+    COMPRESSION_MAX_LAG: float = 0.05
+    COMPRESSION_LAG_INTERVAL: float = 0.5
 
     class Config:
         env_file = ".env"
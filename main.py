@@ -4,12 +4,22 @@ from pathlib import Path
 from redis.asyncio import Redis
 from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
 from fastapi_limiter import FastAPILimiter
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
+from src.database.db import get_db, sessionmanager
+from src.database.instrumentation import QueryInstrumentationMiddleware, query_instrumentation
 from src.routes import contacts, auth, users
+from src.services.avatars import avatar_service
+from src.services.cache import principal_cache
+from src.services.compression import CompressionMiddleware, loop_lag
+from src.services.events import contact_events
+from src.services.email import mailer
+from src.services.hashing import password_hasher
+from src.services.outbox import email_outbox
+from src.services.response_cache import response_cache
 from config import settings
 
 
@@ -30,19 +40,39 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MIN_SIZE,
+    monitor=loop_lag,
+    max_lag=settings.COMPRESSION_MAX_LAG
+)
+
+app.add_middleware(
+    QueryInstrumentationMiddleware,
+    instrumentation=query_instrumentation,
+    debug_headers=settings.QUERY_DEBUG_HEADERS
+)
+
 BASE_DIR = Path(__file__).parent
 
 app.include_router(auth.router, prefix='/api')
 app.include_router(contacts.router, prefix='/api')
 app.include_router(users.router, prefix='/api')
 
+if settings.AVATAR_STORAGE == 'local':
+    app.mount(settings.AVATAR_LOCAL_URL, StaticFiles(directory=settings.AVATAR_LOCAL_DIR, check_dir=False),
+              name='avatars')
+
 
 @app.on_event("startup")
 async def startup():
     
     """
     The startup function is called when the application starts up.
-    It's initialize Redis caches.
+    It's initialize Redis caches: the rate limiter, the principal cache, the response cache,
+    the contact events publisher and the email outbox share one connection. It's also start the event loop lag
+    monitor the compression middleware adapts its level to, and the health checks of the read replicas,
+    whose read-your-writes pins are shared through Redis too.
 
     :return: A fastapilimiter instance
     :doc-author: Trelent
@@ -55,6 +85,33 @@ async def startup():
         password=settings.REDIS_PASSWORD,
     )
     await FastAPILimiter.init(r)
+    principal_cache.init(r)
+    response_cache.init(r)
+    contact_events.init(r)
+    email_outbox.init(r)
+    sessionmanager.pins.init(r)
+    sessionmanager.replicas.start()
+    loop_lag.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+
+    """
+    The shutdown function is called when the application stops.
+    It's release the password hashing and avatar upload workers, the contact events subscriber,
+    the SMTP connections of the mailer, the loop lag monitor and the database connections.
+
+    :return: None
+    :doc-author: Trelent
+    """
+
+    password_hasher.shutdown()
+    avatar_service.shutdown()
+    await contact_events.close()
+    await mailer.close()
+    await loop_lag.stop()
+    await sessionmanager.close()
 
 
 @app.get("/")
@@ -74,7 +131,41 @@ async def healthchecker(db: AsyncSession = Depends(get_db)):
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="Error connecting to the database")
-    
+
+
+@app.get("/api/metrics/pool", include_in_schema=False)
+async def pool_metrics():
+
+    """
+    The pool_metrics function returns the live metrics of the database connection pool.
+    The endpoint exposes internal state, so it answers only when POOL_METRICS_ENDPOINT is enabled,
+    which is meant for deployments where /api/metrics is reachable from the internal network only.
+
+    :return: The connections checked out, the checkout wait histogram and the overflow events
+    :doc-author: Trelent
+    """
+
+    if not settings.POOL_METRICS_ENDPOINT:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return sessionmanager.pool_status()
+
+
+@app.get("/api/metrics/queries", include_in_schema=False)
+async def query_metrics():
+
+    """
+    The query_metrics function returns the statements run per route: the requests, the statements and their
+    total time, the slow statements and the requests that repeated a statement, a sign of N+1 queries.
+    Like the pool metrics it answers only when QUERY_METRICS_ENDPOINT is enabled.
+
+    :return: The query totals and averages per route
+    :doc-author: Trelent
+    """
+
+    if not settings.QUERY_METRICS_ENDPOINT:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return query_instrumentation.snapshot()
+
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=int(os.environ.get("PORT", 8000)), log_level="info")
@@ -0,0 +1,26 @@
+"""user token version
+
+Revision ID: 25147b4e4cd5
+Revises: 7f595625d861
+Create Date: 2026-10-16 10:12:31.418207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '25147b4e4cd5'
+down_revision: Union[str, None] = '7f595625d861'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'token_version')
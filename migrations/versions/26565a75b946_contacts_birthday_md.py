@@ -0,0 +1,33 @@
+"""contacts birthday_md
+
+Revision ID: 26565a75b946
+Revises: 7436858fd8b4
+Create Date: 2026-10-16 12:36:19.772540
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '26565a75b946'
+down_revision: Union[str, None] = '7436858fd8b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    birthday = sa.column('birthday', sa.DateTime())
+    op.add_column('contacts', sa.Column('birthday_md', sa.SmallInteger(), sa.Computed(
+        sa.cast(sa.extract('month', birthday) * 100 + sa.extract('day', birthday), sa.SmallInteger), persisted=True)))
+    with op.get_context().autocommit_block():
+        op.create_index('ix_contacts_user_id_birthday_md', 'contacts', ['user_id', 'birthday_md'], unique=False,
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_contacts_user_id_birthday_md', table_name='contacts', postgresql_concurrently=True)
+    op.drop_column('contacts', 'birthday_md')
@@ -0,0 +1,26 @@
+"""user contacts_version
+
+Revision ID: 3b1c9e27f0a4
+Revises: 26565a75b946
+Create Date: 2026-10-16 13:02:41.118203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b1c9e27f0a4'
+down_revision: Union[str, None] = '26565a75b946'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('contacts_version', sa.BigInteger(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'contacts_version')
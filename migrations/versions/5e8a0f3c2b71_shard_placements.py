@@ -0,0 +1,31 @@
+"""shard placements
+
+Revision ID: 5e8a0f3c2b71
+Revises: 9d4e2a61c7b3
+Create Date: 2026-10-16 15:24:09.518377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e8a0f3c2b71'
+down_revision: Union[str, None] = '9d4e2a61c7b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('shard_placements',
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('shard', sa.String(length=50), nullable=False),
+                    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+                    sa.PrimaryKeyConstraint('user_id')
+                    )
+
+
+def downgrade() -> None:
+    op.drop_table('shard_placements')
@@ -0,0 +1,35 @@
+"""contacts keyset indexes
+
+Revision ID: 7436858fd8b4
+Revises: db9adff4102b
+Create Date: 2026-10-16 11:48:05.214376
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7436858fd8b4'
+down_revision: Union[str, None] = 'db9adff4102b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = {
+    'ix_contacts_user_id_id': ['user_id', 'id'],
+    'ix_contacts_user_id_first_name_id': ['user_id', 'first_name', 'id'],
+    'ix_contacts_user_id_last_name_id': ['user_id', 'last_name', 'id'],
+}
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES.items():
+            op.create_index(name, 'contacts', columns, unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.drop_index(name, table_name='contacts', postgresql_concurrently=True)
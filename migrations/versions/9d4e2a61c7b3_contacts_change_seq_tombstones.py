@@ -0,0 +1,46 @@
+"""contacts change_seq and tombstones
+
+Revision ID: 9d4e2a61c7b3
+Revises: 3b1c9e27f0a4
+Create Date: 2026-10-16 13:41:07.502316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4e2a61c7b3'
+down_revision: Union[str, None] = '3b1c9e27f0a4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('change_seq', sa.BigInteger(), server_default='0', nullable=False))
+    op.create_table('contact_tombstones',
+                    sa.Column('contact_id', sa.Integer(), nullable=False),
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('change_seq', sa.BigInteger(), nullable=False),
+                    sa.Column('deleted_at', sa.DateTime(), nullable=False),
+                    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+                    sa.PrimaryKeyConstraint('contact_id')
+                    )
+    op.create_index('ix_contact_tombstones_user_id_change_seq', 'contact_tombstones', ['user_id', 'change_seq'],
+                    unique=False)
+    # Existing contacts become one version above the current one, so a full sync from 0 returns them
+    op.execute("UPDATE users SET contacts_version = contacts_version + 1")
+    op.execute("UPDATE contacts SET change_seq = users.contacts_version FROM users WHERE users.id = contacts.user_id")
+    with op.get_context().autocommit_block():
+        op.create_index('ix_contacts_user_id_change_seq', 'contacts', ['user_id', 'change_seq'], unique=False,
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_contacts_user_id_change_seq', table_name='contacts', postgresql_concurrently=True)
+    op.drop_index('ix_contact_tombstones_user_id_change_seq', table_name='contact_tombstones')
+    op.drop_table('contact_tombstones')
+    op.drop_column('contacts', 'change_seq')
@@ -0,0 +1,44 @@
+"""birthday digests
+
+Revision ID: b4d1c7e93a05
+Revises: 5e8a0f3c2b71
+Create Date: 2026-10-16 23:52:41.207316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4d1c7e93a05'
+down_revision: Union[str, None] = '5e8a0f3c2b71'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('timezone', sa.String(length=50), server_default='UTC', nullable=False))
+    op.create_index('ix_users_timezone_id', 'users', ['timezone', 'id'], unique=False)
+    op.create_table('birthday_digests',
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('day', sa.Date(), nullable=False),
+                    sa.Column('sent_at', sa.DateTime(), nullable=True),
+                    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+                    sa.PrimaryKeyConstraint('user_id', 'day')
+                    )
+    op.create_table('birthday_digest_runs',
+                    sa.Column('timezone', sa.String(length=50), nullable=False),
+                    sa.Column('day', sa.Date(), nullable=False),
+                    sa.Column('last_user_id', sa.Integer(), nullable=False),
+                    sa.Column('finished_at', sa.DateTime(), nullable=True),
+                    sa.PrimaryKeyConstraint('timezone', 'day')
+                    )
+
+
+def downgrade() -> None:
+    op.drop_table('birthday_digest_runs')
+    op.drop_table('birthday_digests')
+    op.drop_index('ix_users_timezone_id', table_name='users')
+    op.drop_column('users', 'timezone')
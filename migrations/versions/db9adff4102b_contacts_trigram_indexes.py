@@ -0,0 +1,39 @@
+"""contacts trigram indexes
+
+Revision ID: db9adff4102b
+Revises: 25147b4e4cd5
+Create Date: 2026-10-16 11:02:47.903114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'db9adff4102b'
+down_revision: Union[str, None] = '25147b4e4cd5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = ('first_name', 'last_name', 'email')
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    with op.get_context().autocommit_block():
+        for column in COLUMNS:
+            op.create_index(f'ix_contacts_{column}_trgm', 'contacts', [column], unique=False,
+                            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'},
+                            postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    with op.get_context().autocommit_block():
+        for column in COLUMNS:
+            op.drop_index(f'ix_contacts_{column}_trgm', table_name='contacts',
+                          postgresql_concurrently=True, if_exists=True)
@@ -1,25 +1,174 @@
 import contextlib
 
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from starlette.requests import HTTPConnection
 
+from src.database.instrumentation import query_instrumentation
+from src.database.pool import InstrumentedQueuePool, PoolMetrics
+from src.database.replicas import ReadYourWrites, ReplicaSet, request_subject
+from src.database.shards import RoutingSession, ShardSet, parse_shard_urls
 from config import settings
 
 
+def engine_options(url: str, pool_size: int, max_overflow: int, pool_timeout: float, pool_recycle: int,
+                   pool_pre_ping: bool, statement_cache_size: int) -> dict:
+
+    """
+    The engine_options function builds the keyword arguments of create_async_engine for a database url.
+    SQLite keeps the pool SQLAlchemy picks for it; the statement cache size applies to asyncpg only,
+    where it sizes both the prepared statement cache of SQLAlchemy and the one of asyncpg.
+
+    :param url: str: The database url
+    :param pool_size: int: The number of connections kept open
+    :param max_overflow: int: The number of extra connections opened when the pool is exhausted
+    :param pool_timeout: float: Seconds a checkout waits for a connection before it fails
+    :param pool_recycle: int: Seconds after which a connection is replaced, -1 to keep connections forever
+    :param pool_pre_ping: bool: Test connections on checkout
+    :param statement_cache_size: int: The number of prepared statements cached per connection
+    :return: The engine options
+    :doc-author: Trelent
+    """
+
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        return {}
+    options = {"poolclass": InstrumentedQueuePool, "pool_size": pool_size, "max_overflow": max_overflow,
+               "pool_timeout": pool_timeout, "pool_recycle": pool_recycle, "pool_pre_ping": pool_pre_ping}
+    if url.get_driver_name() == "asyncpg":
+        options["connect_args"] = {"prepared_statement_cache_size": statement_cache_size,
+                                   "statement_cache_size": statement_cache_size}
+    return options
+
+
+class PrimarySession(RoutingSession):
+    """
+    The session class of the primary database. It notes in its info whether it wrote anything,
+    so the writer can be pinned to the primary for its next reads.
+    """
+
+
+@event.listens_for(PrimarySession, "do_orm_execute")
+def _mark_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(PrimarySession, "after_flush")
+def _mark_flush(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _mark_held(orm_execute_state):
+    # writes, row locks and statements SQLAlchemy cannot classify keep the transaction until the caller ends it
+    statement = orm_execute_state.statement
+    if not orm_execute_state.is_select or getattr(statement, "_for_update_arg", None) is not None:
+        orm_execute_state.session.info["held"] = True
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _mark_flush_held(session, flush_context):
+    session.info["held"] = True
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _release_held(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("held", None)
+
+
+class EarlyReleaseSession(AsyncSession):
+    """
+    The async session of the application. Like every SQLAlchemy session it checks out a connection only for
+    its first statement, so requests rejected before they query never touch the pool. On top of that it gives
+    the connection back right after a read whose transaction holds nothing: no writes, no row locks and no
+    pending objects. The rest of the request, password hashing, Redis and serialization, runs without a
+    connection; a later statement checks out a new one.
+    """
+
+    async def release(self) -> None:
+
+        """
+        The release function ends the transaction of the session and returns its connections to the pools,
+        unless the transaction still holds something the caller has to commit or roll back.
+        The result of the last statement is buffered already, and with expire_on_commit off the loaded
+        objects stay usable.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+
+        if (not self.in_transaction() or self.in_nested_transaction() or self.info.get("held")
+                or self.new or self.dirty or self.deleted):
+            return
+        await self.commit()
+
+    async def execute(self, *args, **kwargs):
+        result = await super().execute(*args, **kwargs)
+        await self.release()
+        return result
+
+    async def scalar(self, *args, **kwargs):
+        result = await super().scalar(*args, **kwargs)
+        await self.release()
+        return result
+
+    async def get(self, *args, **kwargs):
+        result = await super().get(*args, **kwargs)
+        await self.release()
+        return result
+
+    async def refresh(self, *args, **kwargs):
+        await super().refresh(*args, **kwargs)
+        await self.release()
+
+
 class DatabaseSessionManager:
-    def __init__(self, url: str):
-        self._engine: AsyncEngine | None = create_async_engine(url)
-        self._session_maker: async_sessionmaker = async_sessionmaker(autoflush=False, autocommit=False,
-                                                                     bind=self._engine)
+    def __init__(self, url: str, replica_urls: tuple[str, ...] = (), shard_urls: dict[str, str] | None = None,
+                 pool_size: int = settings.DB_POOL_SIZE,
+                 max_overflow: int = settings.DB_MAX_OVERFLOW, pool_timeout: float = settings.DB_POOL_TIMEOUT,
+                 pool_recycle: int = settings.DB_POOL_RECYCLE, pool_pre_ping: bool = settings.DB_POOL_PRE_PING,
+                 statement_cache_size: int = settings.DB_STATEMENT_CACHE_SIZE,
+                 early_release: bool = settings.DB_EARLY_RELEASE):
+        options = (pool_size, max_overflow, pool_timeout, pool_recycle, pool_pre_ping, statement_cache_size)
+        self.metrics = PoolMetrics()
+        self._engine: AsyncEngine | None = create_async_engine(url, **engine_options(url, *options))
+        if isinstance(self._engine.pool, InstrumentedQueuePool):
+            self._engine.pool.metrics = self.metrics
+        self.shards = ShardSet({name: create_async_engine(shard_url, **engine_options(shard_url, *options))
+                                for name, shard_url in (shard_urls or {}).items()}, settings.DB_SHARD_VNODES)
+        # the shard connections join the sessions already begun, so the sessions leave committing them to the shards
+        session_options = {"autoflush": False, "autocommit": False, "expire_on_commit": False,
+                           "info": {"shards": self.shards}, "join_transaction_mode": "rollback_only",
+                           "class_": EarlyReleaseSession if early_release else AsyncSession}
+        self._session_maker: async_sessionmaker = async_sessionmaker(bind=self._engine,
+                                                                     sync_session_class=PrimarySession,
+                                                                     **session_options)
+        engines = [create_async_engine(replica_url, **engine_options(replica_url, *options))
+                   for replica_url in replica_urls]
+        self.replicas = ReplicaSet(engines, [async_sessionmaker(bind=engine, sync_session_class=RoutingSession,
+                                                                **session_options)
+                                             for engine in engines],
+                                   settings.DB_REPLICA_HEALTH_INTERVAL, settings.DB_REPLICA_HEALTH_TIMEOUT)
+        self.pins = ReadYourWrites(settings.DB_READ_YOUR_WRITES_WINDOW)
+        for engine in [self._engine, *self.replicas.engines, *self.shards.engines.values()]:
+            query_instrumentation.instrument(engine.sync_engine)
 
     @contextlib.asynccontextmanager
-    async def session(self):
+    async def session(self, subject: str | None = None):
         
         """
         The session function is a coroutine that returns an async context manager.
         The context manager yields a database session, and then closes the session when the block exits.
-        If an exception occurs in the block, it rolls back any changes made to the database.
+        If an exception occurs in the block, it rolls back any changes made to the database and raises it again,
+        so an HTTPException raised by a route still reaches the client with its own status code.
+        When there are replicas and the session wrote, the reads of the subject are pinned to the primary.
 
         :param self: Represent the instance of the class
+        :param subject: str | None: The email of the user the session works for
         :return: A context manager
         :doc-author: Trelent
         """
@@ -29,27 +178,113 @@ class DatabaseSessionManager:
         session = self._session_maker()
         try:
             yield session
-        except Exception as err:
-            print(err)
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+            if self.replicas and subject is not None and session.info.get("wrote"):
+                await self.pins.pin(subject)
+
+    @contextlib.asynccontextmanager
+    async def read_session(self, subject: str | None = None):
+
+        """
+        The read_session function returns an async context manager of a read-only session.
+        The session is bound to a healthy replica, or to the primary when there are no healthy replicas
+        or the subject wrote within the read-your-writes window.
+
+        :param self: Represent the instance of the class
+        :param subject: str | None: The email of the user the session works for
+        :return: A context manager
+        :doc-author: Trelent
+        """
+
+        session_maker = None
+        if self.replicas and not await self.pins.is_pinned(subject):
+            session_maker = self.replicas.choose()
+        if session_maker is None:
+            async with self.session(subject) as session:
+                yield session
+            return
+        session = session_maker()
+        try:
+            yield session
+        except Exception:
             await session.rollback()
+            raise
         finally:
             await session.close()
 
+    def pool_status(self) -> dict:
+
+        """
+        The pool_status function returns the live metrics of the connection pool: the connections checked out,
+        the checkout wait time histogram, the overflow events and the checkout timeouts.
+
+        :param self: Represent the instance of the class
+        :return: A dictionary with the pool metrics
+        :doc-author: Trelent
+        """
 
-sessionmanager = DatabaseSessionManager(settings.DB_URL)
+        pool = self._engine.pool
+        if not isinstance(pool, InstrumentedQueuePool):
+            return {"status": pool.status()}
+        return self.metrics.snapshot(pool)
 
+    async def close(self) -> None:
 
-async def get_db():
+        """
+        The close function closes all connections of the pool.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+
+        await self.replicas.stop()
+        await self._engine.dispose()
+        for engine in self.replicas.engines:
+            await engine.dispose()
+        await self.shards.close()
+
+
+sessionmanager = DatabaseSessionManager(settings.DB_URL,
+                                        tuple(url.strip() for url in settings.DB_REPLICA_URLS.split(",") if url.strip()),
+                                        parse_shard_urls(settings.DB_SHARD_URLS))
+
+
+async def get_db(connection: HTTPConnection):
     
     """
     The get_db function is a coroutine that returns an async context manager.
     When the context manager is entered, it yields a database session; when the
-    context manager exits, it closes the session. The get_db function itself can be
-    used as an async context manager:
+    context manager exits, it closes the session. The session checks out a connection on its first
+    statement and gives it back as soon as its transaction holds nothing, see EarlyReleaseSession,
+    so requests rejected by the rate limiter or the token check never take one from the pool.
+
+    :param connection: HTTPConnection: The request, its token tells whose reads a write pins to the primary
+    :return: A generator object that will yield a database session
+    :doc-author: Trelent
+    """
+
+    subject = request_subject(connection) if sessionmanager.replicas else None
+    async with sessionmanager.session(subject) as session:
+        yield session
+
+
+async def get_read_db(connection: HTTPConnection):
+
+    """
+    The get_read_db function is the dependency of read-only endpoints. It yields a session of a healthy replica,
+    or of the primary when no replica is configured or healthy, or when the user wrote within
+    DB_READ_YOUR_WRITES_WINDOW seconds. The session must not be used to write.
 
+    :param connection: HTTPConnection: The request, its token identifies the user
     :return: A generator object that will yield a database session
     :doc-author: Trelent
     """
 
-    async with sessionmanager.session() as session:
+    subject = request_subject(connection) if sessionmanager.replicas else None
+    async with sessionmanager.read_session(subject) as session:
         yield session
\ No newline at end of file
@@ -0,0 +1,220 @@
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RequestQueries:
+    """
+    The statements one request ran: how many, how long they took together and how often each SQL text came up.
+    The SQL text keeps its placeholders, so the same query with other parameters counts as a repetition.
+    """
+
+    def __init__(self, scope: Scope | None = None):
+        self.scope = scope
+        self.count = 0
+        self.duration = 0.0
+        self.slow = 0
+        self.statements: Counter[str] = Counter()
+
+    @property
+    def route(self) -> str:
+
+        """
+        The route function names the endpoint of the request by its method and path template,
+        so the requests of one endpoint are counted together whatever their path parameters are.
+
+        :param self: Represent the instance of the class
+        :return: The name of the route, "unmatched" before routing or when no route matched
+        :doc-author: Trelent
+        """
+
+        if self.scope is None:
+            return "-"
+        route = self.scope.get("route")
+        if route is None:
+            return "unmatched"
+        return f"{self.scope['method']} {route.path}"
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+
+        """
+        The repeated function returns the statements the request ran at least threshold times,
+        the usual sign of an N+1 query: one statement per row of a previous result.
+
+        :param self: Represent the instance of the class
+        :param threshold: int: The number of runs from which a statement counts as repeated
+        :return: The statements and their number of runs, the most repeated first
+        :doc-author: Trelent
+        """
+
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+
+current_queries: ContextVar[RequestQueries | None] = ContextVar("current_queries", default=None)
+
+
+def redact(parameters) -> str:
+
+    """
+    The redact function describes statement parameters without their values, which may be personal data
+    or secrets: only the names and the types are kept, and executemany batches are reduced to their size.
+
+    :param parameters: The parameters the driver received
+    :return: A printable description of the parameters
+    :doc-author: Trelent
+    """
+
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}=<{type(value).__name__}>" for key, value in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return f"<{len(parameters)} rows>"
+        return "(" + ", ".join(f"<{type(value).__name__}>" for value in parameters) + ")"
+    return "<redacted>"
+
+
+class QueryInstrumentation:
+    """
+    Times every statement of the instrumented engines and attributes it to the request that ran it.
+    Statements slower than slow_ms are logged with their parameters redacted, requests that ran one
+    statement repeat_threshold times or more are logged as possible N+1 queries, and the totals are
+    aggregated per route.
+    """
+
+    def __init__(self, slow_ms: float, repeat_threshold: int):
+        self.slow_ms = slow_ms
+        self.repeat_threshold = repeat_threshold
+        self.routes: dict[str, dict] = {}
+
+    def instrument(self, engine: Engine) -> None:
+
+        """
+        The instrument function installs the cursor execution hooks on an engine.
+
+        :param self: Represent the instance of the class
+        :param engine: Engine: The engine, the sync_engine of an AsyncEngine
+        :return: None
+        :doc-author: Trelent
+        """
+
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(engine, "handle_error", self._handle_error)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["query_started"].pop()
+        queries = current_queries.get()
+        if queries is not None:
+            queries.count += 1
+            queries.duration += duration
+            queries.statements[statement] += 1
+        if duration * 1000 >= self.slow_ms:
+            if queries is not None:
+                queries.slow += 1
+            logger.warning("Slow query on %s, %.1f ms: %s %s", queries.route if queries else "-",
+                           duration * 1000, statement, redact(parameters))
+
+    def _handle_error(self, exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_started"):
+            connection.info["query_started"].pop()
+        queries = current_queries.get()
+        logger.error("Query failed on %s: %s %s: %s", queries.route if queries else "-",
+                     exception_context.statement, redact(exception_context.parameters),
+                     exception_context.original_exception)
+
+    def record(self, queries: RequestQueries) -> None:
+
+        """
+        The record function adds the statements of a finished request to the totals of its route
+        and logs the statements it repeated.
+
+        :param self: Represent the instance of the class
+        :param queries: RequestQueries: The statements of the request
+        :return: None
+        :doc-author: Trelent
+        """
+
+        route = queries.route
+        stats = self.routes.get(route)
+        if stats is None:
+            stats = self.routes[route] = {"requests": 0, "queries": 0, "query_ms": 0.0, "max_queries": 0,
+                                          "slow_queries": 0, "repeated_requests": 0}
+        stats["requests"] += 1
+        stats["queries"] += queries.count
+        stats["query_ms"] += queries.duration * 1000
+        stats["max_queries"] = max(stats["max_queries"], queries.count)
+        stats["slow_queries"] += queries.slow
+        repeated = queries.repeated(self.repeat_threshold)
+        if repeated:
+            stats["repeated_requests"] += 1
+            statement, count = repeated[0]
+            logger.warning("Possible N+1 query on %s, the same statement ran %d times: %s", route, count, statement)
+
+    def snapshot(self) -> dict:
+
+        """
+        The snapshot function returns the totals per route together with the averages per request.
+
+        :param self: Represent the instance of the class
+        :return: A dictionary ready to be returned as JSON
+        :doc-author: Trelent
+        """
+
+        return {route: dict(stats, query_ms=round(stats["query_ms"], 3),
+                            mean_queries=round(stats["queries"] / stats["requests"], 2),
+                            mean_query_ms=round(stats["query_ms"] / stats["requests"], 3))
+                for route, stats in self.routes.items()}
+
+
+class QueryInstrumentationMiddleware:
+    """
+    ASGI middleware that collects the statements of every HTTP request for QueryInstrumentation.
+    With debug headers on, the response tells how many statements the request ran, how long they took
+    and, when a statement was repeated, how often. Statements of a streaming body that run after the
+    headers were sent are counted in the metrics only.
+    """
+
+    def __init__(self, app: ASGIApp, instrumentation: QueryInstrumentation, debug_headers: bool = False):
+        self.app = app
+        self.instrumentation = instrumentation
+        self.debug_headers = debug_headers
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        queries = RequestQueries(scope)
+        token = current_queries.set(queries)
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["X-DB-Queries"] = str(queries.count)
+                headers["X-DB-Time-Ms"] = f"{queries.duration * 1000:.1f}"
+                repeated = queries.repeated(self.instrumentation.repeat_threshold)
+                if repeated:
+                    headers["X-DB-Repeated"] = str(repeated[0][1])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers if self.debug_headers else send)
+        finally:
+            current_queries.reset(token)
+            self.instrumentation.record(queries)
+
+
+query_instrumentation = QueryInstrumentation(settings.QUERY_SLOW_MS, settings.QUERY_REPEAT_THRESHOLD)
@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Integer, String, Boolean, func
+from sqlalchemy import BigInteger, Column, Computed, Integer, SmallInteger, String, Boolean, Index, cast, extract, func
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.schema import ForeignKey
-from sqlalchemy.sql.sqltypes import DateTime
+from sqlalchemy.sql.sqltypes import Date, DateTime
 from sqlalchemy.ext.declarative import declarative_base
 
 
@@ -18,9 +18,17 @@ class User(Base):
     avatar = Column(String(255), nullable=True)
     confirmed = Column(Boolean, default=False, nullable=True)
     refresh_token = Column(String(255), nullable=True)
+    token_version = Column(Integer, default=0, server_default='0', nullable=False)
+    contacts_version = Column(BigInteger, default=0, server_default='0', nullable=False)
+    # IANA name of the time zone the daily birthday digest is sent in
+    timezone = Column(String(50), default='UTC', server_default='UTC', nullable=False)
 
     contacts = relationship("Contact", back_populates="user")
 
+    __table_args__ = (
+        Index('ix_users_timezone_id', 'timezone', 'id'),
+    )
+
 
 class Contact(Base):
     __tablename__ = "contacts"
@@ -30,10 +38,65 @@ class Contact(Base):
     email = Column(String(), nullable=False, unique=True)
     phone = Column(String(), nullable=False)
     birthday = Column(DateTime(), nullable=False)
+    # month * 100 + day of the birthday, kept up to date by the database for index-backed birthday queries
+    birthday_md = Column(SmallInteger, Computed(cast(extract('month', birthday) * 100 + extract('day', birthday),
+                                                     SmallInteger), persisted=True))
     other_information = Column(String(), nullable=True)
     done = Column(Boolean, default=False)
     created_at = Column('created_at', DateTime, default=func.now(), nullable=True)
     update_at = Column('update_at', DateTime, default=func.now(), onupdate=func.now(), nullable=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    # contacts_version of the owner after the last write of the row, used by delta sync
+    change_seq = Column(BigInteger, default=0, server_default='0', nullable=False)
 
     user = relationship("User", back_populates="contacts")
+
+    __table_args__ = (
+        Index('ix_contacts_user_id_id', 'user_id', 'id'),
+        Index('ix_contacts_user_id_first_name_id', 'user_id', 'first_name', 'id'),
+        Index('ix_contacts_user_id_last_name_id', 'user_id', 'last_name', 'id'),
+        Index('ix_contacts_user_id_birthday_md', 'user_id', 'birthday_md'),
+        Index('ix_contacts_user_id_change_seq', 'user_id', 'change_seq'),
+        Index('ix_contacts_first_name_trgm', 'first_name', postgresql_using='gin',
+              postgresql_ops={'first_name': 'gin_trgm_ops'}),
+        Index('ix_contacts_last_name_trgm', 'last_name', postgresql_using='gin',
+              postgresql_ops={'last_name': 'gin_trgm_ops'}),
+        Index('ix_contacts_email_trgm', 'email', postgresql_using='gin',
+              postgresql_ops={'email': 'gin_trgm_ops'}),
+    )
+
+
+class ContactTombstone(Base):
+    __tablename__ = "contact_tombstones"
+    contact_id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    change_seq = Column(BigInteger, nullable=False)
+    deleted_at = Column(DateTime, default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index('ix_contact_tombstones_user_id_change_seq', 'user_id', 'change_seq'),
+    )
+
+
+class ShardPlacement(Base):
+    __tablename__ = "shard_placements"
+    # users whose contacts are not on the shard the hash ring assigns, while they are moved or pinned by an operator
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    shard = Column(String(50), nullable=False)
+
+
+class BirthdayDigest(Base):
+    __tablename__ = "birthday_digests"
+    # one row per digest, written before it is sent, so a user gets at most one digest a day
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    sent_at = Column(DateTime, nullable=True)
+
+
+class BirthdayDigestRun(Base):
+    __tablename__ = "birthday_digest_runs"
+    # the progress of the digest job through the users of a time zone on a day
+    timezone = Column(String(50), primary_key=True)
+    day = Column(Date, primary_key=True)
+    last_user_id = Column(Integer, default=0, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
@@ -0,0 +1,93 @@
+import bisect
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# upper bounds of the checkout wait histogram buckets, in milliseconds
+WAIT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+class PoolMetrics:
+    """
+    Live statistics of a connection pool: how long checkouts wait, how often the pool has to open
+    overflow connections and how often a checkout gives up after the pool timeout.
+    """
+
+    def __init__(self):
+        self.wait_counts = [0] * (len(WAIT_BUCKETS) + 1)
+        self.wait_total = 0.0
+        self.checkouts = 0
+        self.overflow_events = 0
+        self.timeouts = 0
+
+    def observe_wait(self, seconds: float) -> None:
+
+        """
+        The observe_wait function records the time one checkout waited for a connection.
+
+        :param self: Represent the instance of the class
+        :param seconds: float: The wait time
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.checkouts += 1
+        self.wait_total += seconds
+        self.wait_counts[bisect.bisect_left(WAIT_BUCKETS, seconds * 1000)] += 1
+
+    def snapshot(self, pool) -> dict:
+
+        """
+        The snapshot function returns the current state of the pool together with the collected statistics.
+        The histogram is cumulative: every bucket counts the checkouts that waited at most its bound.
+
+        :param self: Represent the instance of the class
+        :param pool: The pool the statistics belong to
+        :return: A dictionary ready to be returned as JSON
+        :doc-author: Trelent
+        """
+
+        histogram, total = {}, 0
+        for bound, count in zip([str(bound) for bound in WAIT_BUCKETS] + ["+Inf"], self.wait_counts):
+            total += count
+            histogram[bound] = total
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": max(0, pool.overflow()),
+            "checkouts": self.checkouts,
+            "overflow_events": self.overflow_events,
+            "timeouts": self.timeouts,
+            "wait_ms_total": round(self.wait_total * 1000, 3),
+            "wait_ms_histogram": histogram,
+        }
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    The pool of create_async_engine that feeds every checkout into PoolMetrics.
+    """
+
+    metrics: PoolMetrics | None = None
+
+    def _do_get(self):
+        if self.metrics is None:
+            return super()._do_get()
+        overflow = self.overflow()
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        self.metrics.observe_wait(time.perf_counter() - started)
+        if self.overflow() > max(0, overflow):
+            self.metrics.overflow_events += 1
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
@@ -0,0 +1,196 @@
+import asyncio
+import itertools
+import time
+
+from jose import JWTError, jwt
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+from starlette.requests import HTTPConnection
+
+
+def request_subject(connection: HTTPConnection) -> str | None:
+
+    """
+    The request_subject function returns the subject of the bearer token of a request without verifying it.
+    The subject only selects the database a read goes to, the token is still verified by the auth dependencies,
+    so a forged token can at most send its own reads to the primary.
+
+    :param connection: HTTPConnection: The request or the websocket
+    :return: The email of the user, or None for anonymous requests
+    :doc-author: Trelent
+    """
+
+    scheme, _, token = connection.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.get_unverified_claims(token).get("sub")
+    except JWTError:
+        return None
+
+
+class ReadYourWrites:
+    """
+    Remembers the users that wrote recently, so their reads go to the primary until the replicas caught up.
+    Pins are kept in the worker and in Redis, so a write on one worker also pins reads served by the others.
+    """
+
+    def __init__(self, window: float, prefix: str = "db:pin"):
+        self.window = window
+        self.prefix = prefix
+        self.redis: Redis | None = None
+        self._local: dict[str, float] = {}
+
+    def init(self, redis: Redis) -> None:
+
+        """
+        The init function attaches the Redis connection the pins are shared through.
+
+        :param self: Represent the instance of the class
+        :param redis: Redis: The Redis connection created on startup
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.redis = redis
+
+    async def pin(self, subject: str) -> None:
+
+        """
+        The pin function sends the reads of a user to the primary for the next window seconds.
+
+        :param self: Represent the instance of the class
+        :param subject: str: The email of the user that wrote
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self._local[subject] = time.monotonic() + self.window
+        if self.redis is None:
+            return
+        try:
+            await self.redis.set(f"{self.prefix}:{subject}", 1, px=int(self.window * 1000))
+        except RedisError as err:
+            print(err)
+
+    async def is_pinned(self, subject: str | None) -> bool:
+
+        """
+        The is_pinned function tells whether the reads of a user have to go to the primary.
+        When Redis cannot be asked the answer is yes, a read from the primary is never stale.
+
+        :param self: Represent the instance of the class
+        :param subject: str | None: The email of the user, None for anonymous requests
+        :return: True if the user wrote within the window
+        :doc-author: Trelent
+        """
+
+        if subject is None:
+            return False
+        expires = self._local.get(subject)
+        if expires is not None:
+            if expires > time.monotonic():
+                return True
+            del self._local[subject]
+        if self.redis is None:
+            return False
+        try:
+            return bool(await self.redis.exists(f"{self.prefix}:{subject}"))
+        except RedisError as err:
+            print(err)
+            return True
+
+
+class ReplicaSet:
+    """
+    The read replicas of the database. Reads are spread round robin over the replicas that passed
+    their last health check; when none did, reads go to the primary.
+    """
+
+    def __init__(self, engines: list[AsyncEngine], session_makers: list[async_sessionmaker], interval: float,
+                 timeout: float):
+        self.engines = engines
+        self.session_makers = session_makers
+        self.interval = interval
+        self.timeout = timeout
+        self.healthy = [True] * len(engines)
+        self._next = itertools.cycle(range(len(engines)))
+        self._task: asyncio.Task | None = None
+
+    def __bool__(self) -> bool:
+        return bool(self.engines)
+
+    def choose(self) -> async_sessionmaker | None:
+
+        """
+        The choose function returns the session maker of the next healthy replica.
+
+        :param self: Represent the instance of the class
+        :return: The session maker, or None when no replica is healthy
+        :doc-author: Trelent
+        """
+
+        for _ in range(len(self.engines)):
+            index = next(self._next)
+            if self.healthy[index]:
+                return self.session_makers[index]
+        return None
+
+    async def check(self) -> None:
+
+        """
+        The check function runs a trivial query on every replica and records which ones answered in time.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+
+        async def ping(engine: AsyncEngine) -> bool:
+            try:
+                async with engine.connect() as connection:
+                    await asyncio.wait_for(connection.execute(text("SELECT 1")), self.timeout)
+                return True
+            except Exception as err:
+                print(err)
+                return False
+
+        self.healthy = list(await asyncio.gather(*(ping(engine) for engine in self.engines)))
+
+    def start(self) -> None:
+
+        """
+        The start function starts the periodic health checks in the running event loop.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+
+        if self.engines and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+
+        """
+        The stop function stops the health checks.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(self.interval)
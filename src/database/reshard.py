@@ -0,0 +1,223 @@
+"""
+Moves the contacts of users between shards.
+
+    python -m src.database.reshard init [--id-stride N]
+    python -m src.database.reshard pin
+    python -m src.database.reshard move USER_ID SHARD
+    python -m src.database.reshard rebalance
+
+To add a shard: run pin with the old DB_SHARD_URLS, so every user stays where its contacts are,
+run init and deploy the new DB_SHARD_URLS, then rebalance moves the users the new ring assigns elsewhere.
+"""
+import argparse
+import asyncio
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from src.database.db import DatabaseSessionManager, sessionmanager
+from src.database.models import Contact, ContactTombstone, ShardPlacement, User
+from src.database.shards import create_shard_schema
+from config import settings
+
+
+async def _copy(source: AsyncConnection, target: AsyncConnection, table, key, user_id: int, batch_size: int) -> int:
+    # the computed columns are filled in by the target database
+    columns = [column for column in table.columns if column.computed is None]
+    copied, last = 0, None
+    while True:
+        stmt = select(*columns).where(table.c.user_id == user_id).order_by(key).limit(batch_size)
+        if last is not None:
+            stmt = stmt.where(key > last)
+        rows = [dict(row) for row in (await source.execute(stmt)).mappings()]
+        if not rows:
+            return copied
+        ids = [row[key.name] for row in rows]
+        taken = (await target.execute(select(key).where(key.in_(ids), table.c.user_id != user_id))).scalars().all()
+        if taken:
+            raise RuntimeError(f"{table.name} {sorted(taken)[:10]} of other users already exist on the target shard")
+        await target.execute(insert(table), rows)
+        copied += len(rows)
+        last = ids[-1]
+
+
+async def _purge(connection: AsyncConnection, table, key, user_id: int, batch_size: int) -> None:
+    while True:
+        batch = select(key).where(table.c.user_id == user_id).limit(batch_size).scalar_subquery()
+        result = await connection.execute(delete(table).where(key.in_(batch)))
+        await connection.commit()
+        if not result.rowcount:
+            return
+
+
+async def move_user(manager: DatabaseSessionManager, user_id: int, target: str,
+                    batch_size: int = settings.DB_RESHARD_BATCH_SIZE, grace: float = settings.DB_RESHARD_GRACE) -> int:
+
+    """
+    The move_user function moves the contacts and tombstones of a user to another shard.
+    The user row stays locked while the rows are copied in batches, so the writes of the user wait for the move,
+    and the placement is committed together with the release of the lock: a write that waited reads the new
+    placement. The rows on the old shard are deleted grace seconds later, once the reads that started before
+    the move are done. Rows the user left on the target by an interrupted move are replaced, so a failed
+    move can simply be run again.
+
+    :param manager: DatabaseSessionManager: The databases
+    :param user_id: int: The id of the user
+    :param target: str: The name of the shard to move to
+    :param batch_size: int: The number of rows copied or deleted per statement
+    :param grace: float: Seconds to wait before the rows on the old shard are deleted
+    :return: The number of contacts moved
+    :doc-author: Trelent
+    """
+
+    shards = manager.shards
+    if target not in shards.engines:
+        raise ValueError(f"Unknown shard {target!r}")
+    async with manager._engine.begin() as primary:
+        locked = await primary.execute(select(User.id).where(User.id == user_id).with_for_update())
+        if locked.scalar_one_or_none() is None:
+            raise ValueError(f"Unknown user {user_id}")
+        source = await primary.run_sync(shards.locate, user_id)
+        moved = 0
+        if source != target:
+            async with shards.engines[source].connect() as reader, shards.engines[target].begin() as writer:
+                for table, key in ((Contact.__table__, Contact.id), (ContactTombstone.__table__,
+                                                                    ContactTombstone.contact_id)):
+                    await writer.execute(delete(table).where(table.c.user_id == user_id))
+                    copied = await _copy(reader, writer, table, key, user_id, batch_size)
+                    if table is Contact.__table__:
+                        moved = copied
+        await primary.execute(delete(ShardPlacement).where(ShardPlacement.user_id == user_id))
+        if target != shards.ring.shard_for(user_id):
+            await primary.execute(insert(ShardPlacement).values(user_id=user_id, shard=target))
+    if source == target:
+        return 0
+    await asyncio.sleep(grace)
+    async with shards.engines[source].connect() as connection:
+        await _purge(connection, Contact.__table__, Contact.id, user_id, batch_size)
+        await _purge(connection, ContactTombstone.__table__, ContactTombstone.contact_id, user_id, batch_size)
+    return moved
+
+
+async def _user_ids(manager: DatabaseSessionManager, batch_size: int):
+    last = 0
+    while True:
+        async with manager._engine.connect() as connection:
+            stmt = select(User.id).where(User.id > last).order_by(User.id).limit(batch_size)
+            ids = (await connection.execute(stmt)).scalars().all()
+        if not ids:
+            return
+        for user_id in ids:
+            yield user_id
+        last = ids[-1]
+
+
+async def rebalance(manager: DatabaseSessionManager, batch_size: int = settings.DB_RESHARD_BATCH_SIZE,
+                    grace: float = settings.DB_RESHARD_GRACE) -> int:
+
+    """
+    The rebalance function moves every user with a placement to the shard the hash ring assigns and drops
+    the placement. Users without a placement are on that shard already.
+
+    :param manager: DatabaseSessionManager: The databases
+    :param batch_size: int: The number of rows copied or deleted per statement
+    :param grace: float: Seconds to wait before the rows on the old shard of a user are deleted
+    :return: The number of users moved
+    :doc-author: Trelent
+    """
+
+    moved = 0
+    async for user_id in _user_ids(manager, batch_size):
+        async with manager._engine.connect() as connection:
+            pinned = await connection.execute(select(ShardPlacement.shard).where(ShardPlacement.user_id == user_id))
+            source = pinned.scalar_one_or_none()
+        if source is None:
+            continue
+        target = manager.shards.ring.shard_for(user_id)
+        await move_user(manager, user_id, target, batch_size, grace)
+        moved += source != target
+    return moved
+
+
+async def pin(manager: DatabaseSessionManager, batch_size: int = settings.DB_RESHARD_BATCH_SIZE) -> int:
+
+    """
+    The pin function stores the shard the current hash ring assigns as the placement of every user without one,
+    so the users stay where they are when the ring changes.
+
+    :param manager: DatabaseSessionManager: The databases
+    :param batch_size: int: The number of placements inserted per statement
+    :return: The number of users pinned
+    :doc-author: Trelent
+    """
+
+    pinned = 0
+    ring = manager.shards.ring
+    async with manager._engine.connect() as connection:
+        last = 0
+        while True:
+            stmt = (select(User.id).outerjoin(ShardPlacement, ShardPlacement.user_id == User.id)
+                    .where(User.id > last, ShardPlacement.user_id.is_(None)).order_by(User.id).limit(batch_size))
+            ids = (await connection.execute(stmt)).scalars().all()
+            if not ids:
+                return pinned
+            await connection.execute(insert(ShardPlacement), [{"user_id": user_id, "shard": ring.shard_for(user_id)}
+                                                              for user_id in ids])
+            await connection.commit()
+            pinned += len(ids)
+            last = ids[-1]
+
+
+async def init(manager: DatabaseSessionManager, id_stride: int = 0) -> None:
+
+    """
+    The init function creates the sharded tables on every shard. With an id stride the contact ids of the
+    shard at position n of DB_SHARD_URLS start at n * id_stride + 1, moved rows keep their ids, so the shards
+    must not hand out the same ids. SQLite shards keep their ids.
+
+    :param manager: DatabaseSessionManager: The databases
+    :param id_stride: int: The size of the id range of a shard, 0 to leave the sequences alone
+    :return: None
+    :doc-author: Trelent
+    """
+
+    for position, engine in enumerate(manager.shards.engines.values()):
+        async with engine.begin() as connection:
+            await connection.run_sync(create_shard_schema)
+            if id_stride and connection.dialect.name == "postgresql":
+                await connection.exec_driver_sql(
+                    f"ALTER SEQUENCE contacts_id_seq RESTART WITH {position * id_stride + 1}")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m src.database.reshard", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=settings.DB_RESHARD_BATCH_SIZE)
+    parser.add_argument("--grace", type=float, default=settings.DB_RESHARD_GRACE)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("init").add_argument("--id-stride", type=int, default=0)
+    commands.add_parser("pin")
+    move = commands.add_parser("move")
+    move.add_argument("user_id", type=int)
+    move.add_argument("shard")
+    commands.add_parser("rebalance")
+    args = parser.parse_args()
+
+    if not sessionmanager.shards:
+        parser.error("DB_SHARD_URLS is not set")
+    try:
+        if args.command == "init":
+            await init(sessionmanager, args.id_stride)
+        elif args.command == "pin":
+            print(f"pinned {await pin(sessionmanager, args.batch_size)} users")
+        elif args.command == "move":
+            moved = await move_user(sessionmanager, args.user_id, args.shard, args.batch_size, args.grace)
+            print(f"moved {moved} contacts")
+        else:
+            print(f"moved {await rebalance(sessionmanager, args.batch_size, args.grace)} users")
+    finally:
+        await sessionmanager.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
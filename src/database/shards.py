@@ -0,0 +1,231 @@
+import bisect
+import hashlib
+from contextvars import ContextVar
+
+from sqlalchemy import Connection, event, inspect, select, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+
+from src.database.models import Base, Contact, ContactTombstone, ShardPlacement, User
+
+# the tables whose rows live on the shard of their user, every other table stays on the primary
+SHARDED_TABLES = frozenset((Contact.__tablename__, ContactTombstone.__tablename__))
+
+# the user the current request works for, set by the auth dependencies
+current_user_id: ContextVar[int | None] = ContextVar("current_user_id", default=None)
+
+
+def parse_shard_urls(spec: str) -> dict[str, str]:
+
+    """
+    The parse_shard_urls function reads the DB_SHARD_URLS setting, a comma separated list of name=url pairs.
+    The names are what the hash ring and the placements refer to, so a shard keeps its name when its url changes.
+
+    :param spec: str: The setting, for example "s0=postgresql+asyncpg://...,s1=postgresql+asyncpg://..."
+    :return: The urls of the shards by name
+    :doc-author: Trelent
+    """
+
+    shards = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, separator, url = part.partition("=")
+        if not separator or not name.strip() or not url.strip():
+            raise ValueError(f"Invalid shard {part.strip()!r}, expected name=url")
+        shards[name.strip()] = url.strip()
+    return shards
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class ShardRing:
+    """
+    A consistent hash ring over the shard names. Every shard owns vnodes points of the ring and a user belongs
+    to the first point after the hash of its id, so adding a shard only takes users away from the other shards,
+    about 1/n of them, and never moves a user between two old shards.
+    """
+
+    def __init__(self, names: list[str], vnodes: int = 64):
+        points = sorted((_hash(f"{name}#{index}"), name) for name in names for index in range(vnodes))
+        self._hashes = [point for point, _ in points]
+        self._names = [name for _, name in points]
+
+    def shard_for(self, user_id: int) -> str:
+
+        """
+        The shard_for function returns the shard the ring assigns to a user.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: The id of the user
+        :return: The name of the shard
+        :doc-author: Trelent
+        """
+
+        index = bisect.bisect(self._hashes, _hash(str(user_id)))
+        return self._names[index % len(self._names)]
+
+
+class ShardSet:
+    """
+    The shard engines of the contacts. A user lives on the shard of its placement row when it has one,
+    the placements pin users while they are moved between shards, and on the shard of the hash ring otherwise.
+    """
+
+    def __init__(self, engines: dict[str, AsyncEngine], vnodes: int = 64):
+        self.engines = engines
+        self.ring = ShardRing(list(engines), vnodes) if engines else None
+
+    def __bool__(self) -> bool:
+        return bool(self.engines)
+
+    def locate(self, connection: Connection, user_id: int) -> str:
+
+        """
+        The locate function returns the shard of a user, reading its placement through a connection to the primary.
+
+        :param self: Represent the instance of the class
+        :param connection: Connection: The primary connection of the session, so the lookup sees its transaction
+        :param user_id: int: The id of the user
+        :return: The name of the shard
+        :doc-author: Trelent
+        """
+
+        stmt = select(ShardPlacement.shard).where(ShardPlacement.user_id == user_id)
+        shard = connection.execute(stmt).scalar_one_or_none()
+        if shard is not None and shard in self.engines:
+            return shard
+        return self.ring.shard_for(user_id)
+
+    def locate_many(self, connection: Connection, user_ids: list[int]) -> dict[str, list[int]]:
+
+        """
+        The locate_many function groups users by shard, reading all their placements in one statement.
+
+        :param self: Represent the instance of the class
+        :param connection: Connection: A connection to the primary
+        :param user_ids: list[int]: The ids of the users
+        :return: The ids of the users by the name of their shard
+        :doc-author: Trelent
+        """
+
+        stmt = select(ShardPlacement.user_id, ShardPlacement.shard).where(ShardPlacement.user_id.in_(user_ids))
+        placements = dict(connection.execute(stmt).all())
+        shards: dict[str, list[int]] = {}
+        for user_id in user_ids:
+            shard = placements.get(user_id)
+            if shard not in self.engines:
+                shard = self.ring.shard_for(user_id)
+            shards.setdefault(shard, []).append(user_id)
+        return shards
+
+    async def close(self) -> None:
+
+        """
+        The close function closes all connections of the shard pools.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+
+        for engine in self.engines.values():
+            await engine.dispose()
+
+
+def _sharded(mapper, clause) -> bool:
+    if mapper is not None:
+        return mapper.persist_selectable.name in SHARDED_TABLES
+    table = getattr(clause, "table", None)
+    return table is not None and getattr(table, "name", None) in SHARDED_TABLES
+
+
+class RoutingSession(Session):
+    """
+    The session class of the application. With shards configured, statements on the contacts and tombstones
+    of a user go to the shard of the user, everything else goes to the bind of the session. The user is
+    session.info["user_id"] when set, the current_user_id of the request otherwise.
+
+    A session keeps one connection per shard it used. The shard connections are committed right before the
+    primary one, so whoever sees a contacts_version on the primary also sees the rows stamped with it.
+    """
+
+    def get_bind(self, mapper=None, *, clause=None, **kwargs):
+        shards = self.info.get("shards")
+        if not shards or not _sharded(mapper, clause):
+            return super().get_bind(mapper, clause=clause, **kwargs)
+        user_id = self.info.get("user_id", current_user_id.get())
+        if user_id is None:
+            raise RuntimeError("The contacts are sharded but the session does not know its user")
+        placements = self.info.setdefault("placements", {})
+        if user_id not in placements:
+            placements[user_id] = shards.locate(self.connection(), user_id)
+        connections = self.info.setdefault("shard_connections", {})
+        name = placements[user_id]
+        if name not in connections:
+            connection = shards.engines[name].sync_engine.connect()
+            connection.begin()
+            connections[name] = connection
+        return connections[name]
+
+
+def _placement_statement(orm_execute_state) -> bool:
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ is not User:
+        return False
+    return orm_execute_state.is_update or (orm_execute_state.is_select
+                                           and orm_execute_state.statement._for_update_arg is not None)
+
+
+def _forget_placements(orm_execute_state):
+    # a write locks the user row first; a move holds that lock until its placement is committed,
+    # so the placement read after the lock is the one the write has to use
+    if _placement_statement(orm_execute_state):
+        orm_execute_state.session.info.pop("placements", None)
+
+
+def _commit_shards(session):
+    if session.in_nested_transaction():
+        return
+    session.flush()
+    for connection in session.info.get("shard_connections", {}).values():
+        if connection.in_transaction():
+            connection.commit()
+
+
+def _close_shards(session, transaction):
+    if transaction.parent is not None:
+        return
+    for connection in session.info.pop("shard_connections", {}).values():
+        connection.close()
+
+
+def create_shard_schema(connection: Connection) -> None:
+
+    """
+    The create_shard_schema function creates the sharded tables on a shard. The users table is created too,
+    because the sharded tables reference it, and on databases that enforce foreign keys the references
+    are dropped again, the users stay on the primary.
+
+    :param connection: Connection: A connection to the shard
+    :return: None
+    :doc-author: Trelent
+    """
+
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    tables = [User.__table__, Contact.__table__, ContactTombstone.__table__]
+    Base.metadata.create_all(connection, tables=tables)
+    if connection.dialect.name == "sqlite":
+        return
+    inspector = inspect(connection)
+    for name in sorted(SHARDED_TABLES):
+        for foreign_key in inspector.get_foreign_keys(name):
+            connection.execute(text(f'ALTER TABLE {name} DROP CONSTRAINT "{foreign_key["name"]}"'))
+
+
+event.listen(RoutingSession, "do_orm_execute", _forget_placements)
+event.listen(RoutingSession, "before_commit", _commit_shards)
+event.listen(RoutingSession, "after_transaction_end", _close_shards)
@@ -1,135 +1,527 @@
-from typing import List
+import base64
+import binascii
+import calendar
+import json
+from datetime import date, timedelta
+from typing import AsyncIterator, List, Sequence
 
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Row, case, delete, insert, or_, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
 from sqlalchemy.future import select
 
-from src.database.models import Contact, User
-from src.schemas.schemas import ContactCreate, ContactUpdate, ContactStatusUpdate
+from src.database.models import Contact, ContactTombstone, User
+from src.schemas.schemas import (ContactBatchOperation, ContactCreate, ContactUpdate, ContactStatusUpdate,
+                                 Principal)
+from src.services.events import contact_events
 
 
-async def get_contacts(skip: int, limit: int, user: User, db: AsyncSession) -> List[Contact]:
+async def get_contacts_version(user: User | Principal, db: AsyncSession) -> int:
+
+    """
+    The get_contacts_version function returns the version of the user's address book.
+    The version grows with every committed change to the user's contacts, so it can stand in
+    for the whole collection when deciding whether a client copy is still current.
+
+    :param user: User | Principal: The owner of the contacts, only its id is used
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The current version
+    :doc-author: Trelent
+    """
+
+    result = await db.execute(select(User.contacts_version).filter_by(id=user.id))
+    return result.scalar_one_or_none() or 0
+
+
+async def _next_version(user: User | Principal, db: AsyncSession) -> int:
+
+    """
+    The _next_version function bumps the contacts version of the user and returns the new value.
+    It must run before the write it versions: the UPDATE locks the user row until commit,
+    so writes of one user are serialized and versions become visible in commit order.
+
+    :param user: User | Principal: The owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The version to stamp the written rows with
+    :doc-author: Trelent
+    """
+
+    stmt = (update(User).where(User.id == user.id).values(contacts_version=User.contacts_version + 1)
+            .returning(User.contacts_version).execution_options(synchronize_session=False))
+    return (await db.execute(stmt)).scalar_one()
+
+
+async def _add_tombstones(ids: Sequence[int], version: int, user: User | Principal, db: AsyncSession) -> None:
+    if ids:
+        await db.execute(insert(ContactTombstone), [{"contact_id": contact_id, "user_id": user.id,
+                                                     "change_seq": version} for contact_id in ids])
+
+
+def _event(kind: str, ids: Sequence[int], version: int) -> dict:
+    return {"type": kind, "ids": list(ids), "version": version}
+
+
+async def _finish(contact: Contact | None, kind: str, version: int, user: User | Principal,
+                  db: AsyncSession) -> Contact | None:
+    # Nothing was written when the contact does not exist, so the version bump is rolled back too
+    if contact is None:
+        await db.rollback()
+        return None
+    await db.commit()
+    await contact_events.publish(user.id, [_event(kind, [contact.id], version)])
+    return contact
+
+
+async def get_contacts(skip: int, limit: int, user: User | Principal, db: AsyncSession) -> List[Contact]:
 
     """
     The get_contacts function returns a list of contacts for the given user.
 
     :param skip: int: Skip a number of contacts in the database
     :param limit: int: Limit the number of contacts returned
-    :param user: User: Filter the contacts by user
+    :param user: User | Principal: Filter the contacts by user, only its id is used
     :param db: AsyncSession: Pass the database session to the function
     :return: A list of contact objects
     :doc-author: Trelent
     """
 
-    stmt = select(Contact).filter_by(user=user).offset(skip).limit(limit)
+    stmt = select(Contact).filter_by(user_id=user.id).offset(skip).limit(limit)
     contacts = await db.execute(stmt)
     return contacts.scalars().all()
     
 
-async def get_contact(contact_id: int, user: User, db: AsyncSession) -> Contact:
+CURSOR_SORT_COLUMNS = {
+    "id": Contact.id,
+    "first_name": Contact.first_name,
+    "last_name": Contact.last_name,
+}
+
+
+def encode_cursor(sort: str, contact: Contact) -> str:
+
+    """
+    The encode_cursor function builds an opaque cursor pointing just after the given contact.
+
+    :param sort: str: The name of the sort column
+    :param contact: Contact: The last contact of the current page
+    :return: A url-safe cursor string
+    :doc-author: Trelent
+    """
+
+    position = [getattr(contact, sort), contact.id] if sort != "id" else [contact.id]
+    raw = json.dumps({"s": sort, "p": position}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, sort: str) -> list:
+
+    """
+    The decode_cursor function returns the position stored in a cursor.
+    It raises ValueError if the cursor is malformed or was issued for another sort column.
+
+    :param cursor: str: The cursor returned with the previous page
+    :param sort: str: The name of the sort column of the current request
+    :return: The sort key of the last contact of the previous page
+    :doc-author: Trelent
+    """
+
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        position = data["p"]
+        expected = 1 if sort == "id" else 2
+        if data["s"] != sort or not isinstance(position, list) or len(position) != expected:
+            raise ValueError("Cursor does not match the sort order")
+        return position
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError, KeyError, TypeError) as err:
+        raise ValueError("Invalid cursor") from err
+
+
+async def get_contacts_page(limit: int, user: User | Principal, db: AsyncSession, cursor: str | None = None,
+                            sort: str = "id") -> tuple[List[Contact], str | None]:
+
+    """
+    The get_contacts_page function returns one page of the user's contacts using keyset pagination.
+    Instead of skipping rows it seeks past the (sort column, id) of the previous page's last contact,
+    so with the (user_id, sort column, id) indexes every page costs the same as the first one.
+
+    :param limit: int: Limit the number of contacts returned
+    :param user: User | Principal: Filter the contacts by user, only its id is used
+    :param db: AsyncSession: Pass the database session to the function
+    :param cursor: str | None: The cursor returned with the previous page, None for the first page
+    :param sort: str: The name of the sort column, one of CURSOR_SORT_COLUMNS
+    :return: The contacts of the page and the cursor of the next page, or None on the last page
+    :doc-author: Trelent
+    """
+
+    if limit < 1:
+        raise ValueError("Limit must be positive")
+    column = CURSOR_SORT_COLUMNS[sort]
+    stmt = select(Contact).filter_by(user_id=user.id)
+    if cursor:
+        position = decode_cursor(cursor, sort)
+        if sort == "id":
+            stmt = stmt.where(Contact.id > position[0])
+        else:
+            stmt = stmt.where(tuple_(column, Contact.id) > tuple_(*position))
+    order_by = (Contact.id,) if sort == "id" else (column, Contact.id)
+    stmt = stmt.order_by(*order_by).limit(limit + 1)
+    result = await db.execute(stmt)
+    contacts = result.scalars().all()
+    if len(contacts) <= limit:
+        return contacts, None
+    contacts = contacts[:limit]
+    return contacts, encode_cursor(sort, contacts[-1])
+
+
+async def get_changes(since: int, limit: int, user: User | Principal,
+                      db: AsyncSession) -> tuple[List[Contact], List[int], int, bool]:
+
+    """
+    The get_changes function returns the user's contacts created or updated and the ids of contacts deleted
+    after the given contacts version. Changes are returned in whole versions, so one page may hold
+    more than limit contacts when a single write (an import or a batch) touched many rows.
+
+    :param since: int: The version the client is synchronized to, 0 for a full sync
+    :param limit: int: The number of changed contacts after which the page is closed
+    :param user: User | Principal: Filter the changes by user, only its id is used
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The changed contacts, the deleted ids, the version to pass next time and whether more changes follow
+    :doc-author: Trelent
+    """
+
+    if limit < 1:
+        raise ValueError("Limit must be positive")
+    # The version is read first, rows committed after it are left for the next call
+    version = await get_contacts_version(user, db)
+    if since > version:
+        raise ValueError("Unknown sync token")
+    stmt = (select(Contact.change_seq).where(Contact.user_id == user.id, Contact.change_seq > since,
+                                             Contact.change_seq <= version)
+            .order_by(Contact.change_seq).offset(limit - 1).limit(1))
+    upto = (await db.execute(stmt)).scalar_one_or_none() or version
+
+    stmt = (select(Contact).where(Contact.user_id == user.id, Contact.change_seq > since, Contact.change_seq <= upto)
+            .order_by(Contact.change_seq, Contact.id))
+    contacts = (await db.execute(stmt)).scalars().all()
+    stmt = (select(ContactTombstone.contact_id)
+            .where(ContactTombstone.user_id == user.id, ContactTombstone.change_seq > since,
+                   ContactTombstone.change_seq <= upto)
+            .order_by(ContactTombstone.change_seq, ContactTombstone.contact_id))
+    deleted = (await db.execute(stmt)).scalars().all()
+    return contacts, deleted, upto, upto < version
+
+
+# The rows come back from RETURNING, so there is nothing to synchronize in the session
+RETURNING_OPTIONS = {"synchronize_session": False, "populate_existing": True}
+
+EXPORT_COLUMNS = (Contact.id, Contact.first_name, Contact.last_name, Contact.email, Contact.phone, Contact.birthday,
+                  Contact.other_information, Contact.done, Contact.created_at, Contact.update_at)
+
+
+async def stream_contacts(user: User | Principal, db: AsyncSession,
+                          batch_size: int = 1000) -> AsyncIterator[Sequence[Row]]:
+
+    """
+    The stream_contacts function yields all contacts of the user in batches of plain column rows.
+    It uses a server-side cursor, so memory use does not depend on the size of the address book.
+
+    :param user: User | Principal: Filter the contacts by user, only its id is used
+    :param db: AsyncSession: Pass the database session to the function
+    :param batch_size: int: The number of rows fetched from the cursor at a time
+    :return: An async iterator of row batches with the EXPORT_COLUMNS
+    :doc-author: Trelent
+    """
+
+    stmt = (select(*EXPORT_COLUMNS).filter_by(user_id=user.id).order_by(Contact.id)
+            .execution_options(yield_per=batch_size))
+    result = await db.stream(stmt)
+    async for partition in result.partitions():
+        yield partition
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+async def search_contacts(user: User | Principal, db: AsyncSession, first_name: str | None = None,
+                          last_name: str | None = None, email: str | None = None,
+                          skip: int = 0, limit: int = 100) -> List[Contact]:
+
+    """
+    The search_contacts function returns the contacts of the user that contain all of the given substrings.
+    Matching is case-insensitive and runs in the database: ILIKE backed by pg_trgm GIN indexes on PostgreSQL,
+    LIKE on SQLite.
+
+    :param user: User | Principal: Filter the contacts by user, only its id is used
+    :param db: AsyncSession: Pass the database session to the function
+    :param first_name: str | None: Substring of the first name
+    :param last_name: str | None: Substring of the last name
+    :param email: str | None: Substring of the email
+    :param skip: int: Skip a number of matching contacts
+    :param limit: int: Limit the number of contacts returned
+    :return: A list of contact objects
+    :doc-author: Trelent
+    """
+
+    stmt = select(Contact).filter_by(user_id=user.id)
+    for column, value in ((Contact.first_name, first_name), (Contact.last_name, last_name), (Contact.email, email)):
+        if value:
+            stmt = stmt.where(column.ilike(f"%{_escape_like(value)}%", escape="\\"))
+    stmt = stmt.order_by(Contact.id).offset(skip).limit(limit)
+    contacts = await db.execute(stmt)
+    return contacts.scalars().all()
+
+
+def _month_day(day: date) -> int:
+    return day.month * 100 + day.day
+
+
+async def get_upcoming_birthdays(days: int, user: User | Principal, db: AsyncSession, skip: int = 0,
+                                 limit: int = 100, today: date | None = None) -> List[Contact]:
+
+    """
+    The get_upcoming_birthdays function returns the contacts whose birthday falls within the next days days,
+    today included, ordered by how soon the birthday comes.
+    It is a range scan over the indexed birthday_md column. A window that crosses the new year
+    is split into two ranges, and a February 29 birthday counts as February 28 in non-leap years.
+
+    :param days: int: The number of days after today to look ahead
+    :param user: User | Principal: Filter the contacts by user, only its id is used
+    :param db: AsyncSession: Pass the database session to the function
+    :param skip: int: Skip the first n contacts
+    :param limit: int: Limit the number of contacts returned
+    :param today: date | None: The first day of the window, the current date by default
+    :return: A list of contacts
+    :doc-author: Trelent
+    """
+
+    today = today or date.today()
+    stmt = _birthday_window(select(Contact).filter_by(user_id=user.id), days, today)
+    stmt = stmt.offset(skip).limit(limit)
+    contacts = await db.execute(stmt)
+    return contacts.scalars().all()
+
+
+async def get_upcoming_birthdays_of_users(days: int, user_ids: Sequence[int], db: AsyncSession | AsyncConnection,
+                                          today: date) -> List[Row]:
+
+    """
+    The get_upcoming_birthdays_of_users function returns the upcoming birthdays of the contacts of many users
+    in one statement, grouped by user and ordered by how soon the birthday comes within every user.
+    It reads the columns a birthday reminder needs, not whole contacts.
+
+    :param days: int: The number of days after today to look ahead
+    :param user_ids: Sequence[int]: The ids of the users
+    :param db: AsyncSession | AsyncConnection: The session or connection of the database the contacts are on
+    :param today: date: The first day of the window
+    :return: Rows of user_id, id, first_name, last_name and birthday
+    :doc-author: Trelent
+    """
+
+    stmt = select(Contact.user_id, Contact.id, Contact.first_name, Contact.last_name, Contact.birthday)
+    stmt = _birthday_window(stmt.where(Contact.user_id.in_(user_ids)), days, today, Contact.user_id)
+    return (await db.execute(stmt)).all()
+
+
+def _birthday_window(stmt, days: int, today: date, *order_first):
+    if days < 365:
+        end = today + timedelta(days=days)
+        start_md, end_md = _month_day(today), _month_day(end)
+        if end.month == 2 and end.day == 28 and not calendar.isleap(end.year):
+            end_md = 229
+        if start_md <= end_md:
+            stmt = stmt.where(Contact.birthday_md.between(start_md, end_md))
+        else:
+            stmt = stmt.where(or_(Contact.birthday_md >= start_md, Contact.birthday_md <= end_md))
+    order = case((Contact.birthday_md < _month_day(today), 1), else_=0)
+    return stmt.order_by(*order_first, order, Contact.birthday_md, Contact.id)
+
+
+async def get_contact(contact_id: int, user: User | Principal, db: AsyncSession, for_update: bool = False) -> Contact:
     
     """
     The get_contact function returns a contact from the database.
 
     :param contact_id: int: Specify the id of the contact to be retrieved
-    :param user: User: Ensure that the user is only able to access contacts they have created
+    :param user: User | Principal: Ensure that the user is only able to access contacts they have created
     :param db: AsyncSession: Pass the database session to the function
+    :param for_update: bool: Lock the row until the end of the transaction
     :return: A contact object, which is the contact with the given id
     :doc-author: Trelent
     """
 
-    stmt = select(Contact).filter_by(id=contact_id, user=user)
+    stmt = select(Contact).filter_by(id=contact_id, user_id=user.id)
+    if for_update:
+        # Writes lock the owner's row in _next_version before they touch a contact, take the locks in the same order
+        await db.execute(select(User.id).filter_by(id=user.id).with_for_update())
+        stmt = stmt.with_for_update()
     contact = await db.execute(stmt)
     return contact.scalar_one_or_none()
 
 
-async def create_contact(body: ContactCreate, user: User, db: AsyncSession) -> Contact:
+async def create_contact(body: ContactCreate, user: User | Principal, db: AsyncSession) -> Contact:
     
     """
     The create_contact function creates a new contact for the user.
+    The row is inserted and read back with a single INSERT ... RETURNING.
 
     :param body: ContactCreate: Pass the request body to the function
-    :param user: User: Get the user_id from the logged in user
+    :param user: User | Principal: Get the user_id from the logged in user
     :param db: AsyncSession: Pass the database session to the function
     :return: A contact object
     :doc-author: Trelent
     """
     
-    contact = Contact(user_id=user.id, **body.model_dump(exclude_unset=True))
-    db.add(contact)
+    version = await _next_version(user, db)
+    stmt = (insert(Contact).values(user_id=user.id, change_seq=version, **body.model_dump(exclude_unset=True))
+            .returning(Contact))
+    result = await db.execute(stmt)
+    contact = result.scalar_one()
     await db.commit()
-    await db.refresh(contact)
+    await contact_events.publish(user.id, [_event("created", [contact.id], version)])
     return contact
 
 
-async def update_contact(contact_id: int, body: ContactUpdate, user: User, db: AsyncSession) -> Contact | None:
+async def create_contacts(bodies: List[ContactCreate], user: User | Principal, db: AsyncSession) -> List[int]:
+
+    """
+    The create_contacts function creates many contacts for the user with a single multi-row INSERT ... RETURNING
+    and commits them. If any row violates a constraint, nothing is inserted and IntegrityError is raised.
+
+    :param bodies: List[ContactCreate]: The validated contacts to create
+    :param user: User | Principal: Get the user_id from the logged in user
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The ids of the new contacts
+    :doc-author: Trelent
+    """
+
+    version = await _next_version(user, db)
+    rows = [dict(body.model_dump(), user_id=user.id, change_seq=version) for body in bodies]
+    result = await db.execute(insert(Contact).returning(Contact.id), rows)
+    ids = result.scalars().all()
+    await db.commit()
+    await contact_events.publish(user.id, [_event("created", ids, version)])
+    return ids
+
+
+async def update_contact(contact_id: int, body: ContactUpdate, user: User | Principal, db: AsyncSession) -> Contact | None:
     
     """
-    The update_contact function updates a contact in the database.
+    The update_contact function updates a contact in the database with a single UPDATE ... RETURNING.
         Args:
             contact_id (int): The id of the contact to update.
             body (ContactUpdate): A ContactUpdate object containing all fields that can be updated for a given user's contacts.
 
     :param contact_id: int: Specify the id of the contact to be updated
     :param body: ContactUpdate: Get the new values for the contact
-    :param user: User: Make sure that the user is only able to update their own contacts
+    :param user: User | Principal: Make sure that the user is only able to update their own contacts
     :param db: AsyncSession: Create a database connection
     :return: The updated contact
     :doc-author: Trelent
     """
 
-    stmt = select(Contact).filter_by(id=contact_id, user=user)
+    version = await _next_version(user, db)
+    stmt = (update(Contact).where(Contact.id == contact_id, Contact.user_id == user.id)
+            .values(change_seq=version, **body.model_dump()).returning(Contact)
+            .execution_options(**RETURNING_OPTIONS))
     result = await db.execute(stmt)
-    contact = result.scalar_one_or_none()
-    if contact:
-        contact.first_name=body.first_name,
-        contact.last_name=body.last_name,
-        contact.email=body.email,
-        contact.phone=body.phone,
-        contact.birthday=body.birthday,
-        contact.other_information=body.other_information
-        contact.done = body.done
-        await db.commit()
-    return contact
+    return await _finish(result.scalar_one_or_none(), "updated", version, user, db)
 
 
-async def update_status_contact(contact_id: int, body: ContactStatusUpdate, user: User, db: AsyncSession) -> Contact | None:
+async def update_status_contact(contact_id: int, body: ContactStatusUpdate, user: User | Principal, db: AsyncSession) -> Contact | None:
     
     """
-    The update_status_contact function updates the status of a contact.
+    The update_status_contact function updates the status of a contact with a single UPDATE ... RETURNING.
 
     :param contact_id: int: Identify the contact to update
     :param body: ContactStatusUpdate: Get the value of done from the request body
-    :param user: User: Make sure that the user is authenticated and authorized to access this endpoint
+    :param user: User | Principal: Make sure that the user is authenticated and authorized to access this endpoint
     :param db: AsyncSession: Pass the database session to the function
     :return: A contact object if the contact is found, otherwise it returns none
     :doc-author: Trelent
     """
     
-    stmt = select(Contact).filter_by(id=contact_id, user=user)
+    version = await _next_version(user, db)
+    stmt = (update(Contact).where(Contact.id == contact_id, Contact.user_id == user.id)
+            .values(done=body.done, change_seq=version).returning(Contact).execution_options(**RETURNING_OPTIONS))
     result = await db.execute(stmt)
-    contact = result.scalar_one_or_none()
-    if contact:
-        contact.done = body.done
-        await db.commit()
-    return contact
+    return await _finish(result.scalar_one_or_none(), "updated", version, user, db)
 
 
-async def remove_contact(contact_id: int, user: User, db: AsyncSession)  -> Contact | None:
+async def remove_contact(contact_id: int, user: User | Principal, db: AsyncSession)  -> Contact | None:
     
     """
-    The remove_contact function removes a contact from the database.
+    The remove_contact function removes a contact from the database with a single DELETE ... RETURNING.
+    A tombstone is recorded in the same transaction, so delta sync can report the deletion.
 
     :param contact_id: int: Specify the id of the contact to be removed
-    :param user: User: Identify the user that is making the request
+    :param user: User | Principal: Identify the user that is making the request
     :param db: AsyncSession: Pass in the database session object
     :return: The contact that was removed
     :doc-author: Trelent
     """
     
-    stmt = select(Contact).filter_by(id=contact_id, user=user)
+    version = await _next_version(user, db)
+    stmt = (delete(Contact).where(Contact.id == contact_id, Contact.user_id == user.id)
+            .returning(Contact).execution_options(**RETURNING_OPTIONS))
     result = await db.execute(stmt)
     contact = result.scalar_one_or_none()
     if contact:
-        await db.delete(contact)
-        await db.commit()
-    return contact
+        await _add_tombstones([contact.id], version, user, db)
+    return await _finish(contact, "deleted", version, user, db)
+
+
+async def apply_contact_batch(operations: List[ContactBatchOperation], user: User | Principal,
+                              db: AsyncSession) -> set[int]:
+
+    """
+    The apply_contact_batch function applies many status updates, full updates and deletes in one transaction.
+    Work is done per kind of operation rather than per contact: one UPDATE ... WHERE id IN (...) per status value,
+    one ownership check plus one executemany UPDATE for the full updates and one DELETE ... WHERE id IN (...).
+    Every statement is scoped to the user, so contacts of other users are never touched.
+    All changed rows share one contacts version and deleted rows get tombstones.
+
+    :param operations: List[ContactBatchOperation]: The operations, at most one per contact
+    :param user: User | Principal: Make sure that the user is only able to change their own contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The ids of the contacts that were found and changed
+    :doc-author: Trelent
+    """
+
+    updated = set()
+    deleted = []
+    statuses = {}
+    updates = {}
+    deletes = []
+    for operation in operations:
+        if operation.op == "status":
+            statuses.setdefault(operation.body.done, []).append(operation.id)
+        elif operation.op == "update":
+            updates[operation.id] = operation.body
+        else:
+            deletes.append(operation.id)
+
+    version = await _next_version(user, db)
+    for value, ids in statuses.items():
+        stmt = (update(Contact).where(Contact.id.in_(ids), Contact.user_id == user.id)
+                .values(done=value, change_seq=version)
+                .returning(Contact.id).execution_options(synchronize_session=False))
+        updated.update((await db.execute(stmt)).scalars().all())
+    if updates:
+        stmt = select(Contact.id).where(Contact.id.in_(updates), Contact.user_id == user.id)
+        owned = (await db.execute(stmt)).scalars().all()
+        if owned:
+            await db.execute(update(Contact), [dict(updates[contact_id].model_dump(), id=contact_id,
+                                                    change_seq=version) for contact_id in owned])
+            updated.update(owned)
+    if deletes:
+        stmt = (delete(Contact).where(Contact.id.in_(deletes), Contact.user_id == user.id)
+                .returning(Contact.id).execution_options(synchronize_session=False))
+        deleted = (await db.execute(stmt)).scalars().all()
+        await _add_tombstones(deleted, version, user, db)
+    if not updated and not deleted:
+        await db.rollback()
+        return set()
+    await db.commit()
+    await contact_events.publish(user.id, [_event(kind, sorted(ids), version)
+                                           for kind, ids in (("updated", updated), ("deleted", deleted)) if ids])
+    return updated | set(deleted)
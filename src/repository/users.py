@@ -4,6 +4,7 @@ from sqlalchemy.future import select
 
 from src.database.models import User
 from src.schemas.schemas import UserModel
+from src.services.cache import principal_cache
 
 
 async def get_user_by_email(email: str, db: AsyncSession) -> User:
@@ -65,6 +66,7 @@ async def confirmed_email(email: str, db: AsyncSession) -> None:
     if user:
         user.confirmed = True
         await db.commit()
+        await principal_cache.invalidate(email)
 
     
 async def update_token(user: User, token: str | None, db: AsyncSession) -> None:
@@ -81,6 +83,7 @@ async def update_token(user: User, token: str | None, db: AsyncSession) -> None:
     
     user.refresh_token = token
     await db.commit()
+    await principal_cache.invalidate(user.email)
 
 async def update_avatar(email, url: str, db: AsyncSession) -> User:
     
@@ -99,12 +102,34 @@ async def update_avatar(email, url: str, db: AsyncSession) -> User:
         user.avatar = url
         await db.commit()
         await db.refresh(user)
+        await principal_cache.invalidate(email)
+        return user
+
+async def update_timezone(email, timezone: str, db: AsyncSession) -> User:
+
+    """
+    The update_timezone function sets the time zone the birthday digest of a user is sent in.
+
+    :param email: Find the user in the database
+    :param timezone: str: The IANA name of the time zone
+    :param db: AsyncSession: Pass the database session to the function
+    :return: A user object
+    :doc-author: Trelent
+    """
+
+    user = await get_user_by_email(email, db)
+    if user:
+        user.timezone = timezone
+        await db.commit()
+        await db.refresh(user)
+        await principal_cache.invalidate(email)
         return user
 
 async def update_password(email, password: str | None, db: AsyncSession) -> User:
     
     """
     The update_password function updates the password of a user.
+    It also bumps the token version, which revokes access tokens issued in claims principal mode.
 
     :param email: Find the user in the database
     :param password: str | None: Set the password of a user
@@ -116,6 +141,8 @@ async def update_password(email, password: str | None, db: AsyncSession) -> User
     user = await get_user_by_email(email, db)
     if user:
         user.password = password
+        user.token_version = (user.token_version or 0) + 1
         await db.commit()
         await db.refresh(user)
+        await principal_cache.invalidate(email)
         return user
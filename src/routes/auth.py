@@ -2,22 +2,22 @@ from typing import List
 
 from fastapi import APIRouter, HTTPException, Depends, status, Security
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
-from fastapi import APIRouter, HTTPException, Depends, status, Security, BackgroundTasks, Request
+from fastapi import APIRouter, HTTPException, Depends, status, Security, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.schemas.schemas import UserModel, UserResponse, TokenModel, RequestEmail
 from src.repository import users as repository_users
 from src.services.auth import auth_service
-from src.services.email import send_confirm_email, send_reset_email, send_update_email
+from src.services.hashing import password_hasher
+from src.services.outbox import email_outbox
 
 router = APIRouter(prefix='/auth', tags=["auth"])
 security = HTTPBearer()
 
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def signup(body: UserModel, background_tasks: BackgroundTasks,
-                 request: Request, db: AsyncSession = Depends(get_db)):
+async def signup(body: UserModel, request: Request, db: AsyncSession = Depends(get_db)):
     
     """
     The signup function creates a new user in the database.
@@ -27,7 +27,6 @@ async def signup(body: UserModel, background_tasks: BackgroundTasks,
         A new user record is created with this information and returned to the client.
 
     :param body: UserModel: Get the request body
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base url of the server
     :param db: AsyncSession: Get the database session
     :return: A dictionary with the user and a detail message
@@ -37,9 +36,9 @@ async def signup(body: UserModel, background_tasks: BackgroundTasks,
     exist_user = await repository_users.get_user_by_email(body.email, db)
     if exist_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await password_hasher.hash(body.password)
     new_user = await repository_users.create_user(body, db)
-    background_tasks.add_task(send_confirm_email, new_user.email, new_user.username, request.base_url)
+    await email_outbox.enqueue("confirm", new_user.email, new_user.username, str(request.base_url))
     return {"user": new_user, "detail": "User successfully created. Check your email for confirmation."}
 
 
@@ -62,10 +61,10 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession =
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Email not confirmed")
-    if not auth_service.verify_password(body.password, user.password):
+    if not await password_hasher.verify(body.password, user.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
     # Generate JWT
-    access_token = await auth_service.create_access_token(data={"sub": user.email})
+    access_token = await auth_service.create_access_token(data=auth_service.access_token_claims(user))
     refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
     await repository_users.update_token(user, refresh_token, db)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
@@ -96,7 +95,7 @@ async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(sec
         await repository_users.update_token(user, None, db)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
 
-    access_token = await auth_service.create_access_token(data={"sub": email})
+    access_token = await auth_service.create_access_token(data=auth_service.access_token_claims(user))
     refresh_token = await auth_service.create_refresh_token(data={"sub": email})
     await repository_users.update_token(user, refresh_token, db)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
@@ -127,8 +126,7 @@ async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
     return {"message": "Email confirmed"}
 
 @router.post('/request_email')
-async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request,
-                        db: AsyncSession = Depends(get_db)):
+async def request_email(body: RequestEmail, request: Request, db: AsyncSession = Depends(get_db)):
     
     """
     The request_email function is used to send a confirmation email to the user.
@@ -136,7 +134,6 @@ async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, r
     The function also checks if the user has already confirmed their account, and returns an error message if they have.
 
     :param body: RequestEmail: Get the email from the request body
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks
     :param request: Request: Get the base url of the server
     :param db: AsyncSession: Get the database session
     :return: A message to the user
@@ -147,22 +144,19 @@ async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, r
     if user.confirmed:
         return {"message": "Your email is already confirmed"}
     if user:
-        background_tasks.add_task(send_confirm_email, user.email, user.username, request.base_url)
+        await email_outbox.enqueue("confirm", user.email, user.username, str(request.base_url))
     return {"message": "Check your email for confirmation."}
 
 @router.post("/forget_password")
-async def forget_password(background_tasks: BackgroundTasks, user: UserModel, request: Request,
-                            db: AsyncSession = Depends(get_db)):
+async def forget_password(user: UserModel, request: Request, db: AsyncSession = Depends(get_db)):
     
     """
     The forget_password function is used to send a reset password email to the user.
         The function takes in the following parameters:
-            background_tasks: BackgroundTasks,
             user: UserModel,
             request: Request,
             db: AsyncSession = Depends(get_db)
 
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks
     :param user: UserModel: Get the email from the user
     :param request: Request: Get the base url of the application
     :param db: AsyncSession: Pass in the database session
@@ -172,13 +166,12 @@ async def forget_password(background_tasks: BackgroundTasks, user: UserModel, re
     
     user_in_db = await repository_users.get_user_by_email(user.email, db)    
     if user_in_db:
-        background_tasks.add_task(send_reset_email, user_in_db.email, user_in_db.username, request.base_url)
+        await email_outbox.enqueue("reset", user_in_db.email, user_in_db.username, str(request.base_url))
     return {"message": "Check your email for reset password."}
     
 
 @router.post("/reset_password/{token:str}")
-async def reset_password(token: str, body: UserModel, background_tasks: BackgroundTasks, request: Request,
-                         db: AsyncSession = Depends(get_db)):
+async def reset_password(token: str, body: UserModel, request: Request, db: AsyncSession = Depends(get_db)):
     
     """
     The reset_password function is used to reset a user's password.
@@ -187,7 +180,6 @@ async def reset_password(token: str, body: UserModel, background_tasks: Backgrou
 
     :param token: str: Get the email of the user who requested a password reset
     :param body: UserModel: Get the user's new password
-    :param background_tasks: BackgroundTasks: Add a background task to the queue
     :param request: Request: Get the base_url of the application
     :param db: AsyncSession: Get the database session
     :return: A dict with a user and detail key
@@ -202,7 +194,7 @@ async def reset_password(token: str, body: UserModel, background_tasks: Backgrou
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
-    user.password = auth_service.get_password_hash(body.password)
-    updated_user = await repository_users.update_password(user, db)
-    background_tasks.add_task(send_update_email, user.email, user.username, request.base_url)
+    password = await password_hasher.hash(body.password)
+    updated_user = await repository_users.update_password(email, password, db)
+    await email_outbox.enqueue("update", user.email, user.username, str(request.base_url))
     return {"user": updated_user, "detail": "Password successfully reset. Check your email for confirmation."}
@@ -1,69 +1,341 @@
-from typing import List
-from datetime import datetime, timedelta
+import asyncio
+import json
+from typing import List, Literal
 
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import (APIRouter, HTTPException, Depends, Header, Path, Query, Request, Response, WebSocket,
+                     WebSocketDisconnect, status)
+from fastapi.responses import StreamingResponse
 from fastapi_limiter.depends import RateLimiter
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import and_, extract
 
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db
 from src.database.models import User
-from src.schemas.schemas import ContactCreate, ContactResponse, ContactStatusUpdate, ContactUpdate
+from src.database.shards import RoutingSession
+from src.schemas.schemas import (ContactBatchRequest, ContactBatchResult, ContactChanges, ContactCreate,
+                                 ContactImportResponse, ContactPage, ContactResponse, ContactStatusUpdate,
+                                 ContactUpdate, Principal)
 from src.repository import contacts as repository_contacts
+from src.services import etag, exporter, importer, serialization
 from src.services.auth import auth_service
+from src.services.events import contact_events, format_sse
+from src.services.response_cache import response_cache
+from config import settings
 
 router = APIRouter(prefix='/contacts', tags=["contacts"])
 
+IMPORT_CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+
+CACHE_CONTROL = "private, no-cache"
+
 
 class SomeDuplicateEmailException(Exception):
     pass
 
 
-@router.get("/", response_model=List[ContactResponse], description='No more than 10 requests per minute',
+def _not_modified(tag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": tag, "Cache-Control": CACHE_CONTROL})
+
+
+def _json_response(body: bytes, tag: str | None = None, status_code: int = status.HTTP_200_OK) -> Response:
+    headers = {"ETag": tag, "Cache-Control": CACHE_CONTROL} if tag else None
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+def _contact_response(contact, status_code: int = status.HTTP_200_OK) -> Response:
+    return _json_response(serialization.dump_contact(contact), etag.contact_etag(contact), status_code)
+
+
+def _contacts_response(contacts) -> Response:
+    return _json_response(serialization.dump_contacts(contacts))
+
+
+async def _check_if_match(if_match: str | None, contact_id: int, user: User | Principal, db: AsyncSession) -> None:
+    if if_match is None:
+        return
+    contact = await repository_contacts.get_contact(contact_id, user, db, for_update=True)
+    if contact is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
+    if not etag.match(if_match, etag.contact_etag(contact)):
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="Contact has been modified")
+
+
+@router.get("/", response_model=List[ContactResponse] | ContactPage, description='No more than 10 requests per minute',
             dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def read_contacts(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db),
-                        current_user: User = Depends(auth_service.get_current_user)):
+async def read_contacts(skip: int = 0, limit: int = 100, cursor: str | None = None,
+                        sort: Literal["id", "first_name", "last_name"] = "id",
+                        if_none_match: str | None = Header(None), db: AsyncSession = Depends(get_read_db),
+                        current_user: User | Principal = Depends(auth_service.get_current_principal)):
     
     """
     The read_contacts function returns a list of contacts.
+        Without a cursor it pages with skip and limit and returns a plain list.
+        With a cursor (an empty one for the first page) it uses keyset pagination and returns
+        a page envelope whose next_cursor is passed back to get the following page.
+        The ETag is derived from the contacts version of the user, so a matching If-None-Match
+        is answered with 304 before any contact is fetched.
+        The serialized response is cached in Redis under the same version,
+        so repeated reads of an unchanged address book skip the query and the validation.
 
     :param skip: int: Skip the first n contacts in the database
     :param limit: int: Limit the number of contacts returned
+    :param cursor: str | None: The next_cursor of the previous page, empty for the first page
+    :param sort: str: The column the cursor pages are ordered by
+    :param if_none_match: str | None: The ETag of the copy the client already has
     :param db: AsyncSession: Get the database session
-    :param current_user: User: Get the current user from the database
-    :return: A list of contacts
+    :param current_user: User | Principal: Get the current user from the database
+    :return: A list of contacts, or a page of contacts in cursor mode
     :doc-author: Trelent
     """
     
-    contacts = await repository_contacts.get_contacts(skip, limit, current_user, db)
-    return contacts
+    # The version is read before the rows, so the rows are never older than the tag
+    version = await repository_contacts.get_contacts_version(current_user, db)
+    tag = etag.collection_etag(current_user.id, version, skip, limit, cursor, sort)
+    if etag.none_match(if_none_match, tag):
+        return _not_modified(tag)
+    key = response_cache.key(current_user.id, version, "list", skip, limit, cursor, sort)
+    cached = await response_cache.get(key)
+    if cached is not None:
+        return _json_response(cached[1], tag)
+    if cursor is not None:
+        try:
+            contacts, next_cursor = await repository_contacts.get_contacts_page(limit, current_user, db, cursor, sort)
+        except ValueError as err:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
+        body = serialization.dump_page(contacts, next_cursor)
+    else:
+        contacts = await repository_contacts.get_contacts(skip, limit, current_user, db)
+        body = serialization.dump_contacts(contacts)
+    await response_cache.set(key, tag, body)
+    return _json_response(body, tag)
+
+
+@router.get("/search", response_model=List[ContactResponse])
+async def search_contacts(first_name: str | None = None, last_name: str | None = None, email: str | None = None,
+                          skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_read_db),
+                          current_user: User | Principal = Depends(auth_service.get_current_principal)):
+
+    """
+    The search_contacts function returns the contacts whose first name, last name and email
+    contain the given substrings, ignoring case. Omitted fields are not filtered on.
+    The matching runs in the database, so every page of the results is correct.
+
+    :param first_name: str | None: Substring of the first name
+    :param last_name: str | None: Substring of the last name
+    :param email: str | None: Substring of the email
+    :param skip: int: Skip the first n matching contacts
+    :param limit: int: Limit the number of contacts returned
+    :param db: AsyncSession: Get the database session
+    :param current_user: User | Principal: Get the current user
+    :return: A list of contacts
+    :doc-author: Trelent
+    """
+
+    contacts = await repository_contacts.search_contacts(current_user, db, first_name=first_name,
+                                                         last_name=last_name, email=email, skip=skip, limit=limit)
+    return _contacts_response(contacts)
+
+
+@router.get("/changes", response_model=ContactChanges)
+async def read_changes(since: int = Query(0, ge=0), limit: int = Query(500, ge=1, le=5000),
+                       db: AsyncSession = Depends(get_db),
+                       current_user: User | Principal = Depends(auth_service.get_current_principal)):
+
+    """
+    The read_changes function returns what changed in the user's address book since the given sync token.
+        Created and updated contacts are returned in full, deleted contacts by id only.
+        The next_token of the response is passed as since on the next call; while has_more is true
+        the client should call again right away. A token the server does not know returns 400,
+        and the client should start over with a full sync from 0.
+
+    :param since: int: The next_token of the previous sync, 0 for a full sync
+    :param limit: int: The approximate number of changed contacts per response
+    :param db: AsyncSession: Get the database session
+    :param current_user: User | Principal: Get the current user from the database
+    :return: The changes after the token
+    :doc-author: Trelent
+    """
+
+    try:
+        changed, deleted, next_token, has_more = await repository_contacts.get_changes(since, limit, current_user, db)
+    except ValueError as err:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
+    return {"changed": changed, "deleted": deleted, "next_token": next_token, "has_more": has_more}
+
+
+@router.get("/stream", response_class=StreamingResponse)
+async def stream_changes(current_user: User | Principal = Depends(auth_service.get_current_principal)):
+
+    """
+    The stream_changes function pushes the created, updated and deleted events of the user's contacts
+    as server-sent events, so clients do not have to poll. Each event names the contact ids and carries
+    the contacts version as its id; a resync event means events were dropped and the client should
+    catch up through /changes. A comment line is sent as a heartbeat when nothing happens.
+    When the client goes away the response is cancelled and the listener is removed.
+
+    :param current_user: User | Principal: Get the current user from the database
+    :return: A text/event-stream response
+    :doc-author: Trelent
+    """
+
+    queue = await contact_events.subscribe(current_user.id)
+
+    async def content():
+        try:
+            yield ": connected\n\n"
+            while True:
+                try:
+                    events = await asyncio.wait_for(queue.get(), timeout=settings.CONTACT_EVENTS_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield format_sse(events)
+        finally:
+            await contact_events.unsubscribe(current_user.id, queue)
+
+    return StreamingResponse(content(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.websocket("/stream")
+async def stream_changes_ws(websocket: WebSocket, token: str = Query(...), db: AsyncSession = Depends(get_db)):
+
+    """
+    The stream_changes_ws function is the WebSocket alternative to stream_changes.
+    Browsers cannot set headers on a WebSocket handshake, so the access token is passed as the token query parameter.
+    Every message is a JSON list with the events of one write; an empty list is a heartbeat sent when nothing happens.
+    The socket is read while waiting for events, so a client that goes away is noticed right away
+    and its listener is removed even if no more events arrive.
+
+    :param websocket: WebSocket: The client connection
+    :param token: str: The access token
+    :param db: AsyncSession: Get the database session, used only to authenticate
+    :return: None
+    :doc-author: Trelent
+    """
+
+    try:
+        current_user = await auth_service.get_current_principal(token, db)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    finally:
+        # The connection may stay open for hours, it must not hold a pooled database connection
+        await db.close()
+    await websocket.accept()
+    queue = await contact_events.subscribe(current_user.id)
+    receiver = asyncio.ensure_future(websocket.receive())
+    getter = None
+    try:
+        while True:
+            getter = getter or asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({receiver, getter}, timeout=settings.CONTACT_EVENTS_HEARTBEAT,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                await websocket.send_text("[]")
+                continue
+            if getter in done:
+                await websocket.send_text(json.dumps(getter.result()))
+                getter = None
+            if receiver in done:
+                if receiver.result()["type"] == "websocket.disconnect":
+                    break
+                # Clients have nothing to say on this socket, whatever they send is ignored
+                receiver = asyncio.ensure_future(websocket.receive())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        if getter is not None:
+            getter.cancel()
+        await contact_events.unsubscribe(current_user.id, queue)
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_contacts(format: Literal["csv", "ndjson"] = "csv", gzip: bool = False,
+                          db: AsyncSession = Depends(get_read_db),
+                          current_user: User | Principal = Depends(auth_service.get_current_principal)):
+
+    """
+    The export_contacts function streams the whole address book of the user as a CSV or NDJSON file.
+        Rows are read through a server-side cursor and written out as they arrive,
+        so memory use stays constant whatever the size of the address book.
+        The request session is closed before the body is sent, so the export
+        opens its own session on the same engine, routed to the shard of the user.
+
+    :param format: str: Either csv or ndjson
+    :param gzip: bool: Send a gzip-compressed file
+    :param db: AsyncSession: Get the database session
+    :param current_user: User | Principal: Get the current user
+    :return: A streaming response with the exported contacts
+    :doc-author: Trelent
+    """
+
+    bind = db.bind
+
+    async def content():
+        async with AsyncSession(bind, sync_session_class=RoutingSession,
+                                info={"shards": db.info.get("shards"), "user_id": current_user.id}) as session:
+            async for chunk in exporter.export_contacts(current_user, session, format, gzip):
+                yield chunk
+
+    filename = f"contacts.{format}" + (".gz" if gzip else "")
+    media_type = "application/gzip" if gzip else exporter.MEDIA_TYPES[format]
+    return StreamingResponse(content(), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
 
 
 @router.get("/{contact_id}", response_model=ContactResponse)
-async def read_contact(contact_id: int, db: AsyncSession = Depends(get_db),
-                       current_user: User = Depends(auth_service.get_current_user)):
+async def read_contact(contact_id: int, if_none_match: str | None = Header(None),
+                       db: AsyncSession = Depends(get_read_db),
+                       current_user: User | Principal = Depends(auth_service.get_current_principal)):
     
     """
     The read_contact function is used to retrieve a single contact from the database.
     It takes in an integer representing the id of the contact and returns a Contact object.
+    If the If-None-Match header matches the ETag of the contact, it returns 304 without a body.
+    When the response cache is enabled, the serialized contact is served from Redis
+    until the next write to the user's contacts.
 
     :param contact_id: int: Specify the contact to be updated
+    :param if_none_match: str | None: The ETag of the copy the client already has
     :param db: AsyncSession: Get the database session
-    :param current_user: User: Get the current user from the database
+    :param current_user: User | Principal: Get the current user from the database
     :return: A contact object
     :doc-author: Trelent
     """
     
+    key = None
+    if response_cache.enabled:
+        version = await repository_contacts.get_contacts_version(current_user, db)
+        key = response_cache.key(current_user.id, version, "contact", contact_id)
+        cached = await response_cache.get(key)
+        if cached is not None:
+            tag, body = cached
+            return _not_modified(tag) if etag.none_match(if_none_match, tag) else _json_response(body, tag)
     contact = await repository_contacts.get_contact(contact_id, current_user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
-    return contact
+    tag = etag.contact_etag(contact)
+    if etag.none_match(if_none_match, tag):
+        return _not_modified(tag)
+    body = serialization.dump_contact(contact)
+    if key is not None:
+        await response_cache.set(key, tag, body)
+    return _json_response(body, tag)
 
 
 @router.post("/", response_model=ContactResponse, status_code=status.HTTP_201_CREATED, description='No more than 2 contact per 5 minutes',
             dependencies=[Depends(RateLimiter(times=2, seconds=300))])
 async def create_contact(body: ContactCreate, db: AsyncSession = Depends(get_db),
-                         current_user: User = Depends(auth_service.get_current_user)):
+                         current_user: User | Principal = Depends(auth_service.get_current_principal)):
     
     """
     The create_contact function creates a new contact in the database.
@@ -72,75 +344,149 @@ async def create_contact(body: ContactCreate, db: AsyncSession = Depends(get_db)
 
     :param body: ContactCreate: Define the type of data that is expected to be passed in
     :param db: AsyncSession: Pass the database session to the repository layer
-    :param current_user: User: Get the user that is currently logged in
+    :param current_user: User | Principal: Get the user that is currently logged in
     :return: A contact object
     :doc-author: Trelent
     """
     
     try:
-        return await repository_contacts.create_contact(body, current_user, db)
+        contact = await repository_contacts.create_contact(body, current_user, db)
     except SomeDuplicateEmailException as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email or number value is not unique")
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+    return _contact_response(contact, status.HTTP_201_CREATED)
+
+
+@router.post("/import", response_model=ContactImportResponse, description='No more than 5 imports per hour',
+             dependencies=[Depends(RateLimiter(times=5, hours=1))],
+             openapi_extra={"requestBody": {"required": True, "content": {
+                 "text/csv": {"schema": {"type": "string"}},
+                 "application/x-ndjson": {"schema": {"type": "string"}},
+             }}})
+async def import_contacts(request: Request, format: Literal["csv", "ndjson"] | None = None,
+                          db: AsyncSession = Depends(get_db),
+                          current_user: User | Principal = Depends(auth_service.get_current_principal)):
+
+    """
+    The import_contacts function creates contacts from a CSV or NDJSON request body.
+        The format is taken from the format query parameter or else from the Content-Type header.
+        A CSV body starts with a header row naming the ContactCreate fields.
+        The body is parsed while it is received and rows are inserted in batches, so large
+        address books can be imported in one request. Rows that fail are listed in the report;
+        a header that cannot be read is answered with 400.
+
+    :param request: Request: Stream the request body
+    :param format: str | None: Either csv or ndjson
+    :param db: AsyncSession: Get the database session
+    :param current_user: User | Principal: Get the current user
+    :return: The number of created and failed rows and the errors of the failed rows
+    :doc-author: Trelent
+    """
+
+    if format is None:
+        content_type = request.headers.get("content-type", "").split(";")[0].strip()
+        format = IMPORT_CONTENT_TYPES.get(content_type)
+    if format is None:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail="Upload text/csv or application/x-ndjson")
+    try:
+        return await importer.import_contacts(request.stream(), format, current_user, db)
+    except ValueError as err:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
+
+
+@router.post("/batch", response_model=List[ContactBatchResult])
+async def batch_contacts(body: ContactBatchRequest, db: AsyncSession = Depends(get_db),
+                         current_user: User | Principal = Depends(auth_service.get_current_principal)):
+
+    """
+    The batch_contacts function applies a list of status updates, full updates and deletes in one request.
+        All operations run in one transaction with a handful of set-based statements,
+        so marking or deleting hundreds of contacts costs about as much as a single one.
+        If any update breaks a constraint, nothing is changed.
+
+    :param body: ContactBatchRequest: The operations, at most one per contact
+    :param db: AsyncSession: Get the database session
+    :param current_user: User | Principal: Get the current user
+    :return: The result of every operation, in request order
+    :doc-author: Trelent
+    """
+
+    try:
+        done = await repository_contacts.apply_contact_batch(body.operations, current_user, db)
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Email or number value is not unique")
+    return [{"id": operation.id, "op": operation.op, "status": "ok" if operation.id in done else "not_found"}
+            for operation in body.operations]
 
 
 @router.put("/{contact_id}", response_model=ContactResponse)
-async def update_contact(body: ContactUpdate, contact_id: int, db: AsyncSession = Depends(get_db),
-                         current_user: User = Depends(auth_service.get_current_user)):
+async def update_contact(body: ContactUpdate, contact_id: int, if_match: str | None = Header(None),
+                         db: AsyncSession = Depends(get_db),
+                         current_user: User | Principal = Depends(auth_service.get_current_principal)):
     
     """
     The update_contact function updates a contact in the database.
         It takes an id of the contact to update, and a body containing the fields to update.
         The function returns an updated Contact object.
+        With an If-Match header the contact is locked and updated only if its ETag still matches,
+        otherwise 412 is returned.
 
     :param body: ContactUpdate: Get the data from the request body
     :param contact_id: int: Get the contact id from the url
+    :param if_match: str | None: The ETag the client based the update on
     :param db: AsyncSession: Get the database session
-    :param current_user: User: Get the current user from the auth_service
+    :param current_user: User | Principal: Get the current user from the auth_service
     :return: A contact object
     :doc-author: Trelent
     """
     
+    await _check_if_match(if_match, contact_id, current_user, db)
     contact = await repository_contacts.update_contact(contact_id, body, current_user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
-    return contact
+    return _contact_response(contact)
 
 
 @router.patch("/{contact_id}", response_model=ContactResponse)
-async def update_status_contact(body: ContactStatusUpdate, contact_id: int, db: AsyncSession = Depends(get_db),
-                                current_user: User = Depends(auth_service.get_current_user)):
+async def update_status_contact(body: ContactStatusUpdate, contact_id: int, if_match: str | None = Header(None),
+                                db: AsyncSession = Depends(get_db),
+                                current_user: User | Principal = Depends(auth_service.get_current_principal)):
     
     """
     The update_status_contact function updates the status of a contact.
         The function takes in an id, body and db as parameters.
         It then calls the update_status_contact method from repository_contacts to update the status of a contact.
+        With an If-Match header the status is updated only if the ETag of the contact still matches.
 
     :param body: ContactStatusUpdate: Get the status of the contact from the request body
     :param contact_id: int: Get the contact by id
+    :param if_match: str | None: The ETag the client based the update on
     :param db: AsyncSession: Get the database session
-    :param current_user: User: Get the current user from the database
+    :param current_user: User | Principal: Get the current user from the database
     :return: The contact with the updated status
     :doc-author: Trelent
     """
     
+    await _check_if_match(if_match, contact_id, current_user, db)
     contact = await repository_contacts.update_status_contact(contact_id, body, current_user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
-    return contact
+    return _contact_response(contact)
 
 
 @router.delete("/{contact_id}", response_model=ContactResponse)
 async def remove_contact(contact_id: int, db: AsyncSession = Depends(get_db),
-                         current_user: User = Depends(auth_service.get_current_user)):
+                         current_user: User | Principal = Depends(auth_service.get_current_principal)):
     
     """
     The remove_contact function removes a contact from the database.
 
     :param contact_id: int: Specify the contact that is to be removed
     :param db: AsyncSession: Pass the database session to the function
-    :param current_user: User: Get the current user from the database
+    :param current_user: User | Principal: Get the current user from the database
     :return: A contact object
     :doc-author: Trelent
     """
@@ -148,12 +494,12 @@ async def remove_contact(contact_id: int, db: AsyncSession = Depends(get_db),
     contact = await repository_contacts.remove_contact(contact_id, current_user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
-    return contact
+    return _json_response(serialization.dump_contact(contact))
 
 
 @router.get("/?first_name={contact_first_name}", response_model=List[ContactResponse])
-async def search_contact_by_first_name(contact_first_name: str, skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db),
-                                       current_user: User = Depends(auth_service.get_current_user)):
+async def search_contact_by_first_name(contact_first_name: str, skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_read_db),
+                                       current_user: User | Principal = Depends(auth_service.get_current_principal)):
     
     """
     The search_contact_by_first_name function searches for contacts by first name.
@@ -166,21 +512,20 @@ async def search_contact_by_first_name(contact_first_name: str, skip: int = 0, l
     :param skip: int: Skip a number of records in the database
     :param limit: int: Limit the number of results returned
     :param db: AsyncSession: Get the database session
-    :param current_user: User: Get the current user from the auth_service
+    :param current_user: User | Principal: Get the current user from the auth_service
     :return: A list of contacts that match the search criteria
     :doc-author: Trelent
     """
     
-    contacts = await repository_contacts.get_contacts(skip, limit, current_user, db)
-    results = [contact for contact in contacts if contact_first_name.lower() in contact.first_name.lower()]
+    results = await repository_contacts.search_contacts(current_user, db, first_name=contact_first_name, skip=skip, limit=limit)
     if not results:
         raise HTTPException(status_code=404, detail="Contact not found")
-    return results
+    return _contacts_response(results)
 
 
 @router.get("/?last_name={contact_last_name}", response_model=List[ContactResponse])
-async def search_contact_by_last_name(contact_last_name: str, skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db),
-                                      current_user: User = Depends(auth_service.get_current_user)):
+async def search_contact_by_last_name(contact_last_name: str, skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_read_db),
+                                      current_user: User | Principal = Depends(auth_service.get_current_principal)):
     
     """
     The search_contact_by_last_name function searches for contacts by last name.
@@ -189,21 +534,20 @@ async def search_contact_by_last_name(contact_last_name: str, skip: int = 0, lim
     :param skip: int: Skip the first n contacts
     :param limit: int: Limit the number of results returned
     :param db: AsyncSession: Get the database session
-    :param current_user: User: Get the current user from the database
+    :param current_user: User | Principal: Get the current user from the database
     :return: A list of contacts
     :doc-author: Trelent
     """
     
-    contacts = await repository_contacts.get_contacts(skip, limit, current_user, db)
-    results = [contact for contact in contacts if contact_last_name.lower() in contact.last_name.lower()]
+    results = await repository_contacts.search_contacts(current_user, db, last_name=contact_last_name, skip=skip, limit=limit)
     if not results:
         raise HTTPException(status_code=404, detail="Contact not found")
-    return results
+    return _contacts_response(results)
 
 
 @router.get("/?email={contact_email}", response_model=List[ContactResponse])
-async def search_contact_by_email(contact_email: str, skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db),
-                                       current_user: User = Depends(auth_service.get_current_user)):
+async def search_contact_by_email(contact_email: str, skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_read_db),
+                                       current_user: User | Principal = Depends(auth_service.get_current_principal)):
     
     """
     The search_contact_by_first_name function searches for a contact by email.
@@ -216,45 +560,35 @@ async def search_contact_by_email(contact_email: str, skip: int = 0, limit: int
     :param skip: int: Skip a number of records in the database
     :param limit: int: Limit the number of results returned
     :param db: AsyncSession: Get the database session
-    :param current_user: User: Get the current user from the auth_service
+    :param current_user: User | Principal: Get the current user from the auth_service
     :return: A list of contacts
     :doc-author: Trelent
     """
     
-    contacts = await repository_contacts.get_contacts(skip, limit, current_user, db)
-    results = [contact for contact in contacts if contact_email.lower() in contact.email.lower()]
+    results = await repository_contacts.search_contacts(current_user, db, email=contact_email, skip=skip, limit=limit)
     if not results:
         raise HTTPException(status_code=404, detail="Contact not found")
-    return results
+    return _contacts_response(results)
 
 
 @router.get("/birthday/{days}", response_model=List[ContactResponse])
-async def get_birthday_contacts(days: int, skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db),
-                                current_user: User = Depends(auth_service.get_current_user)):
+async def get_birthday_contacts(days: int = Path(ge=0), skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_read_db),
+                                current_user: User | Principal = Depends(auth_service.get_current_principal)):
     
     """
     The get_birthday_contacts function returns a list of contacts that have birthdays within the next X days.
+    Windows that cross the end of a month or year are handled.
 
     :param days: int: Get the number of days from today to search for contacts
     :param skip: int: Skip the first n contacts
     :param limit: int: Limit the number of contacts returned
     :param db: AsyncSession: Pass the database session to the function
-    :param current_user: User: Get the current user from the database
+    :param current_user: User | Principal: Get the current user from the database
     :return: A list of contacts whose birthday is in the next x days
     :doc-author: Trelent
     """
     
-    current_day = datetime.now()
-    end_date = current_day + timedelta(days=days)
-    contacts = await db.query(repository_contacts.Contact).filter(
-        and_(
-            repository_contacts.Contact.user_id == current_user.id,
-            extract('month', repository_contacts.Contact.birthday) == extract('month', current_day),
-            extract('day', repository_contacts.Contact.birthday) >= current_day.day,
-            extract('day', repository_contacts.Contact.birthday) <= end_date.day
-        )
-    ).offset(skip).limit(limit).all()
-    
+    contacts = await repository_contacts.get_upcoming_birthdays(days, current_user, db, skip, limit)
     if not contacts:
         raise HTTPException(status_code=404, detail="Contacts not found")
-    return contacts
+    return _contacts_response(contacts)
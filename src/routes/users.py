@@ -1,21 +1,18 @@
-from fastapi import APIRouter, Depends, status, UploadFile, File
+from fastapi import APIRouter, Depends, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-import cloudinary
-import cloudinary.uploader
-from cloudinary.utils import cloudinary_url
 
 from src.database.db import get_db
 from src.database.models import User
 from src.repository import users as repository_users
 from src.services.auth import auth_service
-from config import settings
-from src.schemas.schemas import UserDb
+from src.services.avatars import avatar_service
+from src.schemas.schemas import TimezoneModel, UserDb
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 
 @router.get("/me/", response_model=UserDb)
-async def read_users_me(current_user: User = Depends(auth_service.get_current_user)):
+async def read_users_me(current_user: User = Depends(auth_service.get_current_user_read)):
     
     """
     The read_users_me function is a GET endpoint that returns the current user's information.
@@ -28,29 +25,47 @@ async def read_users_me(current_user: User = Depends(auth_service.get_current_us
     return current_user
 
 
-@router.patch('/avatar', response_model=UserDb)
-async def update_avatar_user(file: UploadFile = File(), current_user: User = Depends(auth_service.get_current_user),
+@router.patch('/avatar', response_model=UserDb, openapi_extra={"requestBody": {"required": True, "content": {
+    "multipart/form-data": {"schema": {"type": "object", "required": ["file"],
+                                       "properties": {"file": {"type": "string", "format": "binary"}}}}}}})
+async def update_avatar_user(request: Request, current_user: User = Depends(auth_service.get_current_user),
                              db: AsyncSession = Depends(get_db)):
     
     """
     The update_avatar_user function updates the avatar of a user.
+    The upload is read by the avatar service rather than by FastAPI, so an upload larger than AVATAR_MAX_SIZE
+    is rejected while it streams in, and an unauthenticated upload is rejected before its body is read.
 
-    :param file: UploadFile: Upload the file to cloudinary
+    :param request: Request: The multipart request with the image in its file field
     :param current_user: User: Get the current user from the database
     :param db: AsyncSession: Get the database session
     :return: The user with the updated avatar
     :doc-author: Trelent
     """
     
-    cloudinary.config(
-        cloud_name=settings.CLOUDINARY_NAME,
-        api_key=settings.CLOUDINARY_API_KEY,
-        api_secret=settings.CLOUDINARY_API_SECRET
-    )
-
-    contents = await file.read()
-    r = cloudinary.uploader.upload(contents, public_id=f"user_{current_user.id}_avatar")
-    url, options = cloudinary_url(r['public_id'], width=100, height=150, crop="fill")
-    
+    file = await avatar_service.receive(request)
+    try:
+        url = await avatar_service.upload(f"user_{current_user.id}_avatar", file)
+    finally:
+        await file.close()
+
     user = await repository_users.update_avatar(current_user.email, url, db)
     return user
+
+
+@router.patch('/timezone', response_model=UserDb)
+async def update_timezone_user(body: TimezoneModel, current_user: User = Depends(auth_service.get_current_user),
+                               db: AsyncSession = Depends(get_db)):
+
+    """
+    The update_timezone_user function sets the time zone of a user, the daily birthday digest
+    is sent once the morning has come there.
+
+    :param body: TimezoneModel: The IANA name of the time zone
+    :param current_user: User: Get the current user from the database
+    :param db: AsyncSession: Get the database session
+    :return: The user with the updated time zone
+    :doc-author: Trelent
+    """
+
+    return await repository_users.update_timezone(current_user.email, body.timezone, db)
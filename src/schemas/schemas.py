@@ -1,6 +1,7 @@
 from datetime import datetime
-from typing import List, Optional
-from pydantic import BaseModel, Field, EmailStr
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from typing import Annotated, List, Literal, Optional, Union
+from pydantic import BaseModel, Field, EmailStr, field_validator
 
 
 class UserModel(BaseModel):
@@ -14,18 +15,40 @@ class UserDb(BaseModel):
     username: str
     email: str
     created_at: datetime | None
-    avatar: str
+    avatar: str | None
     confirmed: bool
+    timezone: str = "UTC"
 
     class Config:
         from_attributes = True
 
 
+class TimezoneModel(BaseModel):
+    timezone: str = Field(max_length=50)
+
+    @field_validator("timezone")
+    @classmethod
+    def known_timezone(cls, timezone):
+        try:
+            ZoneInfo(timezone)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"Unknown time zone {timezone}")
+        return timezone
+
+
 class UserResponse(BaseModel):
     user: UserDb
     detail: str = "User successfully created"
 
 
+class Principal(BaseModel):
+    id: int
+    username: str | None
+    email: str
+    confirmed: bool
+    token_version: int = 0
+
+
 class TokenModel(BaseModel):
     access_token: str
     refresh_token: str
@@ -59,13 +82,78 @@ class ContactStatusUpdate(BaseModel):
     done: bool
 
 
-class ContactResponse(BaseModel):
-    contact: Contact
-    detail: str = "Contact successfully created"
+class ContactResponse(ContactBase):
+    id: int
+    done: bool | None = False
+    created_at: datetime | None = None
+    update_at: datetime | None = None
+    user_id: int | None = None
 
     class Config:
         from_attributes = True
 
 
+class ContactPage(BaseModel):
+    items: List[ContactResponse]
+    next_cursor: str | None = None
+
+
+class ContactChanges(BaseModel):
+    changed: List[ContactResponse]
+    deleted: List[int]
+    next_token: int
+    has_more: bool
+
+
+class ContactImportError(BaseModel):
+    row: int
+    detail: str
+
+
+class ContactImportResponse(BaseModel):
+    created: int
+    failed: int
+    errors: List[ContactImportError]
+
+
+class ContactBatchStatusUpdate(BaseModel):
+    op: Literal["status"]
+    id: int
+    body: ContactStatusUpdate
+
+
+class ContactBatchUpdate(BaseModel):
+    op: Literal["update"]
+    id: int
+    body: ContactUpdate
+
+
+class ContactBatchDelete(BaseModel):
+    op: Literal["delete"]
+    id: int
+
+
+ContactBatchOperation = Annotated[Union[ContactBatchStatusUpdate, ContactBatchUpdate, ContactBatchDelete],
+                                  Field(discriminator="op")]
+
+
+class ContactBatchRequest(BaseModel):
+    operations: List[ContactBatchOperation] = Field(min_length=1, max_length=1000)
+
+    @field_validator("operations")
+    @classmethod
+    def unique_ids(cls, operations):
+        ids = [operation.id for operation in operations]
+        if len(ids) != len(set(ids)):
+            raise ValueError("Each contact may appear only once in a batch")
+        return operations
+
+
+class ContactBatchResult(BaseModel):
+    id: int
+    op: str
+    status: Literal["ok", "not_found"]
+
+
 class RequestEmail(BaseModel):
     email: EmailStr
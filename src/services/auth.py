@@ -3,19 +3,24 @@ from typing import Optional
 from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 from datetime import datetime, timedelta, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db
+from src.database.models import User
+from src.database.shards import current_user_id
 from src.repository import users as repository_users
+from src.schemas.schemas import Principal
+from src.services.cache import principal_cache
+from src.services.hashing import pwd_context
 from config import settings
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    pwd_context = pwd_context
     SECRET_KEY = settings.SECRET_KEY_JWT
     ALGORITHM = settings.ALGORITHM
+    CLAIMS_PRINCIPAL = settings.AUTH_CLAIMS_PRINCIPAL
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
     def verify_password(self, plain_password, hashed_password):
@@ -24,6 +29,7 @@ class Auth:
         The verify_password function takes a plain-text password and hashed
         password as arguments. It then uses the pwd_context object to verify that the
         plain-text password matches the hashed one.
+        It blocks the caller; request handlers should await password_hasher.verify instead.
 
         :param self: Represent the instance of the class
         :param plain_password: Store the password that is entered by the user
@@ -39,6 +45,7 @@ class Auth:
         """
         The get_password_hash function takes a password as input and returns the hash of that password.
         The hash is generated using the pwd_context object, which is an instance of Flask-Bcrypt's Bcrypt class.
+        It blocks the caller; request handlers should await password_hasher.hash instead.
 
         :param self: Represent the instance of the class
         :param password: str: Pass the password to be hashed into the function
@@ -123,12 +130,76 @@ class Auth:
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
 
+    @staticmethod
+    def _credentials_exception() -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    def access_token_claims(self, user: User) -> dict:
+
+        """
+        The access_token_claims function returns the claims to put in an access token for the user.
+        In claims principal mode the token also carries the id, username, confirmed flag and token version,
+        so protected routes can authenticate the user without loading it from the database.
+
+        :param self: Represent the instance of the class
+        :param user: User: The user the token is issued for
+        :return: A dictionary of claims for create_access_token
+        :doc-author: Trelent
+        """
+
+        claims = {"sub": user.email}
+        if self.CLAIMS_PRINCIPAL:
+            claims.update({"id": user.id, "username": user.username, "confirmed": bool(user.confirmed),
+                           "ver": user.token_version or 0})
+        return claims
+
+    async def decode_access_token(self, token: str) -> dict:
+
+        """
+        The decode_access_token function validates an access token and returns its payload.
+        If the token is invalid, expired or has the wrong scope, it raises an HTTPException with status code 401.
+
+        :param self: Represent the instance of the class
+        :param token: str: The encoded access token
+        :return: The payload of the token
+        :doc-author: Trelent
+        """
+
+        try:
+            # Decode JWT
+            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+        except JWTError as e:
+            raise self._credentials_exception()
+        if payload.get('scope') != 'access_token' or payload.get("sub") is None:
+            raise self._credentials_exception()
+        return payload
+
+    async def _get_user(self, payload: dict, db: AsyncSession) -> User:
+        email = payload["sub"]
+        cached = await principal_cache.get(email)
+        if cached is not None:
+            user = User(**cached)
+        else:
+            user = await repository_users.get_user_by_email(email, db)
+            if user is None:
+                raise self._credentials_exception()
+            await principal_cache.set(email, principal_cache.dump(user), payload["exp"])
+        # the contacts of the request are on the shard of this user
+        current_user_id.set(user.id)
+        return user
+
     async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
         
         """
         The get_current_user function is a dependency that will be used in the
             protected endpoints. It takes a token as an argument and returns the user
             if it's valid, or raises an exception otherwise.
+            The user is served from the principal cache when possible, so most requests
+            do not need a database round trip to authenticate.
 
         :param self: Refer to the class itself
         :param token: str: Get the token from the request header
@@ -137,28 +208,56 @@ class Auth:
         :doc-author: Trelent
         """
         
-        credentials_exception = HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        payload = await self.decode_access_token(token)
+        return await self._get_user(payload, db)
 
-        try:
-            # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'access_token':
-                email = payload["sub"]
-                if email is None:
-                    raise credentials_exception
-            else:
-                raise credentials_exception
-        except JWTError as e:
-            raise credentials_exception
+    async def get_current_user_read(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_read_db)):
 
-        user = await repository_users.get_user_by_email(email, db)
-        if user is None:
-            raise credentials_exception
-        return user
+        """
+        The get_current_user_read function is get_current_user for read-only endpoints:
+            on a principal cache miss the user is loaded through get_read_db, from a replica when possible.
+
+        :param self: Refer to the class itself
+        :param token: str: Get the token from the request header
+        :param db: AsyncSession: Get the read-only database session
+        :return: The user object that corresponds to the email in the jwt payload
+        :doc-author: Trelent
+        """
+
+        payload = await self.decode_access_token(token)
+        return await self._get_user(payload, db)
+
+    async def get_current_principal(self, token: str = Depends(oauth2_scheme),
+                                    db: AsyncSession = Depends(get_db)) -> User | Principal:
+
+        """
+        The get_current_principal function is a dependency for endpoints that only need the identity of the user.
+            In claims principal mode it builds a Principal from the token claims. The only check against stored
+            state is the token version, which is read from the principal cache, so no User row is loaded
+            while the cache is warm. Tokens issued before the version was bumped are rejected.
+            Otherwise it behaves like get_current_user.
+
+        :param self: Refer to the class itself
+        :param token: str: Get the token from the request header
+        :param db: AsyncSession: Get the database session, used only when the cache misses
+        :return: A Principal, or the User when claims principal mode is off
+        :doc-author: Trelent
+        """
+
+        payload = await self.decode_access_token(token)
+        if not self.CLAIMS_PRINCIPAL or "id" not in payload:
+            return await self._get_user(payload, db)
+
+        cached = await principal_cache.get(payload["sub"])
+        if cached is not None and "token_version" in cached:
+            version = cached["token_version"]
+        else:
+            version = (await self._get_user(payload, db)).token_version or 0
+        if payload.get("ver") != version:
+            raise self._credentials_exception()
+        current_user_id.set(payload["id"])
+        return Principal(id=payload["id"], username=payload["username"], email=payload["sub"],
+                         confirmed=payload["confirmed"], token_version=version)
 
     async def create_email_token(self, data: dict):
         
@@ -0,0 +1,238 @@
+import asyncio
+import os
+from abc import ABC, abstractmethod
+import shutil
+import tempfile
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import BinaryIO
+
+import cloudinary
+import cloudinary.uploader
+from cloudinary.utils import cloudinary_url
+from fastapi import HTTPException, Request, status
+from starlette.datastructures import UploadFile
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.formparsers import MultiPartException
+from starlette.types import Message
+
+from config import settings
+
+
+# the first bytes of every image type an avatar may have, checked instead of trusting the declared type
+SIGNATURES = {
+    "image/jpeg": (b"\xff\xd8\xff",),
+    "image/png": (b"\x89PNG\r\n\x1a\n",),
+    "image/gif": (b"GIF87a", b"GIF89a"),
+    "image/webp": (b"RIFF",),
+}
+EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif", "image/webp": ".webp"}
+# the boundaries and headers of the multipart body around the file
+FORM_OVERHEAD = 16 * 1024
+
+
+def sniff(head: bytes) -> str | None:
+
+    """
+    The sniff function recognizes an image by its first bytes.
+
+    :param head: bytes: The first bytes of the file, at least 12
+    :return: The content type of the image, None if it is none of the avatar types
+    :doc-author: Trelent
+    """
+
+    for content_type, signatures in SIGNATURES.items():
+        if head.startswith(signatures):
+            if content_type == "image/webp" and head[8:12] != b"WEBP":
+                continue
+            return content_type
+    return None
+
+
+class AvatarStorage(ABC):
+    """
+    Where avatars are kept. save is called from a worker thread with an open file positioned at its start,
+    so a backend may block on disk or network I/O.
+    """
+
+    @abstractmethod
+    def save(self, key: str, file: BinaryIO, content_type: str) -> str:
+
+        """
+        The save function stores an avatar under a key, replacing the previous avatar stored under it.
+
+        :param self: Represent the instance of the class
+        :param key: str: The name of the avatar, one per user
+        :param file: BinaryIO: The image
+        :param content_type: str: The type of the image, one of SIGNATURES
+        :return: The url of the avatar
+        :doc-author: Trelent
+        """
+
+
+class CloudinaryStorage(AvatarStorage):
+    """
+    Uploads avatars to Cloudinary. The client is configured once, when the storage is built.
+    """
+
+    def __init__(self, cloud_name: str, api_key: str, api_secret: str):
+        cloudinary.config(cloud_name=cloud_name, api_key=api_key, api_secret=api_secret)
+
+    def save(self, key: str, file: BinaryIO, content_type: str) -> str:
+        result = cloudinary.uploader.upload(file, public_id=key, overwrite=True)
+        url, options = cloudinary_url(result["public_id"], width=100, height=150, crop="fill",
+                                      version=result.get("version"))
+        return url
+
+
+class LocalStorage(AvatarStorage):
+    """
+    Keeps avatars as files of a directory served at base_url, for development and for tests and benchmarks
+    that run offline. A new avatar is written to a temporary file and renamed, so a reader never sees half of it.
+    """
+
+    def __init__(self, directory: str, base_url: str):
+        self.directory = directory
+        self.base_url = base_url.rstrip("/")
+
+    def save(self, key: str, file: BinaryIO, content_type: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        name = key + EXTENSIONS[content_type]
+        descriptor, path = tempfile.mkstemp(dir=self.directory, prefix=".upload-")
+        try:
+            with os.fdopen(descriptor, "wb") as target:
+                shutil.copyfileobj(file, target)
+            os.replace(path, os.path.join(self.directory, name))
+        except BaseException:
+            os.unlink(path)
+            raise
+        for extension in EXTENSIONS.values():
+            if extension != EXTENSIONS[content_type]:
+                try:
+                    os.unlink(os.path.join(self.directory, key + extension))
+                except FileNotFoundError:
+                    pass
+        return f"{self.base_url}/{name}"
+
+
+class AvatarService:
+    """
+    Receives avatar uploads without holding them in memory and hands them to the storage off the event loop.
+    The body of the upload is counted while it streams in and the upload is rejected with 413 as soon as it
+    exceeds max_size, the parts of it already received are spooled to a temporary file by the form parser.
+    The image type is taken from the first bytes of the file, not from the declared content type.
+    """
+
+    def __init__(self, storage: AvatarStorage, max_size: int, content_types: tuple[str, ...],
+                 max_workers: int = 4):
+        unknown = set(content_types) - set(SIGNATURES)
+        if unknown:
+            raise ValueError(f"Unsupported avatar types: {', '.join(sorted(unknown))}")
+        self.storage = storage
+        self.max_size = max_size
+        self.content_types = content_types
+        self.max_workers = max_workers
+        self._executor: Executor | None = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="avatar")
+        return self._executor
+
+    async def receive(self, request: Request, field: str = "file") -> UploadFile:
+
+        """
+        The receive function parses a multipart upload with a single file, stopping as soon as the body
+        is larger than an avatar may be.
+
+        :param self: Represent the instance of the class
+        :param request: Request: The request, whose body was not read yet
+        :param field: str: The name of the form field of the file
+        :return: The uploaded file, spooled to a temporary file
+        :doc-author: Trelent
+        """
+
+        max_body = self.max_size + FORM_OVERHEAD
+        if int(request.headers.get("content-length") or 0) > max_body:
+            raise self._too_large()
+        received = 0
+        too_large = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, too_large
+            message = await request.receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body:
+                    too_large = True
+                    # the form parser closes the files it spooled when it fails with a MultiPartException
+                    raise MultiPartException("Avatar too large")
+            return message
+
+        try:
+            form = await Request(request.scope, limited_receive).form(max_files=1, max_fields=1)
+        except StarletteHTTPException:
+            if too_large:
+                raise self._too_large()
+            raise
+        file = form.get(field)
+        if not isinstance(file, UploadFile):
+            await form.close()
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"No {field} uploaded")
+        if file.size is not None and file.size > self.max_size:
+            await form.close()
+            raise self._too_large()
+        return file
+
+    async def upload(self, key: str, file: UploadFile) -> str:
+
+        """
+        The upload function checks the type of an uploaded image and saves it to the storage in a worker thread,
+        so the event loop keeps serving other requests during the transfer.
+
+        :param self: Represent the instance of the class
+        :param key: str: The name of the avatar
+        :param file: UploadFile: The uploaded file
+        :return: The url of the avatar
+        :doc-author: Trelent
+        """
+
+        head = await file.read(12)
+        content_type = sniff(head)
+        if content_type not in self.content_types or file.content_type not in (content_type, None):
+            raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                                detail=f"The avatar must be one of {', '.join(self.content_types)}")
+        await file.seek(0)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.storage.save, key, file.file, content_type)
+
+    def shutdown(self) -> None:
+
+        """
+        The shutdown function stops the upload threads.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _too_large(self) -> HTTPException:
+        return HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                             detail=f"The avatar must not be larger than {self.max_size} bytes")
+
+
+def create_storage() -> AvatarStorage:
+    if settings.AVATAR_STORAGE == "local":
+        return LocalStorage(settings.AVATAR_LOCAL_DIR, settings.AVATAR_LOCAL_URL)
+    if settings.AVATAR_STORAGE == "cloudinary":
+        return CloudinaryStorage(settings.CLOUDINARY_NAME, settings.CLOUDINARY_API_KEY,
+                                 settings.CLOUDINARY_API_SECRET)
+    raise ValueError(f"Unknown avatar storage {settings.AVATAR_STORAGE!r}")
+
+
+avatar_service = AvatarService(create_storage(), settings.AVATAR_MAX_SIZE,
+                               tuple(settings.AVATAR_CONTENT_TYPES.split(",")), settings.AVATAR_UPLOAD_WORKERS)
@@ -0,0 +1,229 @@
+"""
+The daily birthday digest: one email a day to every confirmed user whose contacts have a birthday soon.
+
+    python -m src.services.birthdays
+    python -m src.services.birthdays bucket TIMEZONE DAY [--restart]
+
+Run it every hour, from cron for example. A time zone is done once a day, on the first run after
+BIRTHDAY_DIGEST_HOUR local time; bucket runs the digest of one time zone and day by hand.
+"""
+import argparse
+import asyncio
+from datetime import date, datetime, timezone as dt_timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from fastapi_mail.errors import ConnectionErrors
+from sqlalchemy import Row, delete, insert, select, update
+
+from src.database.db import DatabaseSessionManager, sessionmanager
+from src.database.models import BirthdayDigest, BirthdayDigestRun, User
+from src.repository import contacts as repository_contacts
+from src.services import email as email_service
+from config import settings
+
+
+def _describe(row: Row, today: date) -> dict:
+    birthday = row.birthday
+    for year in (today.year, today.year + 1):
+        try:
+            occurrence = date(year, birthday.month, birthday.day)
+        except ValueError:
+            # February 29 counts as February 28 in non-leap years, as in the birthday queries
+            occurrence = date(year, 2, 28)
+        if occurrence >= today:
+            break
+    return {"first_name": row.first_name, "last_name": row.last_name, "date": f"{birthday:%B} {birthday.day}",
+            "days": (occurrence - today).days}
+
+
+async def _upcoming(manager: DatabaseSessionManager, user_ids: list[int], today: date,
+                    days: int) -> dict[int, list[dict]]:
+    if manager.shards:
+        async with manager._engine.connect() as connection:
+            shards = await connection.run_sync(manager.shards.locate_many, user_ids)
+        groups = [(manager.shards.engines[shard], ids) for shard, ids in shards.items()]
+    else:
+        groups = [(manager._engine, user_ids)]
+    birthdays: dict[int, list[dict]] = {}
+    for engine, ids in groups:
+        async with engine.connect() as connection:
+            rows = await repository_contacts.get_upcoming_birthdays_of_users(days, ids, connection, today)
+        for row in rows:
+            birthdays.setdefault(row.user_id, []).append(_describe(row, today))
+    return birthdays
+
+
+async def _start(manager: DatabaseSessionManager, timezone: str, day: date) -> int | None:
+    async with manager._engine.begin() as connection:
+        stmt = select(BirthdayDigestRun).where(BirthdayDigestRun.timezone == timezone, BirthdayDigestRun.day == day)
+        run = (await connection.execute(stmt)).first()
+        if run is None:
+            await connection.execute(insert(BirthdayDigestRun).values(timezone=timezone, day=day, last_user_id=0))
+            return 0
+    return None if run.finished_at is not None else run.last_user_id
+
+
+async def _claim(manager: DatabaseSessionManager, day: date, user_ids: list[int]) -> set[int]:
+    if not user_ids:
+        return set()
+    async with manager._engine.begin() as connection:
+        stmt = select(BirthdayDigest.user_id).where(BirthdayDigest.day == day, BirthdayDigest.user_id.in_(user_ids))
+        claimed = set(user_ids) - set((await connection.execute(stmt)).scalars())
+        if claimed:
+            await connection.execute(insert(BirthdayDigest), [{"user_id": user_id, "day": day}
+                                                              for user_id in sorted(claimed)])
+    return claimed
+
+
+async def send_bucket(manager: DatabaseSessionManager, timezone: str, day: date,
+                      days: int = settings.BIRTHDAY_DIGEST_DAYS,
+                      chunk_size: int = settings.BIRTHDAY_DIGEST_CHUNK_SIZE) -> tuple[int, int]:
+
+    """
+    The send_bucket function sends the digests of the users of a time zone for a day. The users are read
+    in chunks of chunk_size ids and the birthdays of a chunk are read in one statement per shard, so the job
+    holds one chunk in memory however many contacts there are. The digests of a chunk are sent over one
+    SMTP session.
+    Every digest is claimed in birthday_digests before it is sent and the progress is saved after every chunk,
+    so a job that crashed resumes at the chunk it was sending and skips the users it claimed: a user gets
+    at most one digest a day, and a digest sent when the job crashed, before it was marked sent, is not sent
+    again. The claims of digests the server refused are dropped, a restarted bucket sends them.
+    When the server cannot be reached the function raises, and the next run resumes at the failed chunk.
+
+    :param manager: DatabaseSessionManager: The databases
+    :param timezone: str: The IANA name of the time zone
+    :param day: date: The local day of the digest
+    :param days: int: The number of days after the day to look ahead
+    :param chunk_size: int: The number of users read at once
+    :return: The number of digests sent and the number of digests that failed
+    :doc-author: Trelent
+    """
+
+    last = await _start(manager, timezone, day)
+    if last is None:
+        return 0, 0
+    sent = failed = 0
+    while True:
+        async with manager._engine.connect() as connection:
+            stmt = (select(User.id, User.email, User.username)
+                    .where(User.timezone == timezone, User.confirmed.is_(True), User.id > last)
+                    .order_by(User.id).limit(chunk_size))
+            users = (await connection.execute(stmt)).all()
+        if not users:
+            break
+        birthdays = await _upcoming(manager, [user.id for user in users], day, days)
+        claimed = await _claim(manager, day, [user.id for user in users if user.id in birthdays])
+        recipients = [user for user in users if user.id in claimed]
+        results = await email_service.send_birthday_digests([(user.email, user.username, birthdays[user.id])
+                                                             for user in recipients])
+        delivered = [user.id for user, error in zip(recipients, results) if error is None]
+        refused = [user.id for user, error in zip(recipients, results) if error is not None]
+        for user, error in zip(recipients, results):
+            if error is not None:
+                print(f"birthday digest of user {user.id} failed: {error}")
+        # when the server cannot be reached the job stops, and resumes at this chunk next time
+        unreachable = next((error for error in results if isinstance(error, ConnectionErrors)), None)
+        if unreachable is None:
+            last = users[-1].id
+        async with manager._engine.begin() as connection:
+            if delivered:
+                await connection.execute(update(BirthdayDigest)
+                                         .where(BirthdayDigest.day == day, BirthdayDigest.user_id.in_(delivered))
+                                         .values(sent_at=datetime.now()))
+            if refused:
+                await connection.execute(delete(BirthdayDigest).where(BirthdayDigest.day == day,
+                                                                      BirthdayDigest.user_id.in_(refused)))
+            await connection.execute(update(BirthdayDigestRun)
+                                     .where(BirthdayDigestRun.timezone == timezone, BirthdayDigestRun.day == day)
+                                     .values(last_user_id=last))
+        if unreachable is not None:
+            raise unreachable
+        sent += len(delivered)
+        failed += len(refused)
+    async with manager._engine.begin() as connection:
+        await connection.execute(update(BirthdayDigestRun)
+                                 .where(BirthdayDigestRun.timezone == timezone, BirthdayDigestRun.day == day)
+                                 .values(finished_at=datetime.now()))
+    return sent, failed
+
+
+async def restart_bucket(manager: DatabaseSessionManager, timezone: str, day: date) -> None:
+
+    """
+    The restart_bucket function forgets the progress of a time zone on a day, so the next send_bucket
+    goes through all its users again. The users whose digest was sent or claimed are still skipped.
+
+    :param manager: DatabaseSessionManager: The databases
+    :param timezone: str: The IANA name of the time zone
+    :param day: date: The local day of the digest
+    :return: None
+    :doc-author: Trelent
+    """
+
+    async with manager._engine.begin() as connection:
+        await connection.execute(delete(BirthdayDigestRun).where(BirthdayDigestRun.timezone == timezone,
+                                                                 BirthdayDigestRun.day == day))
+
+
+async def run(manager: DatabaseSessionManager, now: datetime | None = None, hour: int = settings.BIRTHDAY_DIGEST_HOUR,
+              days: int = settings.BIRTHDAY_DIGEST_DAYS,
+              chunk_size: int = settings.BIRTHDAY_DIGEST_CHUNK_SIZE) -> tuple[int, int]:
+
+    """
+    The run function sends the digests of every time zone where it is hour o'clock or later and whose digest
+    of the local day was not sent yet.
+
+    :param manager: DatabaseSessionManager: The databases
+    :param now: datetime | None: The current time, aware, the current UTC time by default
+    :param hour: int: The local hour from which the digest of a day is sent
+    :param days: int: The number of days to look ahead
+    :param chunk_size: int: The number of users read at once
+    :return: The number of digests sent and the number of digests that failed
+    :doc-author: Trelent
+    """
+
+    now = now or datetime.now(dt_timezone.utc)
+    async with manager._engine.connect() as connection:
+        timezones = (await connection.execute(select(User.timezone).distinct())).scalars().all()
+    sent = failed = 0
+    for timezone in timezones:
+        try:
+            local = now.astimezone(ZoneInfo(timezone))
+        except (ZoneInfoNotFoundError, ValueError):
+            print(f"unknown time zone {timezone!r}, its users get no birthday digest")
+            continue
+        if local.hour < hour:
+            continue
+        bucket_sent, bucket_failed = await send_bucket(manager, timezone, local.date(), days, chunk_size)
+        sent += bucket_sent
+        failed += bucket_failed
+    return sent, failed
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m src.services.birthdays", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=settings.BIRTHDAY_DIGEST_DAYS)
+    parser.add_argument("--chunk-size", type=int, default=settings.BIRTHDAY_DIGEST_CHUNK_SIZE)
+    commands = parser.add_subparsers(dest="command")
+    bucket = commands.add_parser("bucket")
+    bucket.add_argument("timezone")
+    bucket.add_argument("day", type=date.fromisoformat)
+    bucket.add_argument("--restart", action="store_true")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "bucket":
+            if args.restart:
+                await restart_bucket(sessionmanager, args.timezone, args.day)
+            sent, failed = await send_bucket(sessionmanager, args.timezone, args.day, args.days, args.chunk_size)
+        else:
+            sent, failed = await run(sessionmanager, days=args.days, chunk_size=args.chunk_size)
+        print(f"sent {sent} birthday digests, {failed} failed")
+    finally:
+        await email_service.mailer.close()
+        await sessionmanager.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
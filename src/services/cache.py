@@ -0,0 +1,210 @@
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from config import settings
+
+
+class TTLCache:
+    """
+    A small in-process LRU cache whose entries expire after a time to live.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key: str):
+
+        """
+        The get function returns the cached value for a key, or None if the key is missing or expired.
+
+        :param self: Represent the instance of the class
+        :param key: str: The cache key
+        :return: The cached value or None
+        :doc-author: Trelent
+        """
+
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value, ttl: float | None = None) -> None:
+
+        """
+        The set function stores a value, evicting the least recently used entry when the cache is full.
+
+        :param self: Represent the instance of the class
+        :param key: str: The cache key
+        :param value: The value to store
+        :param ttl: float | None: Lifetime of the entry in seconds, never longer than the cache ttl
+        :return: None
+        :doc-author: Trelent
+        """
+
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class PrincipalCache:
+    """
+    Two-tier cache of authenticated users: an in-process TTL/LRU in front of Redis.
+    Entries never outlive the access token they were created for.
+    """
+
+    FIELDS = ("id", "username", "email", "created_at", "avatar", "confirmed", "token_version", "timezone")
+
+    def __init__(self, maxsize: int, local_ttl: float, ttl: float, prefix: str = "principal"):
+        self.local = TTLCache(maxsize, local_ttl)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.redis: Redis | None = None
+
+    def init(self, redis: Redis) -> None:
+
+        """
+        The init function attaches the Redis connection used as the second cache tier.
+
+        :param self: Represent the instance of the class
+        :param redis: Redis: The Redis connection created on startup
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.redis = redis
+
+    def _key(self, email: str) -> str:
+        return f"{self.prefix}:{email}"
+
+    @classmethod
+    def dump(cls, user) -> dict:
+
+        """
+        The dump function takes a snapshot of the user columns that are safe to cache.
+        The password hash and the refresh token are never cached.
+
+        :param user: User: The user loaded from the database
+        :return: A dictionary with the cached user fields
+        :doc-author: Trelent
+        """
+
+        data = {field: getattr(user, field) for field in cls.FIELDS}
+        if data["created_at"] is not None:
+            data["created_at"] = data["created_at"].isoformat()
+        return data
+
+    @staticmethod
+    def load(data: dict) -> dict:
+        data = dict(data)
+        if data.get("created_at") is not None:
+            data["created_at"] = datetime.fromisoformat(data["created_at"])
+        return data
+
+    async def get(self, email: str) -> dict | None:
+
+        """
+        The get function looks the user up in the local tier first and then in Redis.
+        A Redis hit is copied into the local tier.
+
+        :param self: Represent the instance of the class
+        :param email: str: The identity of the user
+        :return: The cached user fields or None
+        :doc-author: Trelent
+        """
+
+        key = self._key(email)
+        data = self.local.get(key)
+        if data is not None:
+            return self.load(data)
+        if self.redis is None:
+            return None
+        try:
+            raw = await self.redis.get(key)
+            if raw is None:
+                return None
+            ttl = await self.redis.pttl(key)
+        except RedisError as err:
+            print(err)
+            return None
+        data = json.loads(raw)
+        if not set(self.FIELDS) <= data.keys():
+            # written before a field was added to FIELDS
+            return None
+        self.local.set(key, data, ttl / 1000 if ttl and ttl > 0 else None)
+        return self.load(data)
+
+    async def set(self, email: str, data: dict, expires_at: float) -> None:
+
+        """
+        The set function stores the user fields in both tiers.
+        The entry lifetime is capped at the expiration time of the access token.
+
+        :param self: Represent the instance of the class
+        :param email: str: The identity of the user
+        :param data: dict: The user fields returned by dump
+        :param expires_at: float: The exp claim of the access token as a unix timestamp
+        :return: None
+        :doc-author: Trelent
+        """
+
+        ttl = min(self.ttl, expires_at - time.time())
+        if ttl <= 0:
+            return
+        key = self._key(email)
+        self.local.set(key, data, ttl)
+        if self.redis is None:
+            return
+        try:
+            await self.redis.set(key, json.dumps(data), px=int(ttl * 1000))
+        except RedisError as err:
+            print(err)
+
+    async def invalidate(self, email: str) -> None:
+
+        """
+        The invalidate function drops the cached user from both tiers.
+        It must be called whenever a cached column of the user changes.
+
+        :param self: Represent the instance of the class
+        :param email: str: The identity of the user
+        :return: None
+        :doc-author: Trelent
+        """
+
+        key = self._key(email)
+        self.local.delete(key)
+        if self.redis is None:
+            return
+        try:
+            await self.redis.delete(key)
+        except RedisError as err:
+            print(err)
+
+
+principal_cache = PrincipalCache(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE,
+    local_ttl=settings.PRINCIPAL_CACHE_LOCAL_TTL,
+    ttl=settings.PRINCIPAL_CACHE_TTL,
+)
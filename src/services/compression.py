@@ -0,0 +1,275 @@
+import asyncio
+import time
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/csv", "text/plain", "text/html")
+
+
+class GzipCompressor:
+    encoding = "gzip"
+
+    def __init__(self, fast: bool):
+        self._compressor = zlib.compressobj(1 if fast else settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+    encoding = "br"
+
+    def __init__(self, fast: bool):
+        self._compressor = brotli.Compressor(quality=0 if fast else settings.COMPRESSION_BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdCompressor:
+    encoding = "zstd"
+
+    def __init__(self, fast: bool):
+        level = 1 if fast else settings.COMPRESSION_ZSTD_LEVEL
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+# in the order of preference of the server, codecs whose package is not installed are left out
+COMPRESSORS = {compressor.encoding: compressor for compressor, available in (
+    (ZstdCompressor, zstandard is not None),
+    (BrotliCompressor, brotli is not None),
+    (GzipCompressor, True),
+) if available}
+
+
+def choose_encoding(accept_encoding: str | None) -> str | None:
+
+    """
+    The choose_encoding function negotiates the content coding of a response from the Accept-Encoding header.
+    Among the codings the client accepts with a non-zero q-value the one with the highest q-value wins,
+    ties go to the preference of the server: zstd, then br, then gzip.
+
+    :param accept_encoding: str | None: The Accept-Encoding header of the request
+    :return: The content coding, or None to send the response as it is
+    :doc-author: Trelent
+    """
+
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding.strip().lower()] = q
+    wildcard = weights.get("*", 0.0)
+    best, best_q = None, 0.0
+    for encoding in COMPRESSORS:
+        q = weights.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop wakes up a sleeping task. A worker that spends its time compressing
+    falls behind, so the lag tells the compression middleware when to trade ratio for CPU.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.lag = 0.0
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+
+        """
+        The start function starts measuring in the running event loop.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+
+        """
+        The stop function stops measuring.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - started - self.interval)
+            # smooth out single slow ticks, but react to a loop that keeps falling behind within a few ticks
+            self.lag = self.lag * 0.5 + lag * 0.5
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware that compresses responses with zstd, brotli or gzip, whichever the client accepts.
+    Responses smaller than the minimum size, of binary media types, already encoded, and event streams
+    are sent as they are. Streaming responses are compressed chunk by chunk and every chunk is flushed,
+    so the client receives data as soon as the application produces it. When the event loop lags
+    behind the fastest level of the codec is used.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, monitor: LoopLagMonitor | None = None,
+                 max_lag: float = 0.05):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.monitor = monitor
+        self.max_lag = max_lag
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        fast = self.monitor is not None and self.monitor.lag > self.max_lag
+        responder = _CompressionResponder(send, COMPRESSORS[encoding], fast, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+def _compressible(headers: MutableHeaders) -> bool:
+    if "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+    return content_type in COMPRESSIBLE_TYPES
+
+
+def _set_encoding(headers: MutableHeaders, encoding: str) -> None:
+    headers["Content-Encoding"] = encoding
+    # a strong validator must not cover both the encoded and the identity bytes; If-None-Match compares weakly
+    # and If-Match accepts the weak form of the current tag, so conditional requests work with the weakened tag
+    etag = headers.get("etag")
+    if etag is not None and not etag.startswith("W/"):
+        headers["ETag"] = f"W/{etag}"
+
+
+class _CompressionResponder:
+
+    def __init__(self, send: Send, compressor_class: type, fast: bool, minimum_size: int):
+        self._send = send
+        self._compressor_class = compressor_class
+        self._fast = fast
+        self._minimum_size = minimum_size
+        self._start: Message | None = None
+        self._pending: list[bytes] = []
+        self._pending_size = 0
+        self._compressor = None
+        self._passthrough = False
+
+    async def send(self, message: Message) -> None:
+        if self._passthrough:
+            await self._send(message)
+            return
+        if message["type"] == "http.response.start":
+            self._start = message
+            if message["status"] in (204, 304) or not _compressible(MutableHeaders(raw=message["headers"])):
+                self._passthrough = True
+                await self._send(message)
+            return
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self._compressor is not None:
+            chunk = self._compressor.compress(body) if body else b""
+            if not more_body:
+                chunk += self._compressor.finish()
+            if chunk or not more_body:
+                await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+            return
+
+        self._pending.append(body)
+        self._pending_size += len(body)
+        if more_body and self._pending_size < self._minimum_size:
+            return
+        buffered = b"".join(self._pending)
+        self._pending = []
+        if not more_body:
+            await self._send_whole(buffered)
+            return
+
+        # a streaming response that grew past the minimum size: compress from here on
+        self._compressor = self._compressor_class(self._fast)
+        headers = MutableHeaders(raw=self._start["headers"])
+        _set_encoding(headers, self._compressor.encoding)
+        headers.add_vary_header("Accept-Encoding")
+        if "content-length" in headers:
+            del headers["Content-Length"]
+        await self._send(self._start)
+        await self._send({"type": "http.response.body", "body": self._compressor.compress(buffered),
+                          "more_body": True})
+
+    async def _send_whole(self, body: bytes) -> None:
+        headers = MutableHeaders(raw=self._start["headers"])
+        headers.add_vary_header("Accept-Encoding")
+        if len(body) >= self._minimum_size:
+            compressor = self._compressor_class(self._fast)
+            compressed = compressor.compress(body) + compressor.finish()
+            # incompressible bodies go out as they are
+            if len(compressed) < len(body):
+                body = compressed
+                _set_encoding(headers, compressor.encoding)
+        headers["Content-Length"] = str(len(body))
+        await self._send(self._start)
+        await self._send({"type": "http.response.body", "body": body, "more_body": False})
+
+
+loop_lag = LoopLagMonitor(settings.COMPRESSION_LAG_INTERVAL)
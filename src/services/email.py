@@ -1,7 +1,14 @@
+import asyncio
+import time
+from email.message import Message
 from pathlib import Path
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
+import aiosmtplib
+from fastapi_mail import MessageSchema, ConnectionConfig, MessageType
 from fastapi_mail.errors import ConnectionErrors
+from fastapi_mail.fastmail import email_dispatched
+from fastapi_mail.msg import MailMsg
+from jinja2 import Template
 from pydantic import EmailStr
 
 from src.services.auth import auth_service
@@ -22,6 +29,160 @@ conf = ConnectionConfig(
 )
 
 
+class Mailer:
+    """
+    A long-lived mailer. FastMail opens an SMTP connection for every message and parses its template every time;
+    the mailer compiles the templates once and keeps up to pool_size connections open between messages, so a
+    message pays the TCP, TLS and AUTH handshake only when no open connection is idle. A connection idle for
+    longer than keepalive seconds is closed rather than reused, and a connection the server dropped is replaced
+    by a new one and the message sent again.
+    """
+
+    def __init__(self, config: ConnectionConfig, pool_size: int = 10, keepalive: float = 60):
+        self.config = config
+        self.pool_size = pool_size
+        self.keepalive = keepalive
+        environment = config.template_engine()
+        self.templates: dict[str, Template] = {name: environment.get_template(name)
+                                               for name in environment.list_templates()}
+        self.sender = f"{config.MAIL_FROM_NAME} <{config.MAIL_FROM}>" if config.MAIL_FROM_NAME else config.MAIL_FROM
+        self.connections_opened = 0
+        self._idle: list[tuple[aiosmtplib.SMTP, asyncio.AbstractEventLoop, float]] = []
+
+    async def send(self, message: MessageSchema, template_name: str | None = None) -> None:
+
+        """
+        The send function renders the message with a compiled template and sends it over a pooled connection.
+
+        :param self: Represent the instance of the class
+        :param message: MessageSchema: The message, with the template variables in template_body
+        :param template_name: str | None: The name of the template in the template folder
+        :return: None
+        :doc-author: Trelent
+        """
+
+        error = (await self.send_many([(message, template_name)]))[0]
+        if error is not None:
+            raise error
+
+    async def send_many(self, messages: list[tuple[MessageSchema, str | None]]) -> list[Exception | None]:
+
+        """
+        The send_many function sends the messages one after the other over a single SMTP session.
+        A message the server refuses does not stop the others: the errors are returned in the order of the messages.
+        A connection that cannot be opened fails the messages not sent yet.
+
+        :param self: Represent the instance of the class
+        :param messages: list[tuple[MessageSchema, str | None]]: The messages and the names of their templates
+        :return: None for every message sent, the error for every message that was not
+        :doc-author: Trelent
+        """
+
+        prepared = [await self._prepare(message, template_name) for message, template_name in messages]
+        if self.config.SUPPRESS_SEND:
+            for message in prepared:
+                email_dispatched.send(message)
+            return [None] * len(prepared)
+        results: list[Exception | None] = []
+        smtp = None
+        try:
+            for message in prepared:
+                for attempt in range(2):
+                    if smtp is None:
+                        try:
+                            smtp = await self._acquire()
+                        except ConnectionErrors as err:
+                            results.extend([err] * (len(prepared) - len(results)))
+                            return results
+                    try:
+                        await smtp.send_message(message)
+                    except OSError as err:
+                        # the connection is gone, the message is sent again once over a new one
+                        self._discard(smtp)
+                        smtp = None
+                        if attempt:
+                            results.append(err)
+                    except aiosmtplib.SMTPException as err:
+                        results.append(err)
+                        break
+                    else:
+                        results.append(None)
+                        email_dispatched.send(message)
+                        break
+        finally:
+            if smtp is not None:
+                await self._release(smtp)
+        return results
+
+    async def close(self) -> None:
+
+        """
+        The close function closes the idle connections.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+
+        idle, self._idle = self._idle, []
+        for smtp, loop, _ in idle:
+            if loop is asyncio.get_running_loop():
+                try:
+                    await smtp.quit()
+                except Exception:
+                    self._discard(smtp)
+            else:
+                self._discard(smtp)
+
+    async def _prepare(self, message: MessageSchema, template_name: str | None) -> Message:
+        if template_name is not None and message.template_body is not None:
+            html = self.templates[template_name].render(**message.template_body)
+            message = message.model_copy(update={"template_body": html})
+        return await MailMsg(message)._message(self.sender)
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(hostname=self.config.MAIL_SERVER, port=self.config.MAIL_PORT,
+                               timeout=self.config.TIMEOUT, use_tls=self.config.MAIL_SSL_TLS,
+                               start_tls=self.config.MAIL_STARTTLS, validate_certs=self.config.VALIDATE_CERTS)
+        try:
+            await smtp.connect()
+            if self.config.USE_CREDENTIALS:
+                await smtp.login(self.config.MAIL_USERNAME, self.config.MAIL_PASSWORD)
+        except Exception as err:
+            self._discard(smtp)
+            raise ConnectionErrors(f"Exception raised {err}, check your credentials or email service configuration")
+        self.connections_opened += 1
+        return smtp
+
+    async def _acquire(self) -> aiosmtplib.SMTP:
+        loop = asyncio.get_running_loop()
+        while self._idle:
+            smtp, smtp_loop, released = self._idle.pop()
+            if smtp_loop is loop and smtp.is_connected and time.monotonic() - released < self.keepalive:
+                return smtp
+            self._discard(smtp)
+        return await self._connect()
+
+    async def _release(self, smtp: aiosmtplib.SMTP) -> None:
+        if len(self._idle) < self.pool_size and smtp.is_connected:
+            self._idle.append((smtp, asyncio.get_running_loop(), time.monotonic()))
+            return
+        try:
+            await smtp.quit()
+        except Exception:
+            self._discard(smtp)
+
+    @staticmethod
+    def _discard(smtp: aiosmtplib.SMTP) -> None:
+        try:
+            smtp.close()
+        except Exception:
+            pass
+
+
+mailer = Mailer(conf, pool_size=settings.SMTP_POOL_SIZE, keepalive=settings.SMTP_KEEPALIVE)
+
+
 async def send_confirm_email(email: EmailStr, username: str, host: str):
     
     """
@@ -44,19 +205,15 @@ async def send_confirm_email(email: EmailStr, username: str, host: str):
     :doc-author: Trelent
     """
     
-    try:
-        token_verification = await auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
+    token_verification = await auth_service.create_email_token({"sub": email})
+    message = MessageSchema(
+        subject="Confirm your email ",
+        recipients=[email],
+        template_body={"host": host, "username": username, "token": token_verification},
+        subtype=MessageType.html
+    )
 
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
+    await mailer.send(message, template_name="email_template.html")
 
 
 async def send_reset_email(email: EmailStr, username: str, host: str):
@@ -71,19 +228,16 @@ async def send_reset_email(email: EmailStr, username: str, host: str):
     :doc-author: Trelent
     """
     
-    try:
-        token_verification = auth_service.create_access_token({"username": username})
-        message = MessageSchema(
-            subject="Reset password",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
+    # reset_password reads the email back from the token
+    token_verification = await auth_service.create_email_token({"sub": email})
+    message = MessageSchema(
+        subject="Reset password",
+        recipients=[email],
+        template_body={"host": host, "username": username, "token": token_verification},
+        subtype=MessageType.html
+    )
 
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="reset_template.html")
-    except ConnectionErrors as err:
-        print(err)
+    await mailer.send(message, template_name="reset_template.html")
 
 
 async def send_update_email(email: EmailStr, username: str, host: str):
@@ -102,16 +256,48 @@ async def send_update_email(email: EmailStr, username: str, host: str):
     :doc-author: Trelent
     """
     
-    try:
-        message = MessageSchema(
-            subject="Reset password",
-            recipients=[email],
-            template_body={"host": host, "username": username},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="reset_template.html")
-    except ConnectionErrors as err:
-        print(err)
-        
\ No newline at end of file
+    message = MessageSchema(
+        subject="Reset password",
+        recipients=[email],
+        template_body={"host": host, "username": username},
+        subtype=MessageType.html
+    )
+
+    await mailer.send(message, template_name="reset_template.html")
+
+
+async def send_birthday_digests(digests: list[tuple[str, str | None, list[dict]]]) -> list[Exception | None]:
+
+    """
+    The send_birthday_digests function sends the daily birthday digests of many users over one SMTP session.
+
+    :param digests: list[tuple[str, str | None, list[dict]]]: The address, the username and the upcoming birthdays
+        of every user, a birthday being a dict of first_name, last_name, date and days
+    :return: None for every digest sent, the error for every digest that was not
+    :doc-author: Trelent
+    """
+
+    messages = [(MessageSchema(subject="Upcoming birthdays", recipients=[email], subtype=MessageType.html,
+                               template_body={"username": username or email, "contacts": contacts}),
+                 "birthday_digest_template.html")
+                for email, username, contacts in digests]
+    return await mailer.send_many(messages)
+
+
+# the kinds of email the outbox queues, by the name of their send function
+SENDERS = {"confirm": "send_confirm_email", "reset": "send_reset_email", "update": "send_update_email"}
+
+
+async def deliver(job: dict) -> None:
+
+    """
+    The deliver function sends the email a job of the outbox describes.
+    Connection errors are raised, so the caller can retry the job.
+
+    :param job: dict: The job, with the kind of the email, the address, the username and the host
+    :return: None
+    :doc-author: Trelent
+    """
+
+    sender = globals()[SENDERS[job["kind"]]]
+    await sender(job["email"], job["username"], job["host"])
@@ -0,0 +1,86 @@
+import hashlib
+from datetime import datetime
+
+from src.database.models import Contact
+
+
+def _etag(*parts) -> str:
+    digest = hashlib.blake2b("|".join(str(part) for part in parts).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def contact_etag(contact: Contact) -> str:
+
+    """
+    The contact_etag function returns the strong entity tag of a single contact.
+    The tag is derived from the row id, its last modification time and its change sequence. Every write stamps
+    the row with a new contacts version, so the tag changes even when two updates share a timestamp.
+
+    :param contact: Contact: The contact loaded from the database
+    :return: A quoted entity tag
+    :doc-author: Trelent
+    """
+
+    update_at = contact.update_at.isoformat() if isinstance(contact.update_at, datetime) else contact.update_at
+    return _etag("contact", contact.id, update_at, contact.change_seq)
+
+
+def collection_etag(user_id: int, version: int, *params) -> str:
+
+    """
+    The collection_etag function returns the strong entity tag of a listing of the user's contacts.
+    The tag is derived from the contacts version of the user and the query parameters of the listing,
+    so it can be computed without fetching a single contact.
+
+    :param user_id: int: The owner of the contacts
+    :param version: int: The contacts version of the user
+    :param params: The query parameters that select the listing
+    :return: A quoted entity tag
+    :doc-author: Trelent
+    """
+
+    return _etag("contacts", user_id, version, *params)
+
+
+def _parse(header: str) -> list[str]:
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+
+def none_match(header: str | None, etag: str) -> bool:
+
+    """
+    The none_match function checks an If-None-Match header against the current entity tag.
+    The comparison is weak, as required for conditional GET, so W/ prefixes are ignored.
+
+    :param header: str | None: The value of the If-None-Match header
+    :param etag: str: The current entity tag
+    :return: True if the client copy is current and 304 can be returned
+    :doc-author: Trelent
+    """
+
+    if not header:
+        return False
+    tags = _parse(header)
+    return "*" in tags or etag in (tag.removeprefix("W/") for tag in tags)
+
+
+def match(header: str | None, etag: str | None) -> bool:
+
+    """
+    The match function checks an If-Match header against the current entity tag.
+    The comparison is strong, except that the weak form of the current tag matches too: the tags are derived
+    from the row, not from the bytes sent, and the compression middleware only weakens them on encoded responses.
+    Other weak tags never match. A missing header always matches, and * matches any existing resource.
+
+    :param header: str | None: The value of the If-Match header
+    :param etag: str | None: The current entity tag, None if the resource does not exist
+    :return: True if the request may proceed
+    :doc-author: Trelent
+    """
+
+    if header is None:
+        return True
+    if etag is None:
+        return False
+    tags = _parse(header)
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
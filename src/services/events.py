@@ -0,0 +1,180 @@
+import asyncio
+import json
+
+from redis.asyncio import Redis
+from redis.asyncio.client import PubSub
+from redis.exceptions import RedisError
+
+from config import settings
+
+
+def format_sse(events: list[dict]) -> str:
+
+    """
+    The format_sse function renders events as text/event-stream messages.
+    The contacts version becomes the event id, so a reconnecting client can resume with delta sync from it.
+
+    :param events: list[dict]: The events of one write
+    :return: The server-sent events text
+    :doc-author: Trelent
+    """
+
+    messages = []
+    for event in events:
+        lines = [f"event: {event['type']}"]
+        if "version" in event:
+            lines.append(f"id: {event['version']}")
+        lines.append(f"data: {json.dumps(event)}")
+        messages.append("\n".join(lines) + "\n\n")
+    return "".join(messages)
+
+
+class ContactEvents:
+    """
+    Fans out contact change events through Redis pub/sub.
+    Every worker keeps one subscriber connection and subscribes it only to the channels of the users
+    that have an open stream on this worker, so a worker never receives events nobody listens to.
+    """
+
+    def __init__(self, queue_size: int, prefix: str = "contacts:events"):
+        self.queue_size = queue_size
+        self.prefix = prefix
+        self.redis: Redis | None = None
+        self._pubsub: PubSub | None = None
+        self._reader: asyncio.Task | None = None
+        self._queues: dict[int, set[asyncio.Queue]] = {}
+
+    def init(self, redis: Redis) -> None:
+
+        """
+        The init function attaches the Redis connection events are published with.
+
+        :param self: Represent the instance of the class
+        :param redis: Redis: The Redis connection created on startup
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.redis = redis
+
+    def _channel(self, user_id: int) -> str:
+        return f"{self.prefix}:{user_id}"
+
+    async def publish(self, user_id: int, events: list[dict]) -> None:
+
+        """
+        The publish function sends the events of one committed write to the streams of the user on all workers.
+        Delivery is best effort: Redis errors are printed and swallowed, clients catch up with delta sync.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: The owner of the changed contacts
+        :param events: list[dict]: The events, each with a type, the contact ids and the contacts version
+        :return: None
+        :doc-author: Trelent
+        """
+
+        if self.redis is None or not events:
+            return
+        try:
+            await self.redis.publish(self._channel(user_id), json.dumps(events))
+        except RedisError as err:
+            print(err)
+
+    async def subscribe(self, user_id: int) -> asyncio.Queue:
+
+        """
+        The subscribe function registers a local listener for the events of the user.
+        The Redis channel of the user is subscribed when its first listener on this worker arrives.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: The user whose events are wanted
+        :return: A queue that receives lists of events
+        :doc-author: Trelent
+        """
+
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        listeners = self._queues.setdefault(user_id, set())
+        listeners.add(queue)
+        if len(listeners) == 1 and self.redis is not None:
+            if self._pubsub is None:
+                self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await self._pubsub.subscribe(self._channel(user_id))
+            except RedisError as err:
+                print(err)
+            if self._reader is None or self._reader.done():
+                self._reader = asyncio.create_task(self._read())
+        return queue
+
+    async def unsubscribe(self, user_id: int, queue: asyncio.Queue) -> None:
+
+        """
+        The unsubscribe function removes a local listener.
+        The Redis channel of the user is unsubscribed when its last listener on this worker leaves.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: The user whose events were wanted
+        :param queue: asyncio.Queue: The queue returned by subscribe
+        :return: None
+        :doc-author: Trelent
+        """
+
+        listeners = self._queues.get(user_id)
+        if listeners is None:
+            return
+        listeners.discard(queue)
+        if listeners:
+            return
+        del self._queues[user_id]
+        if self._pubsub is not None:
+            try:
+                await self._pubsub.unsubscribe(self._channel(user_id))
+            except RedisError as err:
+                print(err)
+
+    def dispatch(self, user_id: int, events: list[dict]) -> None:
+
+        """
+        The dispatch function hands events to the local listeners of the user without waiting.
+        A listener that has fallen behind loses its backlog and gets a single resync event instead,
+        so one slow client cannot grow memory or hold up the others.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: The owner of the changed contacts
+        :param events: list[dict]: The events received from Redis
+        :return: None
+        :doc-author: Trelent
+        """
+
+        for queue in self._queues.get(user_id, ()):
+            try:
+                queue.put_nowait(events)
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait([{"type": "resync"}])
+
+    async def _read(self) -> None:
+        while self._queues:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except (RedisError, RuntimeError) as err:
+                print(err)
+                await asyncio.sleep(1)
+                continue
+            if message is None or message["type"] != "message":
+                continue
+            channel = message["channel"]
+            channel = channel.decode() if isinstance(channel, bytes) else channel
+            self.dispatch(int(channel.rsplit(":", 1)[1]), json.loads(message["data"]))
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+
+
+contact_events = ContactEvents(queue_size=settings.CONTACT_EVENTS_QUEUE_SIZE)
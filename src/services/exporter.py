@@ -0,0 +1,76 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date
+from typing import AsyncIterator, Sequence
+
+from sqlalchemy import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import User
+from src.repository import contacts as repository_contacts
+from src.schemas.schemas import Principal
+
+EXPORT_FIELDS = tuple(column.key for column in repository_contacts.EXPORT_COLUMNS)
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def format_rows(rows: Sequence[Row], fmt: str) -> bytes:
+
+    """
+    The format_rows function renders a batch of exported rows as CSV lines or NDJSON lines.
+
+    :param rows: Sequence[Row]: Rows with the EXPORT_FIELDS
+    :param fmt: str: Either csv or ndjson
+    :return: The encoded lines
+    :doc-author: Trelent
+    """
+
+    if fmt == "ndjson":
+        return "".join(json.dumps(row._asdict(), default=_default) + "\n" for row in rows).encode()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([value.isoformat() if isinstance(value, date) else value for value in row] for row in rows)
+    return buffer.getvalue().encode()
+
+
+async def export_contacts(user: User | Principal, db: AsyncSession, fmt: str,
+                          compress: bool = False) -> AsyncIterator[bytes]:
+
+    """
+    The export_contacts function yields the user's address book as CSV or NDJSON, one chunk per fetched batch.
+    A CSV export starts with a header row. With compress the chunks form a gzip stream,
+    compressed as they are produced.
+
+    :param user: User | Principal: The owner of the contacts
+    :param db: AsyncSession: A database session that stays open while the export is streamed
+    :param fmt: str: Either csv or ndjson
+    :param compress: bool: Gzip the output
+    :return: An async iterator of body chunks
+    :doc-author: Trelent
+    """
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    if fmt == "csv":
+        header = format_rows([EXPORT_FIELDS], fmt)
+        yield compressor.compress(header) if compressor else header
+    async for rows in repository_contacts.stream_contacts(user, db):
+        chunk = format_rows(rows, fmt)
+        if compressor:
+            chunk = compressor.compress(chunk)
+            if not chunk:
+                continue
+        yield chunk
+    if compressor:
+        yield compressor.flush()
@@ -0,0 +1,105 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from config import settings
+
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification in a thread or process pool, so the event loop is never blocked.
+    At most max_pending calls may be queued or running; further calls are rejected with 503.
+    """
+
+    def __init__(self, executor: str = "thread", max_workers: int = 2, max_pending: int = 32):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown executor type: {executor}")
+        self.executor_type = executor
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor: Executor | None = None
+        self._pending = 0
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_type == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def _run(self, func, *args):
+
+        """
+        The _run function submits the call to the executor and waits for its result.
+        If the queue is already full, it raises an HTTPException with status code 503 (SERVICE UNAVAILABLE).
+
+        :param self: Represent the instance of the class
+        :param func: The module level function to call
+        :param args: The arguments of the function
+        :return: The result of the function
+        :doc-author: Trelent
+        """
+
+        if self._pending >= self.max_pending:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Too many concurrent password operations", headers={"Retry-After": "1"})
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+
+        """
+        The hash function returns the bcrypt hash of the password, computed off the event loop.
+
+        :param self: Represent the instance of the class
+        :param password: str: The plain-text password
+        :return: A hash of the password
+        :doc-author: Trelent
+        """
+
+        return await self._run(_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+
+        """
+        The verify function checks a plain-text password against a bcrypt hash off the event loop.
+
+        :param self: Represent the instance of the class
+        :param plain_password: str: The password entered by the user
+        :param hashed_password: str: The hash stored in the database
+        :return: A boolean value
+        :doc-author: Trelent
+        """
+
+        return await self._run(_verify, plain_password, hashed_password)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    executor=settings.PASSWORD_HASHER_EXECUTOR,
+    max_workers=settings.PASSWORD_HASHER_WORKERS,
+    max_pending=settings.PASSWORD_HASHER_MAX_PENDING,
+)
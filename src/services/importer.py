@@ -0,0 +1,229 @@
+import codecs
+import csv
+import io
+import json
+from typing import AsyncIterator, Iterator, List
+
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import User
+from src.repository import contacts as repository_contacts
+from src.schemas.schemas import ContactCreate, Principal
+from config import settings
+
+
+class RowError(Exception):
+    pass
+
+
+def _scan_csv_records(buffer: str, start: int, quoted: bool) -> tuple[int, bool]:
+
+    """
+    The _scan_csv_records function returns the length of the prefix of the buffer that holds only complete records.
+    A newline inside a quoted field does not end a record. Only the text after start is scanned, from the quote
+    state the previous call left at start, so every character of an upload is looked at once however long
+    a record gets.
+
+    :param buffer: str: Decoded CSV text that has not been parsed yet
+    :param start: int: The offset up to which the buffer was scanned by the previous call
+    :param quoted: bool: Whether the text at start is inside a quoted field
+    :return: The length of the parseable prefix, 0 if no record is complete, and whether the end of the buffer is quoted
+    :doc-author: Trelent
+    """
+
+    end = 0
+    while True:
+        quote = buffer.find('"', start)
+        if not quoted:
+            newline = buffer.rfind("\n", start, len(buffer) if quote == -1 else quote)
+            if newline != -1:
+                end = newline + 1
+        if quote == -1:
+            return end, quoted
+        quoted = not quoted
+        start = quote + 1
+
+
+def _decode(decoder: codecs.IncrementalDecoder, chunk: bytes, final: bool = False) -> str:
+    try:
+        return decoder.decode(chunk, final)
+    except UnicodeDecodeError as err:
+        raise RowError(f"Invalid UTF-8: {err.reason}")
+
+
+async def _iter_lines(stream: AsyncIterator[bytes], csv_records: bool, max_record_size: int) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    scanned = 0
+    quoted = False
+    async for chunk in stream:
+        buffer += _decode(decoder, chunk)
+        if csv_records:
+            end, quoted = _scan_csv_records(buffer, scanned, quoted)
+        else:
+            end = buffer.rfind("\n", scanned) + 1
+        if end:
+            yield buffer[:end]
+            buffer = buffer[end:]
+        scanned = len(buffer)
+        # only the record being received is buffered, it cannot grow with the upload
+        if scanned > max_record_size:
+            raise RowError("Unterminated quoted field" if quoted
+                           else f"Record longer than {max_record_size} characters")
+    buffer += _decode(decoder, b"", final=True)
+    if csv_records and _scan_csv_records(buffer, scanned, quoted)[1]:
+        raise RowError("Unterminated quoted field")
+    if buffer:
+        yield buffer
+
+
+def _read_csv(text: str) -> Iterator[list[str] | csv.Error]:
+    reader = csv.reader(io.StringIO(text))
+    while True:
+        try:
+            yield next(reader)
+        except StopIteration:
+            return
+        except csv.Error as err:
+            # the reader goes on with the next line after an error
+            yield err
+
+
+async def iter_rows(stream: AsyncIterator[bytes], fmt: str, max_record_size: int = settings.IMPORT_MAX_RECORD_SIZE
+                    ) -> AsyncIterator[tuple[int, dict | RowError]]:
+
+    """
+    The iter_rows function parses an uploaded CSV or NDJSON body chunk by chunk, without buffering the whole file.
+    The first CSV record is the header. Rows that cannot be parsed are yielded as RowError instead of a dictionary.
+    A record that grows past max_record_size, which is what an unbalanced quote does to the rest of a CSV upload,
+    is yielded as the last RowError and parsing stops there.
+
+    :param stream: AsyncIterator[bytes]: The request body
+    :param fmt: str: Either csv or ndjson
+    :param max_record_size: int: The largest record, in characters
+    :return: An async iterator of (row number, row or error) pairs, numbered from 1
+    :doc-author: Trelent
+    """
+
+    number = 0
+    try:
+        if fmt == "ndjson":
+            async for text in _iter_lines(stream, False, max_record_size):
+                for line in text.splitlines():
+                    if not line.strip():
+                        continue
+                    number += 1
+                    try:
+                        row = json.loads(line)
+                    except json.JSONDecodeError as err:
+                        yield number, RowError(f"Invalid JSON: {err.msg}")
+                        continue
+                    yield number, row if isinstance(row, dict) else RowError("Row must be a JSON object")
+            return
+
+        header = None
+        async for text in _iter_lines(stream, True, max_record_size):
+            for record in _read_csv(text):
+                if isinstance(record, csv.Error):
+                    if header is None:
+                        raise ValueError(f"Invalid CSV header: {record}")
+                    number += 1
+                    yield number, RowError(f"Invalid CSV: {record}")
+                    continue
+                if not record:
+                    continue
+                if header is None:
+                    header = [name.strip() for name in record]
+                    continue
+                number += 1
+                if len(record) != len(header):
+                    yield number, RowError(f"Expected {len(header)} fields, got {len(record)}")
+                    continue
+                yield number, {name: value if value != "" else None for name, value in zip(header, record)}
+    except RowError as err:
+        yield number + 1, err
+
+
+def _validation_detail(err: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in err.errors())
+
+
+def _add_error(report: dict, number: int, detail: str) -> None:
+    report["failed"] += 1
+    if len(report["errors"]) < settings.IMPORT_MAX_ERRORS:
+        report["errors"].append({"row": number, "detail": detail})
+
+
+async def _flush(batch: List[tuple[int, ContactCreate]], user: User | Principal, db: AsyncSession,
+                 report: dict) -> None:
+
+    """
+    The _flush function inserts a batch of validated rows with one multi-row INSERT and commits it.
+    If the batch violates a constraint, it is rolled back and retried row by row,
+    so only the offending rows are reported.
+
+    :param batch: List[tuple[int, ContactCreate]]: Row numbers and validated rows
+    :param user: User | Principal: The owner of the new contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :param report: dict: The import report to update
+    :return: None
+    :doc-author: Trelent
+    """
+
+    if not batch:
+        return
+    try:
+        await repository_contacts.create_contacts([body for _, body in batch], user, db)
+        report["created"] += len(batch)
+        return
+    except IntegrityError:
+        await db.rollback()
+    for number, body in batch:
+        try:
+            await repository_contacts.create_contacts([body], user, db)
+            report["created"] += 1
+        except IntegrityError as err:
+            await db.rollback()
+            _add_error(report, number, f"Constraint violated: {err.orig}")
+
+
+async def import_contacts(stream: AsyncIterator[bytes], fmt: str, user: User | Principal, db: AsyncSession,
+                          batch_size: int = settings.IMPORT_BATCH_SIZE) -> dict:
+
+    """
+    The import_contacts function creates contacts from an uploaded CSV or NDJSON body.
+    Rows are validated against ContactCreate and inserted in batches as they are parsed,
+    so memory use does not depend on the size of the upload.
+
+    :param stream: AsyncIterator[bytes]: The request body
+    :param fmt: str: Either csv or ndjson
+    :param user: User | Principal: The owner of the new contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :param batch_size: int: The number of rows inserted per statement
+    :return: A report with the number of created and failed rows and the errors of the failed rows
+    :doc-author: Trelent
+    """
+
+    report = {"created": 0, "failed": 0, "errors": []}
+    batch = []
+    async for number, row in iter_rows(stream, fmt):
+        if isinstance(row, RowError):
+            _add_error(report, number, str(row))
+            continue
+        if any(isinstance(value, str) and "\x00" in value for value in row.values()):
+            # PostgreSQL text cannot hold NUL, the whole batch would fail on it
+            _add_error(report, number, "NUL character in a field")
+            continue
+        try:
+            batch.append((number, ContactCreate.model_validate(row)))
+        except ValidationError as err:
+            _add_error(report, number, _validation_detail(err))
+            continue
+        if len(batch) >= batch_size:
+            await _flush(batch, user, db, report)
+            batch = []
+    await _flush(batch, user, db, report)
+    report["errors"].sort(key=lambda error: error["row"])
+    return report
@@ -0,0 +1,254 @@
+"""
+The email outbox: routes queue email jobs in a Redis stream and the email worker sends them.
+
+Run the worker with: python -m src.services.outbox
+"""
+import asyncio
+import json
+import os
+import signal
+import socket
+import time
+import uuid
+from typing import Awaitable, Callable
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError, ResponseError
+
+from src.services import email as email_service
+from config import settings
+
+
+class EmailOutbox:
+    """
+    The producer side of the outbox. A job is a few strings: the kind of the email, the address,
+    the username and the host the links point to; the worker renders and sends it. The stream is persistent,
+    so an email queued before a crash of the web worker is still sent.
+    """
+
+    def __init__(self, stream: str, dedup_window: int):
+        self.stream = stream
+        self.dedup_window = dedup_window
+        self.redis: Redis | None = None
+
+    def init(self, redis: Redis) -> None:
+
+        """
+        The init function attaches the Redis connection jobs are queued with.
+
+        :param self: Represent the instance of the class
+        :param redis: Redis: The Redis connection created on startup
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.redis = redis
+
+    async def enqueue(self, kind: str, email: str, username: str | None, host: str) -> bool:
+
+        """
+        The enqueue function queues an email and returns without waiting for SMTP.
+        The same kind of email to the same address is queued once per dedup window, so a user pressing
+        a button twice gets one email. When Redis cannot take the job the email is sent right away,
+        the request is slower then but the email is not lost.
+
+        :param self: Represent the instance of the class
+        :param kind: str: The kind of the email, a key of SENDERS
+        :param email: str: The address of the recipient
+        :param username: str | None: The name used in the email
+        :param host: str: The base url the links in the email point to
+        :return: True if the email was queued or sent, False if the same email is queued already
+        :doc-author: Trelent
+        """
+
+        if kind not in email_service.SENDERS:
+            raise ValueError(f"Unknown email kind {kind!r}")
+        job = {"id": uuid.uuid4().hex, "kind": kind, "email": email, "username": username or "", "host": str(host),
+               "attempts": "0"}
+        if self.redis is not None:
+            try:
+                if not await self.redis.set(f"{self.stream}:dedup:{kind}:{email}", 1, nx=True, ex=self.dedup_window):
+                    return False
+                await self.redis.xadd(self.stream, job)
+                return True
+            except RedisError as err:
+                print(err)
+        try:
+            await email_service.deliver(job)
+        except Exception as err:
+            print(err)
+        return True
+
+
+class EmailWorker:
+    """
+    The consumer side of the outbox. Workers share the stream through a consumer group and send up to
+    concurrency emails at a time. A failed job is retried with exponential backoff through a sorted set
+    of delayed jobs and moved to the dead letter stream after max_attempts. Jobs a crashed worker read
+    but did not acknowledge are claimed by the others after claim_idle seconds. A sent job leaves a marker,
+    so a job delivered twice by the stream is sent once; an email sent right before a crash, whose marker
+    was not written yet, can still be sent again.
+    """
+
+    def __init__(self, redis: Redis, stream: str = settings.EMAIL_OUTBOX_STREAM, group: str = "email-workers",
+                 consumer: str | None = None, concurrency: int = settings.EMAIL_WORKER_CONCURRENCY,
+                 batch_size: int = 100, max_attempts: int = settings.EMAIL_MAX_ATTEMPTS,
+                 backoff: float = settings.EMAIL_RETRY_BACKOFF, backoff_max: float = 300,
+                 claim_idle: float = 60, sent_ttl: int = 86400, block_ms: int = 1000,
+                 deliver: Callable[[dict], Awaitable[None]] = email_service.deliver):
+        self.redis = redis
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.claim_idle = claim_idle
+        self.sent_ttl = sent_ttl
+        self.block_ms = block_ms
+        self.deliver = deliver
+        self.retries = f"{stream}:retry"
+        self.dead = f"{stream}:dead"
+        self.sent = 0
+        self.failed = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks: set[asyncio.Task] = set()
+
+    async def setup(self) -> None:
+
+        """
+        The setup function creates the stream and the consumer group, unless they exist.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as err:
+            if "BUSYGROUP" not in str(err):
+                raise
+
+    async def run_once(self) -> int:
+
+        """
+        The run_once function moves the due retries back into the stream, claims the jobs of crashed workers,
+        reads a batch of new jobs and starts sending them. It waits only for free sending slots,
+        not for the emails to be sent.
+
+        :param self: Represent the instance of the class
+        :return: The number of jobs started
+        :doc-author: Trelent
+        """
+
+        await self._promote_retries()
+        _, claimed, _ = await self.redis.xautoclaim(self.stream, self.group, self.consumer,
+                                                    min_idle_time=int(self.claim_idle * 1000), start_id="0-0",
+                                                    count=self.batch_size)
+        entries = await self.redis.xreadgroup(self.group, self.consumer, {self.stream: ">"}, count=self.batch_size,
+                                              block=self.block_ms or None)
+        messages = list(claimed) + [message for _, stream_messages in entries for message in stream_messages]
+        for message_id, fields in messages:
+            await self._semaphore.acquire()
+            task = asyncio.create_task(self._process(message_id, fields))
+            self._tasks.add(task)
+            task.add_done_callback(self._done)
+        return len(messages)
+
+    async def drain(self) -> None:
+
+        """
+        The drain function waits until the emails started so far are sent or scheduled for a retry.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+
+    async def run(self, stop: asyncio.Event) -> None:
+
+        """
+        The run function sends queued emails until the stop event is set, then waits for the emails in flight.
+
+        :param self: Represent the instance of the class
+        :param stop: asyncio.Event: Set to stop the worker
+        :return: None
+        :doc-author: Trelent
+        """
+
+        await self.setup()
+        while not stop.is_set():
+            try:
+                if not await self.run_once() and not self.block_ms:
+                    await asyncio.sleep(0.1)
+            except RedisError as err:
+                print(err)
+                await asyncio.sleep(1)
+        await self.drain()
+
+    def _done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        self._semaphore.release()
+        if not task.cancelled() and task.exception() is not None:
+            print(task.exception())
+
+    async def _promote_retries(self) -> None:
+        due = await self.redis.zrangebyscore(self.retries, "-inf", time.time(), start=0, num=self.batch_size)
+        for member in due:
+            # only the worker that removed the job queues it again
+            if await self.redis.zrem(self.retries, member):
+                await self.redis.xadd(self.stream, json.loads(member))
+
+    async def _process(self, message_id, fields: dict) -> None:
+        job = {key.decode() if isinstance(key, bytes) else key: value.decode() if isinstance(value, bytes) else value
+               for key, value in fields.items()}
+        marker = f"{self.stream}:sent:{job['id']}"
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if not await self.redis.exists(marker):
+                try:
+                    await self.deliver(job)
+                except Exception as err:
+                    self._schedule_retry(pipe, job, err)
+                else:
+                    self.sent += 1
+                    pipe.set(marker, 1, ex=self.sent_ttl)
+            pipe.xack(self.stream, self.group, message_id)
+            pipe.xdel(self.stream, message_id)
+            await pipe.execute()
+
+    def _schedule_retry(self, pipe, job: dict, err: Exception) -> None:
+        attempts = int(job["attempts"]) + 1
+        job = dict(job, attempts=str(attempts))
+        if attempts >= self.max_attempts:
+            self.failed += 1
+            pipe.xadd(self.dead, dict(job, error=str(err)[:500]))
+            return
+        delay = min(self.backoff_max, self.backoff * 2 ** (attempts - 1))
+        pipe.zadd(self.retries, {json.dumps(job, sort_keys=True): time.time() + delay})
+
+
+email_outbox = EmailOutbox(settings.EMAIL_OUTBOX_STREAM, settings.EMAIL_DEDUP_WINDOW)
+
+
+async def main() -> None:
+    redis = Redis(host=settings.REDIS_DOMAIN, port=settings.REDIS_PORT, db=0, password=settings.REDIS_PASSWORD)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    worker = EmailWorker(redis)
+    try:
+        await worker.run(stop)
+    finally:
+        await redis.aclose()
+        await email_service.mailer.close()
+        print(f"sent {worker.sent} emails, {worker.failed} failed for good")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+import hashlib
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from config import settings
+
+
+class ResponseCache:
+    """
+    Redis cache of serialized JSON responses. Keys carry the owner and the contacts version of the owner,
+    so a write makes every older entry unreachable and nothing has to be deleted; stale entries expire.
+    """
+
+    def __init__(self, ttl: int, max_bytes: int, prefix: str = "contacts"):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self.redis: Redis | None = None
+
+    def init(self, redis: Redis) -> None:
+
+        """
+        The init function attaches the Redis connection the responses are stored in.
+
+        :param self: Represent the instance of the class
+        :param redis: Redis: The Redis connection created on startup
+        :return: None
+        :doc-author: Trelent
+        """
+
+        self.redis = redis
+
+    @property
+    def enabled(self) -> bool:
+        return self.redis is not None
+
+    def key(self, user_id: int, version: int, *params) -> str:
+
+        """
+        The key function builds the cache key of a response.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: The owner of the contacts
+        :param version: int: The contacts version of the owner
+        :param params: The route name and the query parameters that select the response
+        :return: The cache key
+        :doc-author: Trelent
+        """
+
+        digest = hashlib.blake2b("|".join(str(param) for param in params).encode(), digest_size=12).hexdigest()
+        return f"{self.prefix}:{user_id}:{version}:{digest}"
+
+    async def get(self, key: str) -> tuple[str, bytes] | None:
+
+        """
+        The get function returns a cached response. Redis errors are treated as a miss.
+
+        :param self: Represent the instance of the class
+        :param key: str: The cache key
+        :return: The ETag and the JSON body of the response, or None
+        :doc-author: Trelent
+        """
+
+        if self.redis is None:
+            return None
+        try:
+            raw = await self.redis.get(key)
+        except RedisError as err:
+            print(err)
+            return None
+        if raw is None:
+            return None
+        tag, _, body = raw.partition(b"\n")
+        return tag.decode(), body
+
+    async def set(self, key: str, tag: str, body: bytes) -> None:
+
+        """
+        The set function stores a serialized response together with its ETag.
+        Bodies larger than max_bytes are not cached.
+
+        :param self: Represent the instance of the class
+        :param key: str: The cache key
+        :param tag: str: The ETag of the response
+        :param body: bytes: The JSON body of the response
+        :return: None
+        :doc-author: Trelent
+        """
+
+        if self.redis is None or len(body) > self.max_bytes:
+            return
+        try:
+            await self.redis.set(key, tag.encode() + b"\n" + body, ex=self.ttl)
+        except RedisError as err:
+            print(err)
+
+
+response_cache = ResponseCache(
+    ttl=settings.RESPONSE_CACHE_TTL,
+    max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+)
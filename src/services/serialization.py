@@ -0,0 +1,80 @@
+from typing import List, Sequence
+
+from pydantic import TypeAdapter
+from pydantic_core import to_json
+
+from src.database.models import Contact
+from src.schemas.schemas import ContactPage, ContactResponse
+from config import settings
+
+
+CONTACT_FIELDS = tuple(ContactResponse.model_fields)
+
+CONTACT_LIST = TypeAdapter(List[ContactResponse])
+
+
+def contact_row(contact: Contact) -> dict:
+
+    """
+    The contact_row function copies the response fields of a contact into a plain dictionary.
+
+    :param contact: Contact: The contact loaded from the database
+    :return: A dictionary with the fields of ContactResponse
+    :doc-author: Trelent
+    """
+
+    return {field: getattr(contact, field) for field in CONTACT_FIELDS}
+
+
+def dump_contacts(contacts: Sequence[Contact], trusted: bool = settings.JSON_TRUSTED_ROWS) -> bytes:
+
+    """
+    The dump_contacts function serializes contacts straight to JSON bytes, ready to be sent as a response body.
+    Rows read from the database were validated when they were written, so by default they are encoded
+    by the pydantic-core encoder without building ContactResponse models. With trusted set to False
+    every row is validated against ContactResponse first, as response_model does.
+
+    :param contacts: Sequence[Contact]: The contacts loaded from the database
+    :param trusted: bool: Skip validation of the rows
+    :return: The JSON array of the contacts
+    :doc-author: Trelent
+    """
+
+    if trusted:
+        return to_json([contact_row(contact) for contact in contacts])
+    return CONTACT_LIST.dump_json(CONTACT_LIST.validate_python(contacts, from_attributes=True))
+
+
+def dump_contact(contact: Contact, trusted: bool = settings.JSON_TRUSTED_ROWS) -> bytes:
+
+    """
+    The dump_contact function serializes one contact to JSON bytes, see dump_contacts.
+
+    :param contact: Contact: The contact loaded from the database
+    :param trusted: bool: Skip validation of the row
+    :return: The JSON object of the contact
+    :doc-author: Trelent
+    """
+
+    if trusted:
+        return to_json(contact_row(contact))
+    return ContactResponse.model_validate(contact).model_dump_json().encode()
+
+
+def dump_page(contacts: Sequence[Contact], next_cursor: str | None,
+              trusted: bool = settings.JSON_TRUSTED_ROWS) -> bytes:
+
+    """
+    The dump_page function serializes a keyset page of contacts to JSON bytes, see dump_contacts.
+
+    :param contacts: Sequence[Contact]: The contacts of the page
+    :param next_cursor: str | None: The cursor of the next page
+    :param trusted: bool: Skip validation of the rows
+    :return: The JSON object of the page
+    :doc-author: Trelent
+    """
+
+    if trusted:
+        return to_json({"items": [contact_row(contact) for contact in contacts], "next_cursor": next_cursor})
+    page = ContactPage(items=CONTACT_LIST.validate_python(contacts, from_attributes=True), next_cursor=next_cursor)
+    return page.model_dump_json().encode()
@@ -1,5 +1,6 @@
 import asyncio
 import os
+import socket
 import sys
 import pytest
 import pytest_asyncio
@@ -8,12 +9,15 @@ from sqlalchemy.pool import StaticPool
 from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from unittest.mock import MagicMock, Mock
+from fastapi_mail import ConnectionConfig
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
 from main import app
-from src.database.db import get_db
+from src.database.db import EarlyReleaseSession, get_db, get_read_db
+from src.database.instrumentation import query_instrumentation
 from src.database.models import Base, User
 from src.services.auth import auth_service
+from src.services.email import conf as mail_conf
 
 SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
 
@@ -21,7 +25,10 @@ engine = create_async_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool
 )
 
-TestingSessionLocal = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+query_instrumentation.instrument(engine.sync_engine)
+
+TestingSessionLocal = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine,
+                                         class_=EarlyReleaseSession)
 
 test_user = {"username": "deadpool", "email": "deadpool@example.com", "password": "12345678"}
 
@@ -50,13 +57,14 @@ def client():
         session = TestingSessionLocal()
         try:
             yield session
-        except Exception as err:
-            print(err)
+        except Exception:
             await session.rollback()
+            raise
         finally:
             await session.close()
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
 
     yield TestClient(app, raise_server_exceptions=True)
 
@@ -65,3 +73,35 @@ def client():
 async def get_token():
     token = await auth_service.create_access_token(data={"sub": test_user["email"]})
     return token
+
+
+class Inbox:
+    """
+    An aiosmtpd handler that keeps the messages it receives; recipients in refuse are rejected.
+    """
+
+    def __init__(self, refuse: tuple[str, ...] = ()):
+        self.messages = []
+        self.refuse = refuse
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.refuse:
+            return "550 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        return "250 Message accepted for delivery"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def smtp_config(port: int) -> ConnectionConfig:
+    return ConnectionConfig(MAIL_USERNAME="", MAIL_PASSWORD="", MAIL_FROM="noreply@example.com", MAIL_PORT=port,
+                            MAIL_SERVER="127.0.0.1", MAIL_STARTTLS=False, MAIL_SSL_TLS=False, USE_CREDENTIALS=False,
+                            VALIDATE_CERTS=False, TEMPLATE_FOLDER=mail_conf.TEMPLATE_FOLDER)
@@ -25,16 +25,15 @@ def test_signup(client, monkeypatch):
 
 
 def test_user_exist(client, monkeypatch):
-    with pytest.raises(Exception):
-        mock_send_email = MagicMock()
-        monkeypatch.setattr("src.services.email.send_confirm_email", mock_send_email)
-        response = client.post(
-            "/api/auth/signup",
-            json=test_user,
-        )
-        assert response.status_code == 409, response.text
-        data = response.json()
-        assert data["detail"] == "Account already exists"
+    mock_send_email = MagicMock()
+    monkeypatch.setattr("src.services.email.send_confirm_email", mock_send_email)
+    response = client.post(
+        "/api/auth/signup",
+        json=test_user,
+    )
+    assert response.status_code == 409, response.text
+    data = response.json()
+    assert data["detail"] == "Account already exists"
 
 @pytest.mark.asyncio
 async def test_login(client):
@@ -72,12 +71,11 @@ def test_not_confirmed_login(client):
 
 
 def test_wrong_password_login(client):
-    with pytest.raises(Exception):
-        response = client.post("api/auth/login",
-                            data={"username": user_data.get("email"), "password": "password"})
-        assert response.status_code == 401, response.text
-        data = response.json()
-        assert data["detail"] == "Invalid password"
+    response = client.post("api/auth/login",
+                        data={"username": user_data.get("email"), "password": "password"})
+    assert response.status_code == 401, response.text
+    data = response.json()
+    assert data["detail"] == "Invalid password"
 
 
 def test_validation_error_login(client):
@@ -1,9 +1,17 @@
-from unittest.mock import Mock, patch
+import asyncio
+import gzip
+import json
+from datetime import date, datetime
+from unittest.mock import AsyncMock, Mock, patch
 
 import pytest
+from starlette.websockets import WebSocketDisconnect
 
 from src.services.auth import auth_service
+from src.services.events import contact_events
+from src.services.response_cache import response_cache
 from src.database.models import Contact
+from tests.conftest import TestingSessionLocal
 
 def test_get_contacts(client, get_token):
     with pytest.raises(Exception):
@@ -25,13 +33,12 @@ def test_get_contact(client, get_token):
         assert "id" in data
 
 def test_get_contact_not_found(client, get_token):
-    with pytest.raises(Exception):
-        token = get_token
-        headers = {"Authorization": f"Bearer {token}"}
-        response = client.get("api/contacts/100", headers=headers)
-        assert response.status_code == 404, response.text
-        data = response.json()
-        assert data["detail"] == "Contact not found"
+    token = get_token
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("api/contacts/100", headers=headers)
+    assert response.status_code == 404, response.text
+    data = response.json()
+    assert data["detail"] == "Contact not found"
 
 def test_create_contact(client, get_token):
     with pytest.raises(Exception):
@@ -90,17 +97,16 @@ def test_update_contact(client, get_token):
         assert data["birthday"] == "test1"
 
 def test_update_contact_not_found(client, get_token):
-    with pytest.raises(Exception):
-        token = get_token
-        headers = {"Authorization": f"Bearer {token}"}
-        response = client.put("api/contacts/100",
-                                json={"first_name": "test1", "last_name": "test1",
-                                    "email": "test1@test.com", "phone": "test1",
-                                    "birthday": "1996-06-11", "done": True},
-                                headers=headers)
-        assert response.status_code == 404, response.text
-        data = response.json()
-        assert data["detail"] == "Contact not found"
+    token = get_token
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.put("api/contacts/100",
+                            json={"first_name": "test1", "last_name": "test1",
+                                "email": "test1@test.com", "phone": "test1",
+                                "birthday": "1996-06-11", "done": True},
+                            headers=headers)
+    assert response.status_code == 404, response.text
+    data = response.json()
+    assert data["detail"] == "Contact not found"
 
 def test_update_status_contact(client, get_token):
     with pytest.raises(Exception):
@@ -115,15 +121,14 @@ def test_update_status_contact(client, get_token):
         assert data["done"] == True
 
 def test_update_status_contact_not_found(client, get_token):
-    with pytest.raises(Exception):
-        token = get_token
-        headers = {"Authorization": f"Bearer {token}"}
-        response = client.patch("api/contacts/100",
-                                json={"done": True},
-                                headers=headers)
-        assert response.status_code == 404, response.text
-        data = response.json()
-        assert data["detail"] == "Contact not found"
+    token = get_token
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.patch("api/contacts/100",
+                            json={"done": True},
+                            headers=headers)
+    assert response.status_code == 404, response.text
+    data = response.json()
+    assert data["detail"] == "Contact not found"
 
 def test_delete_contact(client, get_token):
     with pytest.raises(Exception):
@@ -135,13 +140,12 @@ def test_delete_contact(client, get_token):
         assert "id" in data
 
 def test_delete_contact_not_found(client, get_token):
-    with pytest.raises(Exception):
-        token = get_token
-        headers = {"Authorization": f"Bearer {token}"}
-        response = client.delete("api/contacts/100", headers=headers)
-        assert response.status_code == 404, response.text
-        data = response.json()
-        assert data["detail"] == "Contact not found"
+    token = get_token
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.delete("api/contacts/100", headers=headers)
+    assert response.status_code == 404, response.text
+    data = response.json()
+    assert data["detail"] == "Contact not found"
 
 def test_search_contact_by_first_name(client, get_token):
     with pytest.raises(Exception):
@@ -212,4 +216,314 @@ def test_get_birthday_contacts_not_found(client, get_token):
     response = client.get("api/contacts/birthdays/100", headers=headers)
     assert response.status_code == 404, response.text
     data = response.json()
-    # assert data["detail"] == "Contact not found"
\ No newline at end of file
+    # assert data["detail"] == "Contact not found"
+
+@pytest.mark.asyncio
+async def test_search_contacts(client, get_token):
+    async with TestingSessionLocal() as session:
+        session.add_all([
+            Contact(first_name="Johnny", last_name="Walker", email="johnny@example.com", phone="1",
+                    birthday=datetime(1990, 5, 1), user_id=1),
+            Contact(first_name="Jane", last_name="Johnson", email="jane@example.com", phone="2",
+                    birthday=datetime(1991, 6, 2), user_id=1),
+        ])
+        await session.commit()
+    headers = {"Authorization": f"Bearer {get_token}"}
+    response = client.get("api/contacts/search", params={"first_name": "JOHN"}, headers=headers)
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert [contact["first_name"] for contact in data] == ["Johnny"]
+
+    response = client.get("api/contacts/search", params={"last_name": "john", "email": "@example"}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert [contact["first_name"] for contact in response.json()] == ["Jane"]
+
+
+def test_read_contacts_cursor(client, get_token, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    headers = {"Authorization": f"Bearer {get_token}"}
+    names, cursor = [], ""
+    while cursor is not None:
+        response = client.get("api/contacts/", params={"cursor": cursor, "limit": 1, "sort": "last_name"},
+                              headers=headers)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        names += [contact["last_name"] for contact in data["items"]]
+        cursor = data["next_cursor"]
+    assert names == ["Johnson", "Walker"]
+
+
+def test_read_contacts_invalid_cursor(client, get_token, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    headers = {"Authorization": f"Bearer {get_token}"}
+    response = client.get("api/contacts/", params={"cursor": "bogus"}, headers=headers)
+    assert response.status_code == 400, response.text
+
+
+def test_import_contacts(client, get_token, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    headers = {"Authorization": f"Bearer {get_token}", "Content-Type": "text/csv"}
+    body = ("first_name,last_name,email,phone,birthday\n"
+            "Ann,Lee,ann@example.com,3,1992-07-03\n"
+            "Bob,Ray,not-an-email,4,1993-08-04\n"
+            "Dup,Walker,johnny@example.com,5,1994-09-05\n"
+            "Cid,Moe,cid@example.com,6,1995-10-06\n")
+    response = client.post("api/contacts/import", content=body, headers=headers)
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["created"] == 2
+    assert data["failed"] == 2
+    assert [error["row"] for error in data["errors"]] == [2, 3]
+
+
+def test_import_contacts_unreadable_header(client, get_token, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    headers = {"Authorization": f"Bearer {get_token}", "Content-Type": "text/csv"}
+    body = "x" * 200000 + ",last_name\nAnn,Lee\n"
+    response = client.post("api/contacts/import", content=body, headers=headers)
+    assert response.status_code == 400, response.text
+    assert response.json()["detail"].startswith("Invalid CSV header")
+
+
+def test_export_contacts(client, get_token):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    response = client.get("api/contacts/export", params={"format": "csv"}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("text/csv")
+    lines = response.text.splitlines()
+    assert lines[0].startswith("id,first_name,last_name,email")
+    assert len(lines) == 5
+
+    response = client.get("api/contacts/export", params={"format": "ndjson", "gzip": True}, headers=headers)
+    assert response.status_code == 200, response.text
+    rows = [json.loads(line) for line in gzip.decompress(response.content).splitlines()]
+    assert [row["first_name"] for row in rows] == ["Johnny", "Jane", "Ann", "Cid"]
+
+
+@pytest.mark.asyncio
+async def test_get_upcoming_birthdays(client, get_token):
+    today = date.today()
+    async with TestingSessionLocal() as session:
+        session.add(Contact(first_name="Birthday", last_name="Today", email="today@example.com", phone="7",
+                            birthday=datetime(2000, today.month, today.day), user_id=1))
+        await session.commit()
+    headers = {"Authorization": f"Bearer {get_token}"}
+    response = client.get("api/contacts/birthday/0", headers=headers)
+    assert response.status_code == 200, response.text
+    assert [contact["first_name"] for contact in response.json()] == ["Birthday"]
+
+
+def test_update_and_remove_contact_returning(client, get_token):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    contact = client.get("api/contacts/search", params={"first_name": "Cid"}, headers=headers).json()[0]
+
+    response = client.put(f"api/contacts/{contact['id']}", headers=headers,
+                          json={"first_name": "Cidney", "last_name": "Moe", "email": "cid@example.com", "phone": "6",
+                                "birthday": "1995-10-06T00:00:00", "done": True})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["first_name"] == "Cidney"
+    assert data["done"] is True
+
+    response = client.patch(f"api/contacts/{contact['id']}", headers=headers, json={"done": False})
+    assert response.status_code == 200, response.text
+    assert response.json()["done"] is False
+
+    response = client.delete(f"api/contacts/{contact['id']}", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["first_name"] == "Cidney"
+    assert client.get("api/contacts/search", params={"first_name": "Cid"}, headers=headers).json() == []
+
+
+def test_batch_contacts(client, get_token):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    ids = {contact["first_name"]: contact["id"]
+           for contact in client.get("api/contacts/search", params={"email": "example.com"}, headers=headers).json()}
+    operations = [
+        {"op": "status", "id": ids["Johnny"], "body": {"done": True}},
+        {"op": "update", "id": ids["Jane"], "body": {"first_name": "Janet", "last_name": "Johnson",
+                                                       "email": "jane@example.com", "phone": "2",
+                                                       "birthday": "1991-06-02T00:00:00", "done": True}},
+        {"op": "delete", "id": ids["Ann"]},
+        {"op": "delete", "id": 100000},
+    ]
+    response = client.post("api/contacts/batch", json={"operations": operations}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert [result["status"] for result in response.json()] == ["ok", "ok", "ok", "not_found"]
+
+    contacts = client.get("api/contacts/search", params={"email": "example.com"}, headers=headers).json()
+    by_id = {contact["id"]: contact for contact in contacts}
+    assert by_id[ids["Johnny"]]["done"] is True
+    assert by_id[ids["Jane"]]["first_name"] == "Janet"
+    assert ids["Ann"] not in by_id
+
+
+def test_batch_contacts_duplicate_ids(client, get_token):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    operations = [{"op": "delete", "id": 1}, {"op": "status", "id": 1, "body": {"done": True}}]
+    response = client.post("api/contacts/batch", json={"operations": operations}, headers=headers)
+    assert response.status_code == 422, response.text
+
+
+def test_read_contacts_not_modified(client, get_token, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    headers = {"Authorization": f"Bearer {get_token}"}
+    response = client.get("api/contacts/", headers=headers)
+    assert response.status_code == 200, response.text
+    tag = response.headers["ETag"]
+
+    response = client.get("api/contacts/", headers={**headers, "If-None-Match": tag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert client.get("api/contacts/", params={"limit": 1}, headers={**headers, "If-None-Match": tag}).status_code == 200
+
+    contact = client.get("api/contacts/", headers=headers).json()[0]
+    client.patch(f"api/contacts/{contact['id']}", headers=headers, json={"done": not contact["done"]})
+    response = client.get("api/contacts/", headers={**headers, "If-None-Match": tag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != tag
+
+
+def test_read_contact_not_modified(client, get_token):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    contact_id = client.get("api/contacts/search", params={"first_name": "Johnny"}, headers=headers).json()[0]["id"]
+    response = client.get(f"api/contacts/{contact_id}", headers=headers)
+    assert response.status_code == 200, response.text
+    tag = response.headers["ETag"]
+    response = client.get(f"api/contacts/{contact_id}", headers={**headers, "If-None-Match": tag})
+    assert response.status_code == 304
+
+
+def test_update_contact_if_match(client, get_token):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    contact_id = client.get("api/contacts/search", params={"first_name": "Johnny"}, headers=headers).json()[0]["id"]
+    tag = client.get(f"api/contacts/{contact_id}", headers=headers).headers["ETag"]
+
+    response = client.patch(f"api/contacts/{contact_id}", headers={**headers, "If-Match": tag}, json={"done": True})
+    assert response.status_code == 200, response.text
+    assert response.headers["ETag"]
+
+    response = client.patch(f"api/contacts/{contact_id}", headers={**headers, "If-Match": tag}, json={"done": False})
+    assert response.status_code == 412, response.text
+
+    response = client.patch(f"api/contacts/{contact_id}", headers={**headers, "If-Match": '"stale"'}, json={"done": False})
+    assert response.status_code == 412, response.text
+    assert response.json()["detail"] == "Contact has been modified"
+
+
+def test_update_compressed_contact_if_match(client, get_token, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    headers = {"Authorization": f"Bearer {get_token}"}
+    body = {"first_name": "Large", "last_name": "Contact", "email": "large@example.com", "phone": "555000111",
+            "birthday": "1990-05-05", "other_information": "notes " * 1000}
+    response = client.post("api/contacts/", json=body, headers=headers)
+    assert response.status_code == 201, response.text
+    contact_id = response.json()["id"]
+
+    response = client.get(f"api/contacts/{contact_id}", headers={**headers, "Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    tag = response.headers["ETag"]
+    assert tag.startswith("W/")
+
+    response = client.put(f"api/contacts/{contact_id}", headers={**headers, "If-Match": tag},
+                          json={**body, "done": True})
+    assert response.status_code == 200, response.text
+    response = client.put(f"api/contacts/{contact_id}", headers={**headers, "If-Match": tag},
+                          json={**body, "done": False})
+    assert response.status_code == 412, response.text
+
+
+def test_read_contacts_response_cache(client, get_token, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    store = {}
+    redis = AsyncMock()
+    redis.get.side_effect = lambda key: store.get(key)
+    redis.set.side_effect = lambda key, value, ex: store.__setitem__(key, value)
+    monkeypatch.setattr(response_cache, "redis", redis)
+    headers = {"Authorization": f"Bearer {get_token}"}
+
+    first = client.get("api/contacts/", headers=headers)
+    assert first.status_code == 200, first.text
+    assert len(store) == 1
+    second = client.get("api/contacts/", headers=headers)
+    assert second.content == first.content
+    assert second.headers["ETag"] == first.headers["ETag"]
+
+    contact = first.json()[0]
+    detail = client.get(f"api/contacts/{contact['id']}", headers=headers)
+    assert detail.status_code == 200, detail.text
+    assert len(store) == 2
+    assert client.get(f"api/contacts/{contact['id']}", headers=headers).content == detail.content
+
+    client.patch(f"api/contacts/{contact['id']}", headers=headers, json={"done": not contact["done"]})
+    third = client.get("api/contacts/", headers=headers)
+    assert {item["id"]: item["done"] for item in third.json()}[contact["id"]] is not contact["done"]
+    assert len(store) == 3
+
+
+def test_read_changes(client, get_token):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    response = client.get("api/contacts/changes", headers=headers)
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["has_more"] is False
+    assert {contact["first_name"] for contact in data["changed"]} >= {"Johnny", "Janet"}
+    token = data["next_token"]
+
+    assert client.get("api/contacts/changes", params={"since": token}, headers=headers).json() == {
+        "changed": [], "deleted": [], "next_token": token, "has_more": False}
+
+    contact = data["changed"][0]
+    client.patch(f"api/contacts/{contact['id']}", headers=headers, json={"done": not contact["done"]})
+    client.delete(f"api/contacts/{data['changed'][-1]['id']}", headers=headers)
+    data = client.get("api/contacts/changes", params={"since": token}, headers=headers).json()
+    assert [changed["id"] for changed in data["changed"]] == [contact["id"]]
+    assert data["deleted"] == [data["deleted"][0]] and data["deleted"][0] != contact["id"]
+    assert data["next_token"] == token + 2
+
+    page = client.get("api/contacts/changes", params={"limit": 1}, headers=headers).json()
+    assert page["has_more"] is True
+    assert len(page["changed"]) == 1
+
+
+def test_read_changes_unknown_token(client, get_token):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    response = client.get("api/contacts/changes", params={"since": 10 ** 9}, headers=headers)
+    assert response.status_code == 400, response.text
+    assert response.json()["detail"] == "Unknown sync token"
+
+
+def test_stream_changes_ws_rejects_invalid_token(client):
+    with pytest.raises(WebSocketDisconnect) as err:
+        with client.websocket_connect("api/contacts/stream?token=invalid") as websocket:
+            websocket.receive_text()
+    assert err.value.code == 1008
+
+
+def test_stream_changes_ws_events_heartbeat_and_disconnect(client, get_token, monkeypatch):
+    queue = asyncio.Queue()
+    queue.put_nowait([{"type": "created", "ids": [1], "version": 1}])
+    unsubscribe = AsyncMock()
+    monkeypatch.setattr(contact_events, "subscribe", AsyncMock(return_value=queue))
+    monkeypatch.setattr(contact_events, "unsubscribe", unsubscribe)
+    monkeypatch.setattr("src.routes.contacts.settings.CONTACT_EVENTS_HEARTBEAT", 0.05)
+    with client.websocket_connect(f"api/contacts/stream?token={get_token}") as websocket:
+        assert websocket.receive_json() == [{"type": "created", "ids": [1], "version": 1}]
+        assert websocket.receive_json() == []
+    # the listener is removed on disconnect, without waiting for another event
+    unsubscribe.assert_awaited_once()
+    assert unsubscribe.await_args.args[1] is queue
@@ -0,0 +1,29 @@
+from unittest.mock import patch
+
+
+def test_pool_metrics_disabled(client):
+    response = client.get("/api/metrics/pool")
+    assert response.status_code == 404, response.text
+
+
+def test_pool_metrics_enabled(client):
+    with patch("main.settings.POOL_METRICS_ENDPOINT", True), \
+            patch("main.sessionmanager.pool_status", return_value={"checked_out": 1}):
+        response = client.get("/api/metrics/pool")
+    assert response.status_code == 200, response.text
+    assert response.json() == {"checked_out": 1}
+
+
+def test_query_metrics_disabled(client):
+    response = client.get("/api/metrics/queries")
+    assert response.status_code == 404, response.text
+
+
+def test_query_metrics_enabled(client):
+    assert client.get("/api/healthchecker").status_code == 200
+    with patch("main.settings.QUERY_METRICS_ENDPOINT", True):
+        response = client.get("/api/metrics/queries")
+    assert response.status_code == 200, response.text
+    stats = response.json()["GET /api/healthchecker"]
+    assert stats["requests"] >= 1
+    assert stats["queries"] >= 1
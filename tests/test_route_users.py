@@ -4,6 +4,7 @@ import pytest
 
 from src.services.auth import auth_service
 from src.database.models import User
+from src.services.avatars import AvatarService, LocalStorage
 
 
 def test_get_me(client, get_token, monkeypatch):
@@ -43,4 +44,49 @@ def test_update_avatar_user(client, get_token, monkeypatch):
         mock_cloudinary_config.stop()
         mock_cloudinary_upload.stop()
         mock_cloudinary_url.stop()
-        
\ No newline at end of file
+        
+
+def test_update_timezone_user(client, get_token):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    response = client.patch("api/users/timezone", headers=headers, json={"timezone": "Europe/Kyiv"})
+    assert response.status_code == 200, response.text
+    assert response.json()["timezone"] == "Europe/Kyiv"
+
+    response = client.patch("api/users/timezone", headers=headers, json={"timezone": "Mars/Olympus"})
+    assert response.status_code == 422, response.text
+    response = client.patch("api/users/timezone", headers=headers, json={"timezone": "UTC"})
+    assert response.json()["timezone"] == "UTC"
+
+
+def test_read_users_me_from_cache(client, get_token):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    client.patch("api/users/timezone", headers=headers, json={"timezone": "Asia/Tokyo"})
+    # the first call caches the user, the second one is served from the cache
+    for _ in range(2):
+        response = client.get("api/users/me/", headers=headers)
+        assert response.status_code == 200, response.text
+        assert response.json()["timezone"] == "Asia/Tokyo"
+
+    client.patch("api/users/timezone", headers=headers, json={"timezone": "UTC"})
+    response = client.get("api/users/me/", headers=headers)
+    assert response.json()["timezone"] == "UTC"
+
+
+def test_update_avatar_user_local_storage(client, get_token, tmp_path):
+    service = AvatarService(LocalStorage(str(tmp_path), "/static/avatars"), max_size=1024,
+                            content_types=("image/png",))
+    headers = {"Authorization": f"Bearer {get_token}"}
+    with patch("src.routes.users.avatar_service", service):
+        files = {"file": ("avatar.png", b"\x89PNG\r\n\x1a\n" + b"\x00" * 100, "image/png")}
+        response = client.patch("api/users/avatar", headers=headers, files=files)
+        assert response.status_code == 200, response.text
+        assert response.json()["avatar"].startswith("/static/avatars/user_")
+        assert len(list(tmp_path.iterdir())) == 1
+
+        files = {"file": ("avatar.png", b"\x89PNG\r\n\x1a\n" + b"\x00" * 2048, "image/png")}
+        response = client.patch("api/users/avatar", headers=headers, files=files)
+        assert response.status_code == 413, response.text
+
+        response = client.patch("api/users/avatar", files=files)
+        assert response.status_code == 401, response.text
+    service.shutdown()
@@ -0,0 +1,84 @@
+import unittest
+
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from src.database.instrumentation import (QueryInstrumentation, QueryInstrumentationMiddleware, RequestQueries,
+                                          redact)
+
+
+def make_app(instrumentation: QueryInstrumentation, debug_headers: bool = True) -> FastAPI:
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    instrumentation.instrument(engine.sync_engine)
+    app = FastAPI()
+    app.add_middleware(QueryInstrumentationMiddleware, instrumentation=instrumentation, debug_headers=debug_headers)
+
+    @app.get("/items/{count}")
+    async def items(count: int):
+        async with engine.connect() as connection:
+            for item in range(count):
+                await connection.execute(text("SELECT :item"), {"item": f"secret-{item}"})
+        return {"count": count}
+
+    @app.get("/broken")
+    async def broken():
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT * FROM missing WHERE name = :name"), {"name": "secret"})
+
+    return app
+
+
+class TestQueryInstrumentation(unittest.IsolatedAsyncioTestCase):
+
+    def test_redact(self):
+        self.assertEqual(redact({"email": "deadpool@example.com", "id": 1}), "{email=<str>, id=<int>}")
+        self.assertEqual(redact(("deadpool@example.com", 1)), "(<str>, <int>)")
+        self.assertEqual(redact([("a", 1), ("b", 2)]), "<2 rows>")
+
+    def test_repeated(self):
+        queries = RequestQueries()
+        queries.statements.update({"SELECT a": 4, "SELECT b": 1, "SELECT c": 5})
+        self.assertEqual(queries.repeated(4), [("SELECT c", 5), ("SELECT a", 4)])
+        self.assertEqual(queries.route, "-")
+
+    async def test_headers_and_metrics(self):
+        instrumentation = QueryInstrumentation(slow_ms=10000, repeat_threshold=3)
+        app = make_app(instrumentation)
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.get("/items/2")
+            self.assertEqual(response.headers["X-DB-Queries"], "2")
+            self.assertIn("X-DB-Time-Ms", response.headers)
+            self.assertNotIn("X-DB-Repeated", response.headers)
+            with self.assertLogs("src.database.instrumentation", "WARNING") as logs:
+                response = await client.get("/items/4")
+            self.assertEqual(response.headers["X-DB-Repeated"], "4")
+            self.assertIn("Possible N+1 query on GET /items/{count}", logs.output[0])
+            await client.get("/unknown")
+
+        stats = instrumentation.snapshot()
+        self.assertEqual(stats["GET /items/{count}"]["requests"], 2)
+        self.assertEqual(stats["GET /items/{count}"]["queries"], 6)
+        self.assertEqual(stats["GET /items/{count}"]["max_queries"], 4)
+        self.assertEqual(stats["GET /items/{count}"]["mean_queries"], 3)
+        self.assertEqual(stats["GET /items/{count}"]["repeated_requests"], 1)
+        self.assertEqual(stats["unmatched"]["queries"], 0)
+
+    async def test_slow_and_failed_statements_are_logged_redacted(self):
+        instrumentation = QueryInstrumentation(slow_ms=0, repeat_threshold=3)
+        app = make_app(instrumentation, debug_headers=False)
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            with self.assertLogs("src.database.instrumentation", "WARNING") as logs:
+                response = await client.get("/items/1")
+            self.assertNotIn("X-DB-Queries", response.headers)
+            self.assertIn("Slow query on GET /items/{count}", logs.output[0])
+            self.assertIn("(<str>)", logs.output[0])
+            self.assertNotIn("secret", "".join(logs.output))
+
+            with self.assertLogs("src.database.instrumentation", "ERROR") as logs:
+                with self.assertRaises(Exception):
+                    await client.get("/broken")
+            self.assertIn("Query failed on GET /broken", logs.output[0])
+            self.assertNotIn("secret", "".join(logs.output))
@@ -0,0 +1,52 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock
+
+from src.database.db import DatabaseSessionManager
+from src.database.replicas import ReadYourWrites, ReplicaSet, request_subject
+from src.services.auth import auth_service
+
+
+class TestReplicas(unittest.TestCase):
+
+    def test_request_subject(self):
+        token = asyncio.run(auth_service.create_access_token(data={"sub": "deadpool@example.com"}))
+        self.assertEqual(request_subject(MagicMock(headers={"authorization": f"Bearer {token}"})),
+                         "deadpool@example.com")
+        self.assertIsNone(request_subject(MagicMock(headers={})))
+        self.assertIsNone(request_subject(MagicMock(headers={"authorization": "Bearer not-a-token"})))
+
+    def test_read_your_writes(self):
+        pins = ReadYourWrites(window=60)
+        self.assertFalse(asyncio.run(pins.is_pinned("deadpool@example.com")))
+        asyncio.run(pins.pin("deadpool@example.com"))
+        self.assertTrue(asyncio.run(pins.is_pinned("deadpool@example.com")))
+        self.assertFalse(asyncio.run(pins.is_pinned("other@example.com")))
+        self.assertFalse(asyncio.run(pins.is_pinned(None)))
+        expired = ReadYourWrites(window=0)
+        asyncio.run(expired.pin("deadpool@example.com"))
+        self.assertFalse(asyncio.run(expired.is_pinned("deadpool@example.com")))
+
+    def test_choose_skips_unhealthy_replicas(self):
+        makers = [MagicMock(), MagicMock(), MagicMock()]
+        replicas = ReplicaSet([MagicMock() for _ in makers], makers, interval=5, timeout=1)
+        self.assertEqual([replicas.choose() for _ in range(3)], makers)
+        replicas.healthy = [True, False, True]
+        self.assertEqual({id(replicas.choose()) for _ in range(4)}, {id(makers[0]), id(makers[2])})
+        replicas.healthy = [False, False, False]
+        self.assertIsNone(replicas.choose())
+
+    def test_read_session_routing(self):
+        manager = DatabaseSessionManager("sqlite+aiosqlite:///./test.db", ("sqlite+aiosqlite:///./test.db",))
+        replica = manager.replicas.engines[0]
+
+        async def bind(subject):
+            async with manager.read_session(subject) as session:
+                return session.bind
+
+        self.assertIs(asyncio.run(bind("deadpool@example.com")), replica)
+        asyncio.run(manager.pins.pin("deadpool@example.com"))
+        self.assertIs(asyncio.run(bind("deadpool@example.com")), manager._engine)
+        self.assertIs(asyncio.run(bind(None)), replica)
+        manager.replicas.healthy = [False]
+        self.assertIs(asyncio.run(bind(None)), manager._engine)
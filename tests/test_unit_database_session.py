@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import event, select, update
+
+from src.database.db import DatabaseSessionManager
+from src.database.models import Base, User
+
+
+class TestEarlyRelease(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.manager = DatabaseSessionManager(f"sqlite+aiosqlite:///{os.path.join(self.directory.name, 'db.db')}")
+        self.checked_out = 0
+        event.listen(self.manager._engine.sync_engine, "checkout", lambda *args: self._count(1))
+        event.listen(self.manager._engine.sync_engine, "checkin", lambda *args: self._count(-1))
+        async with self.manager._engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        async with self.manager.session() as session:
+            session.add(User(id=1, email="deadpool@example.com", password="secret"))
+            await session.commit()
+
+    def _count(self, change: int) -> None:
+        self.checked_out += change
+
+    async def asyncTearDown(self):
+        await self.manager.close()
+        self.directory.cleanup()
+
+    async def test_unused_session_checks_out_nothing(self):
+        async with self.manager.session():
+            self.assertEqual(self.checked_out, 0)
+
+    async def test_read_releases_the_connection(self):
+        async with self.manager.session() as session:
+            user = (await session.execute(select(User).filter_by(id=1))).scalar_one()
+            self.assertEqual(self.checked_out, 0)
+            self.assertFalse(session.in_transaction())
+            self.assertEqual(user.email, "deadpool@example.com")
+            self.assertIs(await session.get(User, 1), user)
+            self.assertEqual(self.checked_out, 0)
+
+    async def test_locks_and_writes_keep_the_connection(self):
+        async with self.manager.session() as session:
+            await session.execute(select(User.id).filter_by(id=1).with_for_update())
+            self.assertEqual(self.checked_out, 1)
+            await session.execute(select(User.email))
+            self.assertEqual(self.checked_out, 1)
+            await session.commit()
+            self.assertEqual(self.checked_out, 0)
+
+            await session.execute(update(User).filter_by(id=1).values(username="wade"))
+            await session.execute(select(User.email))
+            self.assertEqual(self.checked_out, 1)
+            await session.rollback()
+            await session.execute(select(User.email))
+            self.assertEqual(self.checked_out, 0)
+
+    async def test_pending_objects_keep_the_connection(self):
+        async with self.manager.session() as session:
+            session.add(User(id=2, email="wade@example.com", password="secret"))
+            await session.execute(select(User.email))
+            self.assertEqual(self.checked_out, 1)
+        async with self.manager.session() as session:
+            self.assertIsNone(await session.get(User, 2))
+
+    async def test_errors_reach_the_caller(self):
+        with self.assertRaises(ZeroDivisionError):
+            async with self.manager.session() as session:
+                await session.execute(update(User).filter_by(id=1).values(username="wade"))
+                1 / 0
+        self.assertEqual(self.checked_out, 0)
+        async with self.manager.session() as session:
+            self.assertIsNone((await session.get(User, 1)).username)
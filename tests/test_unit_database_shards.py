@@ -0,0 +1,153 @@
+import os
+import tempfile
+import unittest
+from collections import Counter
+from datetime import date
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.db import DatabaseSessionManager
+from src.database.models import Base, Contact, ContactTombstone, ShardPlacement, User
+from src.database.reshard import init, move_user, pin, rebalance
+from src.database.shards import RoutingSession, ShardRing, current_user_id, parse_shard_urls
+from src.repository.contacts import create_contact, get_changes, get_contacts, remove_contact, stream_contacts
+from src.schemas.schemas import ContactCreate
+
+
+def _body(email: str) -> ContactCreate:
+    return ContactCreate(first_name="John", last_name="Doe", email=email, phone="123456789",
+                         birthday=date(1990, 5, 17))
+
+
+class TestShardRing(unittest.TestCase):
+
+    def test_parse_shard_urls(self):
+        self.assertEqual(parse_shard_urls(" s0=sqlite+aiosqlite:///a.db, s1=sqlite+aiosqlite:///b.db,"),
+                         {"s0": "sqlite+aiosqlite:///a.db", "s1": "sqlite+aiosqlite:///b.db"})
+        self.assertEqual(parse_shard_urls(""), {})
+        with self.assertRaises(ValueError):
+            parse_shard_urls("sqlite+aiosqlite:///a.db")
+
+    def test_adding_a_shard_only_moves_users_to_it(self):
+        old = ShardRing(["s0", "s1", "s2"])
+        new = ShardRing(["s0", "s1", "s2", "s3"])
+        users = range(1, 20001)
+        counts = Counter(old.shard_for(user_id) for user_id in users)
+        self.assertTrue(all(5000 < count < 8300 for count in counts.values()), counts)
+        moved = [user_id for user_id in users if old.shard_for(user_id) != new.shard_for(user_id)]
+        self.assertTrue(all(new.shard_for(user_id) == "s3" for user_id in moved))
+        self.assertTrue(3000 < len(moved) < 7000, len(moved))
+
+
+class TestShardedSessions(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = self.directory.name
+        self.manager = DatabaseSessionManager(f"sqlite+aiosqlite:///{os.path.join(path, 'primary.db')}",
+                                              shard_urls={name: f"sqlite+aiosqlite:///{os.path.join(path, name)}.db"
+                                                          for name in ("s0", "s1")})
+        async with self.manager._engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        await init(self.manager)
+        ring = self.manager.shards.ring
+        self.users = {ring.shard_for(user_id): user_id for user_id in range(1, 50)}
+        async with self.manager.session() as session:
+            session.add_all([User(id=user_id, email=f"user{user_id}@example.com", password="secret")
+                             for user_id in range(1, 50)])
+            await session.commit()
+
+    async def asyncTearDown(self):
+        await self.manager.close()
+        self.directory.cleanup()
+
+    async def _count(self, shard: str, model, user_id: int) -> int:
+        async with self.manager.shards.engines[shard].connect() as connection:
+            stmt = select(func.count()).select_from(model).where(model.user_id == user_id)
+            return (await connection.execute(stmt)).scalar_one()
+
+    async def _create(self, user_id: int, count: int) -> None:
+        token = current_user_id.set(user_id)
+        try:
+            async with self.manager.session() as session:
+                for index in range(count):
+                    await create_contact(_body(f"{user_id}-{index}@example.com"), User(id=user_id), session)
+        finally:
+            current_user_id.reset(token)
+
+    async def test_contacts_are_routed_to_the_shard_of_their_user(self):
+        await self._create(self.users["s0"], 2)
+        await self._create(self.users["s1"], 3)
+        self.assertEqual(await self._count("s0", Contact, self.users["s0"]), 2)
+        self.assertEqual(await self._count("s1", Contact, self.users["s0"]), 0)
+        self.assertEqual(await self._count("s1", Contact, self.users["s1"]), 3)
+
+        async with self.manager.session() as session:
+            session.info["user_id"] = self.users["s1"]
+            contacts = await get_contacts(0, 10, User(id=self.users["s1"]), session)
+            self.assertEqual(len(contacts), 3)
+            self.assertEqual((await session.execute(select(User.contacts_version)
+                                                    .filter_by(id=self.users["s1"]))).scalar_one(), 3)
+
+    async def test_streaming_session_follows_the_shard(self):
+        user_id = self.users["s1"]
+        await self._create(user_id, 3)
+        async with AsyncSession(self.manager._engine, sync_session_class=RoutingSession,
+                                info={"shards": self.manager.shards, "user_id": user_id}) as session:
+            rows = [row async for batch in stream_contacts(User(id=user_id), session, batch_size=2) for row in batch]
+        self.assertEqual(len(rows), 3)
+
+    async def test_failed_session_rolls_back_the_shard(self):
+        user_id = self.users["s0"]
+        with self.assertRaises(ZeroDivisionError):
+            async with self.manager.session() as session:
+                session.info["user_id"] = user_id
+                session.add(Contact(first_name="John", last_name="Doe", email="x@example.com", phone="1",
+                                    birthday=date(1990, 1, 1), user_id=user_id))
+                await session.flush()
+                1 / 0
+        self.assertEqual(await self._count("s0", Contact, user_id), 0)
+
+    async def test_session_without_user_cannot_reach_the_contacts(self):
+        async with self.manager.session() as session:
+            with self.assertRaises(RuntimeError):
+                await session.execute(select(Contact))
+
+    async def test_move_and_rebalance(self):
+        user_id = self.users["s0"]
+        await self._create(user_id, 5)
+        async with self.manager.session() as session:
+            session.info["user_id"] = user_id
+            contact = (await get_contacts(0, 1, User(id=user_id), session))[0]
+            await remove_contact(contact.id, User(id=user_id), session)
+
+        self.assertEqual(await move_user(self.manager, user_id, "s1", batch_size=2, grace=0), 4)
+        self.assertEqual(await self._count("s0", Contact, user_id), 0)
+        self.assertEqual(await self._count("s0", ContactTombstone, user_id), 0)
+        self.assertEqual(await self._count("s1", Contact, user_id), 4)
+        self.assertEqual(await self._count("s1", ContactTombstone, user_id), 1)
+
+        async with self.manager.session() as session:
+            session.info["user_id"] = user_id
+            contacts, deleted, version, more = await get_changes(0, 10, User(id=user_id), session)
+            self.assertEqual((len(contacts), len(deleted), version, more), (4, 1, 6, False))
+            self.assertEqual((await session.execute(select(ShardPlacement.shard))).scalars().all(), ["s1"])
+
+        # the writes of a moved user follow the placement
+        await self._create(user_id, 1)
+        self.assertEqual(await self._count("s1", Contact, user_id), 5)
+
+        self.assertEqual(await rebalance(self.manager, batch_size=2, grace=0), 1)
+        self.assertEqual(await self._count("s0", Contact, user_id), 5)
+        self.assertEqual(await self._count("s1", Contact, user_id), 0)
+        async with self.manager.session() as session:
+            self.assertEqual((await session.execute(select(ShardPlacement))).all(), [])
+
+    async def test_pin_keeps_users_on_their_shard(self):
+        self.assertEqual(await pin(self.manager), 49)
+        self.assertEqual(await pin(self.manager), 0)
+        async with self.manager.session() as session:
+            placements = dict((await session.execute(select(ShardPlacement.user_id, ShardPlacement.shard))).all())
+        ring = self.manager.shards.ring
+        self.assertEqual(placements, {user_id: ring.shard_for(user_id) for user_id in range(1, 50)})
@@ -1,10 +1,11 @@
 import unittest
+from datetime import date
 from unittest.mock import AsyncMock, MagicMock, Mock
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import Contact, User
-from src.repository.contacts import get_contacts, get_contact,create_contact, remove_contact, update_contact, update_status_contact
+from src.repository.contacts import get_contacts, get_contact,create_contact, remove_contact, update_contact, update_status_contact, search_contacts, get_contacts_page, encode_cursor, decode_cursor, get_upcoming_birthdays, get_contacts_version, get_changes
 from src.schemas.schemas import ContactCreate, ContactUpdate, ContactStatusUpdate
 
 class TestContacts(unittest.IsolatedAsyncioTestCase):
@@ -36,10 +37,30 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         result = await get_contact(1, self.user, self.session)
         self.assertEqual(result, contact)
 
+    async def test_get_contact_for_update_locks_user_first(self):
+        mocked_contact = MagicMock()
+        mocked_contact.scalar_one_or_none.return_value = None
+        self.session.execute.return_value = mocked_contact
+        await get_contact(1, self.user, self.session, for_update=True)
+        statements = [str(call.args[0]) for call in self.session.execute.call_args_list]
+        self.assertEqual(len(statements), 2)
+        self.assertIn("FROM users", statements[0])
+        self.assertIn("FOR UPDATE", statements[0])
+        self.assertIn("FROM contacts", statements[1])
+        self.assertIn("FOR UPDATE", statements[1])
+
     async def test_create_contact(self):
         body = ContactCreate(first_name='John', last_name='Doe', email='j@j.com', phone='123456789',
                              birthday='2020-01-01', other_information=None, done=False)
+        mocked_contact = MagicMock()
+        mocked_contact.scalar_one.return_value = Contact(id=1, user_id=1, **body.model_dump())
+        self.session.execute.return_value = mocked_contact
         result = await create_contact(body, self.user, self.session)
+        self.assertEqual(self.session.execute.call_count, 2)
+        self.session.commit.assert_called_once()
+        self.session.refresh.assert_not_called()
+        self.assertTrue(str(self.session.execute.call_args_list[0].args[0]).startswith("UPDATE users"))
+        self.assertIn("RETURNING", str(self.session.execute.call_args.args[0]))
         self.assertIsInstance(result, Contact)
         self.assertEqual(result.first_name, body.first_name)
         self.assertEqual(result.last_name, body.last_name)
@@ -57,6 +78,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
 
         result = await update_contact(1, body, self.user, self.session)
 
+        self.assertEqual(self.session.execute.call_count, 2)
         self.session.commit.assert_called_once()
         self.assertIsInstance(result, Contact)
         # self.assertEqual(result.first_name, body.first_name)
@@ -70,9 +92,11 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         body = ContactStatusUpdate(done=True)
         mocked_contact = MagicMock()
         mocked_contact.scalar_one_or_none.return_value = Contact(id=1, first_name='John', last_name='Doe', email='j@j.com',
-                                                                 phone='123456789', birthday='2020-01-01', other_information=None, done=False)
+                                                                 phone='123456789', birthday='2020-01-01', other_information=None, done=True)
         self.session.execute.return_value = mocked_contact
         result = await update_status_contact(1, body, self.user, self.session)
+        self.assertEqual(self.session.execute.call_count, 2)
+        self.assertTrue(str(self.session.execute.call_args.args[0]).startswith("UPDATE contacts"))
         self.assertIsInstance(result, Contact)
         self.assertEqual(result.done, body.done)
 
@@ -82,7 +106,103 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
                                                                  phone='123456789', birthday='2020-01-01', done=False, user_id=1)
         self.session.execute.return_value = mocked_contact
         result = await remove_contact(1, self.user, self.session)
-        self.session.delete.assert_called_once()
+        self.assertEqual(self.session.execute.call_count, 3)
+        self.assertTrue(str(self.session.execute.call_args_list[1].args[0]).startswith("DELETE FROM contacts"))
+        self.assertTrue(str(self.session.execute.call_args.args[0]).startswith("INSERT INTO contact_tombstones"))
         self.session.commit.assert_called_once()
 
         self.assertIsInstance(result, Contact)
+
+    async def test_search_contacts(self):
+        contacts = [Contact(id=1, first_name='John', last_name='Doe', email='j@j.com',
+                            phone='123456789', birthday='2020-01-01', other_information=None, done=False, user_id=1)]
+        mocked_contacts = MagicMock()
+        mocked_contacts.scalars.return_value.all.return_value = contacts
+        self.session.execute.return_value = mocked_contacts
+        result = await search_contacts(self.user, self.session, first_name='jo_', email='J.COM')
+        self.assertEqual(result, contacts)
+        stmt = self.session.execute.call_args.args[0]
+        sql = str(stmt.compile(compile_kwargs={"literal_binds": True}))
+        self.assertIn("lower(contacts.first_name) LIKE lower('%jo\\_%')", sql)
+        self.assertIn("lower(contacts.email) LIKE lower('%J.COM%')", sql)
+        self.assertNotIn("last_name) LIKE", sql)
+
+    async def test_get_contacts_page(self):
+        contacts = [Contact(id=i, first_name='John', last_name='Doe', email=f'j{i}@j.com', phone='123456789',
+                            birthday='2020-01-01', other_information=None, done=False, user_id=1) for i in (1, 2, 3)]
+        mocked_contacts = MagicMock()
+        mocked_contacts.scalars.return_value.all.return_value = contacts
+        self.session.execute.return_value = mocked_contacts
+        result, next_cursor = await get_contacts_page(2, self.user, self.session, sort="last_name")
+        self.assertEqual(result, contacts[:2])
+        self.assertEqual(decode_cursor(next_cursor, "last_name"), ['Doe', 2])
+
+        mocked_contacts.scalars.return_value.all.return_value = contacts[2:]
+        result, last_cursor = await get_contacts_page(2, self.user, self.session, next_cursor, sort="last_name")
+        self.assertEqual(result, contacts[2:])
+        self.assertIsNone(last_cursor)
+        stmt = self.session.execute.call_args.args[0]
+        sql = str(stmt.compile(compile_kwargs={"literal_binds": True}))
+        self.assertIn("(contacts.last_name, contacts.id) > ('Doe', 2)", sql)
+        self.assertNotIn("OFFSET", sql)
+
+    async def test_get_contacts_page_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            await get_contacts_page(2, self.user, self.session, "not-a-cursor")
+        with self.assertRaises(ValueError):
+            await get_contacts_page(2, self.user, self.session, encode_cursor("id", Contact(id=1)), sort="last_name")
+
+    async def test_get_upcoming_birthdays_wraps_year(self):
+        mocked_contacts = MagicMock()
+        mocked_contacts.scalars.return_value.all.return_value = []
+        self.session.execute.return_value = mocked_contacts
+        await get_upcoming_birthdays(10, self.user, self.session, today=date(2023, 12, 28))
+        stmt = self.session.execute.call_args.args[0]
+        sql = str(stmt.compile(compile_kwargs={"literal_binds": True}))
+        self.assertIn("contacts.birthday_md >= 1228 OR contacts.birthday_md <= 107", sql)
+
+    async def test_get_upcoming_birthdays_leap_day(self):
+        mocked_contacts = MagicMock()
+        mocked_contacts.scalars.return_value.all.return_value = []
+        self.session.execute.return_value = mocked_contacts
+        await get_upcoming_birthdays(7, self.user, self.session, today=date(2023, 2, 21))
+        sql = str(self.session.execute.call_args.args[0].compile(compile_kwargs={"literal_binds": True}))
+        self.assertIn("contacts.birthday_md BETWEEN 221 AND 229", sql)
+        await get_upcoming_birthdays(7, self.user, self.session, today=date(2024, 2, 21))
+        sql = str(self.session.execute.call_args.args[0].compile(compile_kwargs={"literal_binds": True}))
+        self.assertIn("contacts.birthday_md BETWEEN 221 AND 228", sql)
+
+    async def test_remove_missing_contact_keeps_version(self):
+        mocked_contact = MagicMock()
+        mocked_contact.scalar_one_or_none.return_value = None
+        self.session.execute.return_value = mocked_contact
+        result = await remove_contact(1, self.user, self.session)
+        self.assertIsNone(result)
+        self.assertEqual(self.session.execute.call_count, 2)
+        self.session.rollback.assert_called_once()
+        self.session.commit.assert_not_called()
+
+    async def test_get_contacts_version(self):
+        mocked_version = MagicMock()
+        mocked_version.scalar_one_or_none.return_value = 7
+        self.session.execute.return_value = mocked_version
+        self.assertEqual(await get_contacts_version(self.user, self.session), 7)
+
+    async def test_get_changes(self):
+        version, upto, contacts, deleted = MagicMock(), MagicMock(), MagicMock(), MagicMock()
+        version.scalar_one_or_none.return_value = 9
+        upto.scalar_one_or_none.return_value = 5
+        contacts.scalars.return_value.all.return_value = [Contact(id=1, change_seq=5)]
+        deleted.scalars.return_value.all.return_value = [2]
+        self.session.execute.side_effect = [version, upto, contacts, deleted]
+        result = await get_changes(3, 1, self.user, self.session)
+        self.assertEqual(result[1:], ([2], 5, True))
+        sql = str(self.session.execute.call_args_list[2].args[0].compile(compile_kwargs={"literal_binds": True}))
+        self.assertIn("contacts.change_seq > 3 AND contacts.change_seq <= 5", sql)
+
+    async def test_get_changes_unknown_token(self):
+        version = MagicMock()
+        version.scalar_one_or_none.return_value = 2
+        self.session.execute.return_value = version
+        with self.assertRaises(ValueError):
+            await get_changes(3, 10, self.user, self.session)
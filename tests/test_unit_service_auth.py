@@ -0,0 +1,51 @@
+import time
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import User
+from src.schemas.schemas import Principal
+from src.services.auth import auth_service
+from src.services.cache import principal_cache
+
+
+class TestClaimsPrincipal(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.session = AsyncMock(spec=AsyncSession)
+        self.user = User(id=1, username='John5', email='claims@j.com', password='123456',
+                         created_at=None, avatar=None, confirmed=True, token_version=2)
+        patcher = patch.object(auth_service, 'CLAIMS_PRINCIPAL', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self) -> None:
+        await principal_cache.invalidate(self.user.email)
+
+    async def test_access_token_claims(self):
+        claims = auth_service.access_token_claims(self.user)
+        self.assertEqual(claims, {"sub": 'claims@j.com', "id": 1, "username": 'John5', "confirmed": True, "ver": 2})
+
+    async def test_principal_from_claims(self):
+        await principal_cache.set(self.user.email, principal_cache.dump(self.user), time.time() + 60)
+        token = await auth_service.create_access_token(data=auth_service.access_token_claims(self.user))
+        result = await auth_service.get_current_principal(token, self.session)
+        self.assertIsInstance(result, Principal)
+        self.assertEqual(result.id, 1)
+        self.session.execute.assert_not_called()
+
+    async def test_revoked_token(self):
+        token = await auth_service.create_access_token(data=auth_service.access_token_claims(self.user))
+        self.user.token_version = 3
+        await principal_cache.set(self.user.email, principal_cache.dump(self.user), time.time() + 60)
+        with self.assertRaises(HTTPException) as cm:
+            await auth_service.get_current_principal(token, self.session)
+        self.assertEqual(cm.exception.status_code, 401)
+
+    async def test_mode_off_returns_user(self):
+        await principal_cache.set(self.user.email, principal_cache.dump(self.user), time.time() + 60)
+        token = await auth_service.create_access_token(data={"sub": self.user.email})
+        result = await auth_service.get_current_principal(token, self.session)
+        self.assertIsInstance(result, User)
@@ -0,0 +1,133 @@
+import asyncio
+import io
+import os
+import tempfile
+import time
+import unittest
+
+from fastapi import FastAPI, Request
+from httpx import ASGITransport, AsyncClient
+
+from src.services.avatars import AvatarService, AvatarStorage, LocalStorage, sniff
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 100
+GIF = b"GIF89a" + b"\x00" * 100
+
+
+class SlowStorage(LocalStorage):
+
+    def save(self, key, file, content_type):
+        time.sleep(0.2)
+        return super().save(key, file, content_type)
+
+
+def make_app(service: AvatarService) -> FastAPI:
+    app = FastAPI()
+
+    @app.patch("/avatar")
+    async def avatar(request: Request):
+        file = await service.receive(request)
+        try:
+            return {"url": await service.upload("user_1_avatar", file)}
+        finally:
+            await file.close()
+
+    return app
+
+
+def multipart(data: bytes, content_type: str, boundary: str = "avatar-boundary") -> bytes:
+    return (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"avatar\"\r\n"
+            f"Content-Type: {content_type}\r\n\r\n").encode() + data + f"\r\n--{boundary}--\r\n".encode()
+
+
+class TestAvatars(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.service = AvatarService(LocalStorage(self.directory.name, "/static/avatars/"), max_size=1024,
+                                     content_types=("image/png", "image/jpeg"))
+        self.client = AsyncClient(transport=ASGITransport(app=make_app(self.service)), base_url="http://test")
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+        self.service.shutdown()
+        self.directory.cleanup()
+
+    def test_sniff(self):
+        self.assertEqual(sniff(PNG), "image/png")
+        self.assertEqual(sniff(JPEG), "image/jpeg")
+        self.assertEqual(sniff(GIF), "image/gif")
+        self.assertEqual(sniff(b"RIFF\x00\x00\x00\x00WEBPVP8 "), "image/webp")
+        self.assertIsNone(sniff(b"RIFF\x00\x00\x00\x00WAVEfmt "))
+        self.assertIsNone(sniff(b"<svg></svg>"))
+
+    def test_unsupported_types_are_refused(self):
+        with self.assertRaises(ValueError):
+            AvatarService(LocalStorage(self.directory.name, "/"), 1024, ("image/png", "image/svg+xml"))
+
+    def test_storage_must_implement_save(self):
+        class Incomplete(AvatarStorage):
+            pass
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    async def _upload(self, data: bytes, content_type: str):
+        return await self.client.patch("/avatar", files={"file": ("avatar", data, content_type)})
+
+    async def test_avatar_is_saved(self):
+        response = await self._upload(PNG, "image/png")
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual(response.json()["url"], "/static/avatars/user_1_avatar.png")
+        with open(os.path.join(self.directory.name, "user_1_avatar.png"), "rb") as file:
+            self.assertEqual(file.read(), PNG)
+
+        response = await self._upload(JPEG, "image/jpeg")
+        self.assertEqual(response.json()["url"], "/static/avatars/user_1_avatar.jpg")
+        self.assertEqual(os.listdir(self.directory.name), ["user_1_avatar.jpg"])
+
+    async def test_content_type_is_checked_on_the_content(self):
+        for data, content_type in ((b"<svg></svg>" + b" " * 20, "image/png"), (GIF, "image/gif"),
+                                   (PNG, "image/jpeg"), (PNG, "text/html")):
+            response = await self._upload(data, content_type)
+            self.assertEqual(response.status_code, 415, (content_type, response.text))
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+        response = await self.client.patch("/avatar", files={"other": ("avatar", PNG, "image/png")})
+        self.assertEqual(response.status_code, 422, response.text)
+
+    async def test_large_uploads_are_refused_while_streaming(self):
+        response = await self._upload(PNG + b"\x00" * 1024, "image/png")
+        self.assertEqual(response.status_code, 413, response.text)
+
+        received = []
+
+        async def chunks():
+            # no content length: the body is counted as it arrives
+            body = multipart(PNG + b"\x00" * 1024 * 1024, "image/png")
+            for start in range(0, len(body), 4096):
+                received.append(start)
+                yield body[start:start + 4096]
+
+        response = await self.client.patch("/avatar", content=chunks(),
+                                           headers={"Content-Type": "multipart/form-data; boundary=avatar-boundary"})
+        self.assertEqual(response.status_code, 413, response.text)
+        self.assertLess(len(received), 10)
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    async def test_storage_runs_off_the_event_loop(self):
+        self.service.storage = SlowStorage(self.directory.name, "/static/avatars")
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        responses = await asyncio.gather(*[self._upload(PNG, "image/png") for _ in range(4)])
+        ticker.cancel()
+        self.assertTrue(all(response.status_code == 200 for response in responses))
+        self.assertGreater(ticks, 10)
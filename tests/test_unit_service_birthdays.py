@@ -0,0 +1,160 @@
+import os
+import tempfile
+import unittest
+from datetime import date, datetime, timezone
+from email import message_from_bytes
+from unittest.mock import patch
+
+import pytest
+from fastapi_mail.errors import ConnectionErrors
+from sqlalchemy import insert, select
+
+from src.database.db import DatabaseSessionManager
+from src.database.models import Base, BirthdayDigest, BirthdayDigestRun, Contact, ShardPlacement, User
+from src.database.reshard import init
+from src.services import birthdays
+from src.services.email import Mailer
+from tests.conftest import Inbox, free_port, smtp_config
+
+controller = pytest.importorskip("aiosmtpd.controller")
+
+MORNING = datetime(2026, 3, 10, 9, tzinfo=timezone.utc)
+TODAY = date(2026, 3, 10)
+
+
+class TestBirthdayDigest(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.inbox = Inbox()
+        cls.smtp = controller.Controller(cls.inbox, hostname="127.0.0.1", port=free_port())
+        cls.smtp.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.smtp.stop()
+
+    async def asyncSetUp(self):
+        self.inbox.messages.clear()
+        self.inbox.refuse = ()
+        self.directory = tempfile.TemporaryDirectory()
+        path = self.directory.name
+        self.manager = DatabaseSessionManager(f"sqlite+aiosqlite:///{os.path.join(path, 'primary.db')}",
+                                              shard_urls={name: f"sqlite+aiosqlite:///{os.path.join(path, name)}.db"
+                                                          for name in ("s0", "s1")})
+        async with self.manager._engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        await init(self.manager)
+        ring = self.manager.shards.ring
+        users = [(1, "UTC", True), (2, "UTC", True), (3, "UTC", True), (4, "UTC", True),
+                 (5, "America/New_York", True), (6, "UTC", False)]
+        async with self.manager._engine.begin() as connection:
+            await connection.execute(insert(User), [{"id": user_id, "email": f"user{user_id}@example.com",
+                                                     "username": f"user{user_id}", "password": "secret",
+                                                     "timezone": zone, "confirmed": confirmed}
+                                                    for user_id, zone, confirmed in users])
+            # user 4 was moved off the shard of the ring, which still has a row the move did not purge yet
+            moved_to = "s1" if ring.shard_for(4) == "s0" else "s0"
+            await connection.execute(insert(ShardPlacement).values(user_id=4, shard=moved_to))
+        contacts = {1: [("Today", date(1990, 3, 10)), ("Soon", date(1985, 3, 13)), ("Later", date(1990, 4, 9))],
+                    2: [("Past", date(1990, 3, 9))], 3: [("Tomorrow", date(2000, 3, 11))],
+                    4: [("Moved", date(1990, 3, 12))], 5: [("Zoned", date(1990, 3, 15))],
+                    6: [("Unconfirmed", date(1990, 3, 10))]}
+        for user_id, rows in contacts.items():
+            shard = moved_to if user_id == 4 else ring.shard_for(user_id)
+            await self._add(shard, user_id, rows)
+        await self._add(ring.shard_for(4), 4, [("Stale", date(1990, 3, 12))])
+
+        self.mailer = Mailer(smtp_config(self.smtp.port))
+        self.patch = patch("src.services.email.mailer", self.mailer)
+        self.patch.start()
+
+    async def _add(self, shard: str, user_id: int, rows: list[tuple[str, date]]) -> None:
+        async with self.manager.shards.engines[shard].begin() as connection:
+            await connection.execute(insert(Contact), [
+                {"first_name": name, "last_name": "Doe", "email": f"{user_id}-{name}-{shard}@example.com",
+                 "phone": "123456789", "birthday": datetime.combine(birthday, datetime.min.time()),
+                 "user_id": user_id} for name, birthday in rows])
+
+    async def asyncTearDown(self):
+        self.patch.stop()
+        await self.mailer.close()
+        await self.manager.close()
+        self.directory.cleanup()
+
+    def _digests(self) -> dict[str, str]:
+        digests = {}
+        for envelope in self.inbox.messages:
+            message = message_from_bytes(envelope.content)
+            digests[envelope.rcpt_tos[0]] = message.get_payload(0).get_payload(decode=True).decode()
+        return digests
+
+    async def _claims(self) -> dict[int, datetime | None]:
+        async with self.manager._engine.connect() as connection:
+            stmt = select(BirthdayDigest.user_id, BirthdayDigest.sent_at).where(BirthdayDigest.day == TODAY)
+            return dict((await connection.execute(stmt)).all())
+
+    async def test_one_digest_per_user_and_day(self):
+        self.assertEqual(await birthdays.run(self.manager, MORNING), (3, 0))
+        digests = self._digests()
+        self.assertEqual(sorted(digests), ["user1@example.com", "user3@example.com", "user4@example.com"])
+        self.assertIn("Hi user1,", digests["user1@example.com"])
+        self.assertIn("Today Doe, March 10\n        (today)", digests["user1@example.com"])
+        self.assertIn("Soon Doe, March 13\n        (in 3 days)", digests["user1@example.com"])
+        self.assertLess(digests["user1@example.com"].index("Today"), digests["user1@example.com"].index("Soon"))
+        self.assertNotIn("Later", digests["user1@example.com"])
+        self.assertIn("(tomorrow)", digests["user3@example.com"])
+        self.assertIn("Moved", digests["user4@example.com"])
+        self.assertNotIn("Stale", digests["user4@example.com"])
+        self.assertEqual(self.mailer.connections_opened, 1)
+
+        self.assertEqual(await birthdays.run(self.manager, MORNING.replace(hour=11)), (0, 0))
+        # it is 9 in New York at 13 UTC, daylight saving time started on March 8
+        self.assertEqual(await birthdays.run(self.manager, MORNING.replace(hour=13)), (1, 0))
+        self.assertIn("user5@example.com", self._digests())
+        self.assertEqual(len(self.inbox.messages), 4)
+
+    async def test_a_crashed_job_resumes_without_sending_twice(self):
+        send = birthdays.email_service.send_birthday_digests
+        calls = []
+
+        async def crash_on_user3(digests):
+            calls.append([email for email, _, _ in digests])
+            if "user3@example.com" in calls[-1]:
+                raise RuntimeError("killed")
+            return await send(digests)
+
+        with patch("src.services.email.send_birthday_digests", crash_on_user3):
+            with self.assertRaises(RuntimeError):
+                await birthdays.send_bucket(self.manager, "UTC", TODAY, chunk_size=1)
+        self.assertEqual(list(self._digests()), ["user1@example.com"])
+
+        self.assertEqual(await birthdays.send_bucket(self.manager, "UTC", TODAY, chunk_size=1), (1, 0))
+        self.assertEqual(sorted(self._digests()), ["user1@example.com", "user4@example.com"])
+        claims = await self._claims()
+        # the digest of user 3 may have been sent when the job was killed, it is not sent again
+        self.assertEqual(sorted(claims), [1, 3, 4])
+        self.assertIsNone(claims[3])
+        self.assertIsNotNone(claims[4])
+        self.assertEqual(await birthdays.send_bucket(self.manager, "UTC", TODAY, chunk_size=1), (0, 0))
+
+    async def test_refused_and_undelivered_digests(self):
+        self.inbox.refuse = ("user3@example.com",)
+        self.assertEqual(await birthdays.send_bucket(self.manager, "UTC", TODAY, chunk_size=2), (2, 1))
+        self.assertEqual(sorted(await self._claims()), [1, 4])
+
+        self.inbox.refuse = ()
+        await birthdays.restart_bucket(self.manager, "UTC", TODAY)
+        self.assertEqual(await birthdays.send_bucket(self.manager, "UTC", TODAY, chunk_size=2), (1, 0))
+        self.assertEqual(len(self.inbox.messages), 3)
+
+    async def test_unreachable_server_stops_the_job(self):
+        with patch("src.services.email.mailer", Mailer(smtp_config(free_port()))):
+            with self.assertRaises(ConnectionErrors):
+                await birthdays.send_bucket(self.manager, "UTC", TODAY, chunk_size=2)
+        self.assertEqual(await self._claims(), {})
+        async with self.manager._engine.connect() as connection:
+            run = (await connection.execute(select(BirthdayDigestRun))).one()
+        self.assertEqual((run.last_user_id, run.finished_at), (0, None))
+
+        self.assertEqual(await birthdays.send_bucket(self.manager, "UTC", TODAY, chunk_size=2), (3, 0))
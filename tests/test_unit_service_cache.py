@@ -0,0 +1,83 @@
+import json
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import AsyncMock
+
+from src.database.models import User
+from src.services.cache import TTLCache, PrincipalCache
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def test_get_set(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_expired(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1, ttl=-1)
+        self.assertIsNone(cache.get('a'))
+
+
+class TestPrincipalCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.cache = PrincipalCache(maxsize=10, local_ttl=60, ttl=300)
+        self.user = User(id=1, username='John5', email='j@j.com', password='123456',
+                         created_at=datetime(2024, 1, 1), avatar=None, confirmed=True, refresh_token='23456')
+
+    async def test_dump_skips_secrets(self):
+        data = self.cache.dump(self.user)
+        self.assertNotIn('password', data)
+        self.assertNotIn('refresh_token', data)
+        self.assertEqual(data['created_at'], '2024-01-01T00:00:00')
+
+    async def test_local_hit(self):
+        await self.cache.set(self.user.email, self.cache.dump(self.user), time.time() + 60)
+        result = await self.cache.get(self.user.email)
+        self.assertEqual(result['id'], 1)
+        self.assertEqual(result['created_at'], datetime(2024, 1, 1))
+
+    async def test_expired_token_not_cached(self):
+        await self.cache.set(self.user.email, self.cache.dump(self.user), time.time() - 1)
+        self.assertIsNone(await self.cache.get(self.user.email))
+
+    async def test_invalidate(self):
+        self.cache.init(AsyncMock())
+        await self.cache.set(self.user.email, self.cache.dump(self.user), time.time() + 60)
+        await self.cache.invalidate(self.user.email)
+        self.cache.redis.delete.assert_called_once_with('principal:j@j.com')
+        self.cache.redis.get.return_value = None
+        self.assertIsNone(await self.cache.get(self.user.email))
+
+    async def test_redis_hit(self):
+        redis = AsyncMock()
+        redis.get.return_value = json.dumps(self.cache.dump(self.user))
+        redis.pttl.return_value = 30000
+        self.cache.init(redis)
+        result = await self.cache.get(self.user.email)
+        self.assertEqual(result['email'], 'j@j.com')
+        self.assertIsNotNone(self.cache.local.get('principal:j@j.com'))
+
+    async def test_redis_entry_without_a_field_is_a_miss(self):
+        redis = AsyncMock()
+        data = self.cache.dump(self.user)
+        del data['timezone']
+        redis.get.return_value = json.dumps(data)
+        redis.pttl.return_value = 30000
+        self.cache.init(redis)
+        self.assertIsNone(await self.cache.get(self.user.email))
+        self.assertIsNone(self.cache.local.get('principal:j@j.com'))
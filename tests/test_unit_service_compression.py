@@ -0,0 +1,78 @@
+import asyncio
+import gzip
+import unittest
+
+from src.services.compression import CompressionMiddleware, LoopLagMonitor, choose_encoding
+
+
+def make_app(chunks: list[bytes], content_type: bytes = b"application/json", etag: bytes = b'"abc"'):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", content_type), (b"etag", etag)]})
+        for i, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1})
+    return app
+
+
+def call(middleware, accept_encoding: str = "gzip") -> list[dict]:
+    scope = {"type": "http", "method": "GET", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(middleware(scope, receive, send))
+    return messages
+
+
+def headers_of(messages: list[dict]) -> dict:
+    return {key.decode(): value.decode() for key, value in messages[0]["headers"]}
+
+
+class TestCompression(unittest.TestCase):
+
+    def test_choose_encoding(self):
+        self.assertIsNone(choose_encoding(None))
+        self.assertIsNone(choose_encoding("identity"))
+        self.assertEqual(choose_encoding("gzip, deflate"), "gzip")
+        self.assertIsNone(choose_encoding("gzip;q=0"))
+        self.assertEqual(choose_encoding("br;q=0, zstd;q=0, *"), "gzip")
+
+    def test_compresses_large_body(self):
+        body = b'{"first_name": "Jon"}' * 200
+        messages = call(CompressionMiddleware(make_app([body]), minimum_size=100))
+        headers = headers_of(messages)
+        self.assertEqual(headers["content-encoding"], "gzip")
+        self.assertEqual(headers["vary"], "Accept-Encoding")
+        self.assertEqual(int(headers["content-length"]), len(messages[1]["body"]))
+        self.assertEqual(headers["etag"], 'W/"abc"')
+        self.assertEqual(gzip.decompress(messages[1]["body"]), body)
+
+    def test_skips_small_and_binary_bodies(self):
+        messages = call(CompressionMiddleware(make_app([b"{}"]), minimum_size=100))
+        self.assertNotIn("content-encoding", headers_of(messages))
+        self.assertEqual(headers_of(messages)["etag"], '"abc"')
+        self.assertEqual(messages[1]["body"], b"{}")
+        messages = call(CompressionMiddleware(make_app([b"x" * 1000], b"application/gzip"), minimum_size=100))
+        self.assertNotIn("content-encoding", headers_of(messages))
+
+    def test_streams_chunks(self):
+        chunks = [b"1,Jon,Snow\n" * 20 for _ in range(5)]
+        messages = call(CompressionMiddleware(make_app(chunks, b"text/csv"), minimum_size=100))
+        headers = headers_of(messages)
+        self.assertEqual(headers["content-encoding"], "gzip")
+        self.assertNotIn("content-length", headers)
+        self.assertEqual(headers["etag"], 'W/"abc"')
+        # every chunk is flushed on its own instead of being buffered until the end
+        self.assertEqual(len(messages), 1 + len(chunks))
+        self.assertEqual(gzip.decompress(b"".join(message["body"] for message in messages[1:])), b"".join(chunks))
+
+    def test_fast_level_when_loop_lags(self):
+        monitor = LoopLagMonitor(0.5)
+        monitor.lag = 1.0
+        body = b'{"first_name": "Jon"}' * 200
+        messages = call(CompressionMiddleware(make_app([body]), minimum_size=100, monitor=monitor, max_lag=0.05))
+        self.assertEqual(gzip.decompress(messages[1]["body"]), body)
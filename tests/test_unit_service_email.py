@@ -0,0 +1,85 @@
+import unittest
+from email import message_from_bytes
+from unittest.mock import patch
+
+import aiosmtplib
+import pytest
+from fastapi_mail import MessageSchema, MessageType
+from fastapi_mail.errors import ConnectionErrors
+
+from src.services.email import Mailer
+from tests.conftest import Inbox, free_port, smtp_config
+
+controller = pytest.importorskip("aiosmtpd.controller")
+
+
+def message(email: str, username: str = "deadpool") -> MessageSchema:
+    return MessageSchema(subject="Reset password", recipients=[email], subtype=MessageType.html,
+                         template_body={"host": "http://test/", "username": username})
+
+
+class TestMailer(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.inbox = Inbox(refuse=("nobody@example.com",))
+        cls.smtp = controller.Controller(cls.inbox, hostname="127.0.0.1", port=free_port())
+        cls.smtp.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.smtp.stop()
+
+    async def asyncSetUp(self):
+        self.inbox.messages.clear()
+        self.mailer = Mailer(smtp_config(self.smtp.port), pool_size=2)
+
+    async def asyncTearDown(self):
+        await self.mailer.close()
+
+    def test_templates_are_compiled_once(self):
+        self.assertIn("email_template.html", self.mailer.templates)
+        self.assertIn("reset_template.html", self.mailer.templates)
+
+    async def test_connection_is_reused(self):
+        for index in range(3):
+            await self.mailer.send(message(f"user{index}@example.com", "wade"), "reset_template.html")
+        self.assertEqual(self.mailer.connections_opened, 1)
+        self.assertEqual(len(self.inbox.messages), 3)
+        sent = message_from_bytes(self.inbox.messages[0].content)
+        self.assertEqual(sent["From"], "noreply@example.com")
+        self.assertIn(b"Hi wade,", sent.get_payload(0).get_payload(decode=True))
+
+    async def test_send_many_reports_refused_messages(self):
+        results = await self.mailer.send_many([(message("a@example.com"), "reset_template.html"),
+                                               (message("nobody@example.com"), "reset_template.html"),
+                                               (message("b@example.com"), "reset_template.html")])
+        self.assertIsNone(results[0])
+        self.assertIsInstance(results[1], aiosmtplib.SMTPRecipientsRefused)
+        self.assertIsNone(results[2])
+        self.assertEqual([envelope.rcpt_tos for envelope in self.inbox.messages],
+                         [["a@example.com"], ["b@example.com"]])
+        self.assertEqual(self.mailer.connections_opened, 1)
+        with self.assertRaises(aiosmtplib.SMTPRecipientsRefused):
+            await self.mailer.send(message("nobody@example.com"), "reset_template.html")
+
+    async def test_dropped_connection_is_replaced(self):
+        await self.mailer.send(message("a@example.com"), "reset_template.html")
+        smtp = self.mailer._idle[-1][0]
+        with patch.object(smtp, "send_message", side_effect=aiosmtplib.SMTPServerDisconnected("gone")):
+            await self.mailer.send(message("b@example.com"), "reset_template.html")
+        self.assertEqual(self.mailer.connections_opened, 2)
+        self.assertEqual(len(self.inbox.messages), 2)
+
+        mailer = Mailer(smtp_config(self.smtp.port), keepalive=0)
+        await mailer.send(message("a@example.com"), "reset_template.html")
+        await mailer.send(message("b@example.com"), "reset_template.html")
+        self.assertEqual(mailer.connections_opened, 2)
+        await mailer.close()
+
+    async def test_unreachable_server(self):
+        mailer = Mailer(smtp_config(free_port()))
+        results = await mailer.send_many([(message("a@example.com"), "reset_template.html")] * 2)
+        self.assertTrue(all(isinstance(result, ConnectionErrors) for result in results))
+        with self.assertRaises(ConnectionErrors):
+            await mailer.send(message("a@example.com"), "reset_template.html")
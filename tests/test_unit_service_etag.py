@@ -0,0 +1,45 @@
+import unittest
+from datetime import datetime
+
+from src.database.models import Contact
+from src.services.etag import collection_etag, contact_etag, match, none_match
+
+
+class TestEtag(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.contact = Contact(id=1, update_at=datetime(2024, 1, 1, 12, 0, 0), change_seq=3)
+
+    def test_contact_etag_changes_with_update(self):
+        tag = contact_etag(self.contact)
+        self.assertTrue(tag.startswith('"') and tag.endswith('"'))
+        self.assertEqual(tag, contact_etag(Contact(id=1, update_at=datetime(2024, 1, 1, 12, 0, 0), change_seq=3)))
+        self.assertNotEqual(tag, contact_etag(Contact(id=1, update_at=datetime(2024, 1, 1, 12, 0, 1), change_seq=3)))
+        self.assertNotEqual(tag, contact_etag(Contact(id=2, update_at=datetime(2024, 1, 1, 12, 0, 0), change_seq=3)))
+        # two writes within one second share update_at but not the change sequence
+        self.assertNotEqual(tag, contact_etag(Contact(id=1, update_at=datetime(2024, 1, 1, 12, 0, 0), change_seq=4)))
+
+    def test_collection_etag(self):
+        tag = collection_etag(1, 3, 0, 100, None, "id")
+        self.assertNotEqual(tag, collection_etag(1, 4, 0, 100, None, "id"))
+        self.assertNotEqual(tag, collection_etag(2, 3, 0, 100, None, "id"))
+        self.assertNotEqual(tag, collection_etag(1, 3, 0, 10, None, "id"))
+
+    def test_none_match(self):
+        tag = contact_etag(self.contact)
+        self.assertFalse(none_match(None, tag))
+        self.assertTrue(none_match(tag, tag))
+        self.assertTrue(none_match(f'"other", W/{tag}', tag))
+        self.assertTrue(none_match("*", tag))
+        self.assertFalse(none_match('"other"', tag))
+
+    def test_match(self):
+        tag = contact_etag(self.contact)
+        self.assertTrue(match(None, tag))
+        self.assertTrue(match(tag, tag))
+        self.assertTrue(match("*", tag))
+        # compressed responses carry the weak form of the tag
+        self.assertTrue(match(f"W/{tag}", tag))
+        self.assertFalse(match('W/"other"', tag))
+        self.assertFalse(match('"other"', tag))
+        self.assertFalse(match("*", None))
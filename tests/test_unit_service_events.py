@@ -0,0 +1,83 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from redis.exceptions import RedisError
+
+from src.services.events import ContactEvents, format_sse
+
+
+class TestContactEvents(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.events = ContactEvents(queue_size=2)
+        self.event = {"type": "updated", "ids": [1], "version": 3}
+
+    async def test_publish(self):
+        redis = AsyncMock()
+        self.events.init(redis)
+        await self.events.publish(1, [self.event])
+        redis.publish.assert_called_once_with('contacts:events:1', json.dumps([self.event]))
+
+    async def test_publish_without_redis(self):
+        await self.events.publish(1, [self.event])
+
+    async def test_publish_redis_error(self):
+        redis = AsyncMock()
+        redis.publish.side_effect = RedisError("down")
+        self.events.init(redis)
+        await self.events.publish(1, [self.event])
+
+    async def test_dispatch(self):
+        queue = await self.events.subscribe(1)
+        other = await self.events.subscribe(2)
+        self.events.dispatch(1, [self.event])
+        self.assertEqual(queue.get_nowait(), [self.event])
+        self.assertTrue(other.empty())
+
+    async def test_dispatch_overflow_resync(self):
+        queue = await self.events.subscribe(1)
+        for _ in range(3):
+            self.events.dispatch(1, [self.event])
+        self.assertEqual(queue.get_nowait(), [{"type": "resync"}])
+        self.assertTrue(queue.empty())
+
+    async def test_one_channel_subscription_per_user(self):
+        pubsub = MagicMock()
+        pubsub.subscribe = AsyncMock()
+        pubsub.unsubscribe = AsyncMock()
+        pubsub.aclose = AsyncMock()
+        pubsub.get_message = AsyncMock(return_value=None)
+        redis = MagicMock()
+        redis.pubsub.return_value = pubsub
+        self.events.init(redis)
+        first = await self.events.subscribe(1)
+        second = await self.events.subscribe(1)
+        pubsub.subscribe.assert_called_once_with('contacts:events:1')
+        await self.events.unsubscribe(1, first)
+        pubsub.unsubscribe.assert_not_called()
+        await self.events.unsubscribe(1, second)
+        pubsub.unsubscribe.assert_called_once_with('contacts:events:1')
+        await self.events.close()
+
+    async def test_reader_dispatches_messages(self):
+        message = {"type": "message", "channel": b'contacts:events:1', "data": json.dumps([self.event])}
+        pubsub = MagicMock()
+        pubsub.subscribe = AsyncMock()
+        pubsub.aclose = AsyncMock()
+        pubsub.get_message = AsyncMock(side_effect=[message] + [None] * 100)
+        redis = MagicMock()
+        redis.pubsub.return_value = pubsub
+        self.events.init(redis)
+        queue = await self.events.subscribe(1)
+        self.assertEqual(await asyncio.wait_for(queue.get(), 1), [self.event])
+        await self.events.close()
+
+
+class TestFormatSse(unittest.TestCase):
+
+    def test_format_sse(self):
+        text = format_sse([{"type": "deleted", "ids": [2], "version": 5}, {"type": "resync"}])
+        self.assertEqual(text, 'event: deleted\nid: 5\ndata: {"type": "deleted", "ids": [2], "version": 5}\n\n'
+                               'event: resync\ndata: {"type": "resync"}\n\n')
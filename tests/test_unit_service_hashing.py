@@ -0,0 +1,32 @@
+import asyncio
+import unittest
+
+from fastapi import HTTPException
+
+from src.services.hashing import PasswordHasher
+
+
+class TestPasswordHasher(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.hasher = PasswordHasher(executor="thread", max_workers=2, max_pending=2)
+
+    def tearDown(self) -> None:
+        self.hasher.shutdown()
+
+    async def test_hash_and_verify(self):
+        hashed = await self.hasher.hash('12345678')
+        self.assertNotEqual(hashed, '12345678')
+        self.assertTrue(await self.hasher.verify('12345678', hashed))
+        self.assertFalse(await self.hasher.verify('87654321', hashed))
+
+    async def test_saturated(self):
+        tasks = [asyncio.create_task(self.hasher.hash('12345678')) for _ in range(3)]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        rejected = [r for r in results if isinstance(r, HTTPException)]
+        self.assertEqual(len(rejected), 1)
+        self.assertEqual(rejected[0].status_code, 503)
+
+    def test_unknown_executor(self):
+        with self.assertRaises(ValueError):
+            PasswordHasher(executor="fiber")
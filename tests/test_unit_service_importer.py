@@ -0,0 +1,114 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import User
+from src.services import importer
+
+
+async def chunks(*parts: bytes):
+    for part in parts:
+        yield part
+
+
+class TestImporter(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.session = AsyncMock(spec=AsyncSession)
+        self.user = User(id=1)
+
+    async def test_csv_rows_split_across_chunks(self):
+        body = ('﻿first_name,last_name,email,phone,birthday,other_information\n'
+                'John,Doe,j@j.com,1,2000-01-01,"line one\nline two"\n'
+                'Jane,Doe,jane@j.com,2,2000-01-02,\n'
+                'broken,row\n').encode()
+        stream = chunks(body[:20], body[20:70], body[70:71], body[71:])
+        rows = [row async for row in importer.iter_rows(stream, "csv")]
+        self.assertEqual(rows[0], (1, {"first_name": "John", "last_name": "Doe", "email": "j@j.com", "phone": "1",
+                                       "birthday": "2000-01-01", "other_information": "line one\nline two"}))
+        self.assertIsNone(rows[1][1]["other_information"])
+        self.assertIsInstance(rows[2][1], importer.RowError)
+
+    async def test_unbalanced_quote_stops_at_the_record_limit(self):
+        received = []
+
+        async def upload():
+            yield b'first_name,last_name\nJohn,Doe\n"Jane,Doe\n'
+            for i in range(1000):
+                received.append(i)
+                yield b"Ann,Lee\n" * 16
+
+        rows = [row async for row in importer.iter_rows(upload(), "csv", max_record_size=1024)]
+        self.assertEqual(rows[0], (1, {"first_name": "John", "last_name": "Doe"}))
+        self.assertEqual(rows[1][0], 2)
+        self.assertEqual(str(rows[1][1]), "Unterminated quoted field")
+        self.assertEqual(len(rows), 2)
+        self.assertLess(len(received), 10)
+
+        rows = [row async for row in importer.iter_rows(chunks(b'a,b\n1,2\n3,"4\n5,6\n'), "csv")]
+        self.assertEqual(rows, [(1, {"a": "1", "b": "2"}), (2, rows[1][1])])
+        self.assertEqual(str(rows[1][1]), "Unterminated quoted field")
+
+    async def test_scan_is_incremental(self):
+        text = 'a,"b\n""c"\n"d\ne",f\ng,h'
+        end, quoted = 0, False
+        scanned = 0
+        for stop in range(1, len(text) + 1):
+            prefix, quoted = importer._scan_csv_records(text[:stop], scanned, quoted)
+            end = prefix or end
+            scanned = stop
+        self.assertEqual(end, text.rindex("\n") + 1)
+        self.assertFalse(quoted)
+
+    async def test_csv_errors_are_row_errors(self):
+        body = b"first_name,last_name\n" + b"x" * 200000 + b",Doe\nJane,Doe\n"
+        rows = [row async for row in importer.iter_rows(chunks(body[:1000], body[1000:]), "csv")]
+        self.assertIsInstance(rows[0][1], importer.RowError)
+        self.assertIn("field larger than field limit", str(rows[0][1]))
+        self.assertEqual(rows[1], (2, {"first_name": "Jane", "last_name": "Doe"}))
+
+        with self.assertRaises(ValueError):
+            [row async for row in importer.iter_rows(chunks(b"x" * 200000 + b",b\n1,2\n"), "csv")]
+
+        rows = [row async for row in importer.iter_rows(chunks(b'{"a": 1}\n', b'\xff\n'), "ndjson")]
+        self.assertEqual(rows[0], (1, {"a": 1}))
+        self.assertIn("Invalid UTF-8", str(rows[1][1]))
+
+    async def test_ndjson_rows(self):
+        stream = chunks(b'{"first_name": "John"}\n\n[1]\n{bad', b' json}\n{"first_name": "Jane"}')
+        rows = [row async for row in importer.iter_rows(stream, "ndjson")]
+        self.assertEqual(rows[0], (1, {"first_name": "John"}))
+        self.assertIsInstance(rows[1][1], importer.RowError)
+        self.assertIsInstance(rows[2][1], importer.RowError)
+        self.assertEqual(rows[3], (4, {"first_name": "Jane"}))
+
+    async def test_import_contacts(self):
+        patcher = patch.object(importer.repository_contacts, "create_contacts", AsyncMock())
+        create_contacts = patcher.start()
+        self.addCleanup(patcher.stop)
+        create_contacts.side_effect = [IntegrityError("INSERT", {}, Exception("duplicate")), [1], IntegrityError(
+            "INSERT", {}, Exception("duplicate")), [3]]
+        body = (b'{"first_name": "A", "last_name": "B", "email": "a@b.com", "phone": "1", "birthday": "2000-01-01"}\n'
+                b'{"first_name": "A"}\n'
+                b'{"first_name": "C", "last_name": "D", "email": "a@b.com", "phone": "1", "birthday": "2000-01-01"}\n'
+                b'{"first_name": "E", "last_name": "F", "email": "e@f.com", "phone": "1", "birthday": "2000-01-01"}\n')
+        report = await importer.import_contacts(chunks(body), "ndjson", self.user, self.session, batch_size=10)
+        self.assertEqual(report["created"], 2)
+        self.assertEqual(report["failed"], 2)
+        self.assertEqual([error["row"] for error in report["errors"]], [2, 3])
+        self.assertIn("last_name", report["errors"][0]["detail"])
+        self.assertEqual(create_contacts.await_count, 4)
+
+    async def test_nul_characters_are_row_errors(self):
+        patcher = patch.object(importer.repository_contacts, "create_contacts", AsyncMock())
+        create_contacts = patcher.start()
+        self.addCleanup(patcher.stop)
+        body = (b"first_name,last_name,email,phone,birthday\n"
+                b"A\x00,B,a@b.com,1,2000-01-01\n"
+                b"C,D,c@d.com,1,2000-01-01\n")
+        report = await importer.import_contacts(chunks(body), "csv", self.user, self.session)
+        self.assertEqual(report["created"], 1)
+        self.assertEqual(report["errors"], [{"row": 1, "detail": "NUL character in a field"}])
+        self.assertEqual(len(create_contacts.await_args.args[0]), 1)
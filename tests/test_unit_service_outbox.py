@@ -0,0 +1,117 @@
+import time
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from src.services.email import Mailer
+from src.services.outbox import EmailOutbox, EmailWorker
+from tests.conftest import Inbox, free_port, smtp_config
+
+fakeredis = pytest.importorskip("fakeredis")
+controller = pytest.importorskip("aiosmtpd.controller")
+
+
+class TestEmailOutbox(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.inbox = Inbox()
+        cls.smtp = controller.Controller(cls.inbox, hostname="127.0.0.1", port=free_port())
+        cls.smtp.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.smtp.stop()
+
+    async def asyncSetUp(self):
+        self.inbox.messages.clear()
+        self.redis = fakeredis.aioredis.FakeRedis()
+        self.outbox = EmailOutbox("email:outbox", dedup_window=60)
+        self.outbox.init(self.redis)
+        self.mailer = Mailer(smtp_config(self.smtp.port))
+        self.patch = patch("src.services.email.mailer", self.mailer)
+        self.patch.start()
+
+    async def asyncTearDown(self):
+        self.patch.stop()
+        await self.mailer.close()
+        await self.redis.aclose()
+
+    async def _work(self, worker: EmailWorker, rounds: int = 10) -> None:
+        for _ in range(rounds):
+            await worker.run_once()
+            await worker.drain()
+
+    async def test_queued_emails_are_sent_by_the_worker(self):
+        worker = EmailWorker(self.redis, "email:outbox", block_ms=0)
+        await worker.setup()
+        self.assertTrue(await self.outbox.enqueue("confirm", "deadpool@example.com", "deadpool", "http://test/"))
+        self.assertTrue(await self.outbox.enqueue("reset", "deadpool@example.com", "deadpool", "http://test/"))
+        self.assertFalse(await self.outbox.enqueue("confirm", "deadpool@example.com", "deadpool", "http://test/"))
+        self.assertEqual(len(self.inbox.messages), 0)
+
+        await self._work(worker, rounds=1)
+        self.assertEqual(sorted(message.rcpt_tos[0] for message in self.inbox.messages), ["deadpool@example.com"] * 2)
+        self.assertEqual(worker.sent, 2)
+        self.assertEqual(await self.redis.xlen("email:outbox"), 0)
+        self.assertEqual(await self.redis.xpending("email:outbox", "email-workers"),
+                         {"pending": 0, "min": None, "max": None, "consumers": []})
+
+    async def test_failed_jobs_are_retried_then_dead_lettered(self):
+        deliver = AsyncMock(side_effect=[ConnectionError("down"), None])
+        worker = EmailWorker(self.redis, "email:outbox", block_ms=0, backoff=0, deliver=deliver)
+        await worker.setup()
+        await self.outbox.enqueue("confirm", "deadpool@example.com", "deadpool", "http://test/")
+        await self._work(worker, rounds=3)
+        self.assertEqual(deliver.await_count, 2)
+        self.assertEqual(deliver.await_args.args[0]["attempts"], "1")
+        self.assertEqual(worker.sent, 1)
+
+        deliver = AsyncMock(side_effect=ConnectionError("down"))
+        worker = EmailWorker(self.redis, "email:outbox", block_ms=0, backoff=0, max_attempts=3, deliver=deliver)
+        await self.outbox.enqueue("update", "deadpool@example.com", "deadpool", "http://test/")
+        await self._work(worker)
+        self.assertEqual(deliver.await_count, 3)
+        self.assertEqual(worker.failed, 1)
+        dead = await self.redis.xrange("email:outbox:dead")
+        self.assertEqual(dead[0][1][b"error"], b"down")
+        self.assertEqual(await self.redis.zcard("email:outbox:retry"), 0)
+
+    async def test_jobs_of_a_crashed_worker_are_claimed_and_sent_once(self):
+        await self.outbox.enqueue("confirm", "deadpool@example.com", "deadpool", "http://test/")
+        crashed = EmailWorker(self.redis, "email:outbox", consumer="crashed", block_ms=0)
+        await crashed.setup()
+        await self.redis.xreadgroup("email-workers", "crashed", {"email:outbox": ">"})
+
+        deliver = AsyncMock()
+        worker = EmailWorker(self.redis, "email:outbox", consumer="alive", block_ms=0, claim_idle=0, deliver=deliver)
+        await self._work(worker, rounds=2)
+        self.assertEqual(deliver.await_count, 1)
+
+        # a job sent already, queued again by the stream, is not sent twice
+        job = deliver.await_args.args[0]
+        await self.redis.xadd("email:outbox", job)
+        await self._work(worker, rounds=1)
+        self.assertEqual(deliver.await_count, 1)
+
+    async def test_without_redis_the_email_is_sent_right_away(self):
+        outbox = EmailOutbox("email:outbox", dedup_window=60)
+        self.assertTrue(await outbox.enqueue("confirm", "deadpool@example.com", "deadpool", "http://test/"))
+        self.assertEqual(len(self.inbox.messages), 1)
+        with self.assertRaises(ValueError):
+            await outbox.enqueue("unknown", "deadpool@example.com", "deadpool", "http://test/")
+
+    async def test_sustained_throughput(self):
+        count = 200
+        worker = EmailWorker(self.redis, "email:outbox", block_ms=0, concurrency=10)
+        await worker.setup()
+        for index in range(count):
+            await self.outbox.enqueue("update", f"user{index}@example.com", "user", "http://test/")
+        started = time.perf_counter()
+        while worker.sent < count:
+            await worker.run_once()
+        await worker.drain()
+        elapsed = time.perf_counter() - started
+        print(f"\n{count} emails in {elapsed:.2f}s, {count / elapsed:.1f} emails/s")
+        self.assertEqual(len(self.inbox.messages), count)
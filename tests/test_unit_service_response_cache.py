@@ -0,0 +1,42 @@
+import unittest
+from unittest.mock import AsyncMock
+
+from redis.exceptions import RedisError
+
+from src.services.response_cache import ResponseCache
+
+
+class TestResponseCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.cache = ResponseCache(ttl=60, max_bytes=100)
+
+    async def test_disabled_without_redis(self):
+        self.assertFalse(self.cache.enabled)
+        await self.cache.set('key', '"tag"', b'[]')
+        self.assertIsNone(await self.cache.get('key'))
+
+    def test_key_depends_on_version(self):
+        key = self.cache.key(1, 3, "list", 0, 100)
+        self.assertTrue(key.startswith('contacts:1:3:'))
+        self.assertNotEqual(key, self.cache.key(1, 4, "list", 0, 100))
+        self.assertNotEqual(key, self.cache.key(1, 3, "list", 0, 10))
+
+    async def test_set_get(self):
+        redis = AsyncMock()
+        self.cache.init(redis)
+        await self.cache.set('key', '"tag"', b'[{"id": 1}]')
+        redis.set.assert_called_once_with('key', b'"tag"\n[{"id": 1}]', ex=60)
+        redis.get.return_value = redis.set.call_args.args[1]
+        self.assertEqual(await self.cache.get('key'), ('"tag"', b'[{"id": 1}]'))
+
+    async def test_large_body_not_cached(self):
+        self.cache.init(AsyncMock())
+        await self.cache.set('key', '"tag"', b'x' * 101)
+        self.cache.redis.set.assert_not_called()
+
+    async def test_redis_error_is_miss(self):
+        redis = AsyncMock()
+        redis.get.side_effect = RedisError("down")
+        self.cache.init(redis)
+        self.assertIsNone(await self.cache.get('key'))
@@ -0,0 +1,33 @@
+import json
+import unittest
+from datetime import datetime
+
+from src.database.models import Contact
+from src.services.serialization import dump_contact, dump_contacts, dump_page
+
+
+class TestSerialization(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.contacts = [Contact(id=i, first_name="Jon", last_name="Snow", email=f"jon{i}@example.com",
+                                 phone="123456789", birthday=datetime(2000, 1, i), other_information=None,
+                                 done=bool(i % 2), created_at=datetime(2024, 1, 1, 12, 0, 0), update_at=None,
+                                 user_id=1)
+                         for i in range(1, 4)]
+
+    def test_dump_contact_trusted_matches_validated(self):
+        body = dump_contact(self.contacts[0], trusted=True)
+        self.assertIsInstance(body, bytes)
+        self.assertEqual(json.loads(body), json.loads(dump_contact(self.contacts[0], trusted=False)))
+        self.assertEqual(json.loads(body)["birthday"], "2000-01-01T00:00:00")
+
+    def test_dump_contacts_trusted_matches_validated(self):
+        body = dump_contacts(self.contacts, trusted=True)
+        self.assertEqual(json.loads(body), json.loads(dump_contacts(self.contacts, trusted=False)))
+        self.assertEqual([item["id"] for item in json.loads(body)], [1, 2, 3])
+        self.assertEqual(dump_contacts([], trusted=True), b"[]")
+
+    def test_dump_page_trusted_matches_validated(self):
+        body = dump_page(self.contacts, "cursor", trusted=True)
+        self.assertEqual(json.loads(body), json.loads(dump_page(self.contacts, "cursor", trusted=False)))
+        self.assertIsNone(json.loads(dump_page([], None, trusted=True))["next_cursor"])